@@ -1,8 +1,16 @@
 import os
-import uvicorn
+import sys
+import asyncio
 import json
+import logging
+
+# Installed before anything heavy is imported so every import below is timed
+from utils.startup_profile import startup_profiler
+if "--profile-startup" in sys.argv:
+    startup_profiler.install()
+
+import uvicorn
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 
 from db_manager import DatabaseManager
@@ -10,22 +18,69 @@ from utils.template_generation import generate_default_templates
 from dotenv import load_dotenv
 
 # Import route modules
-from routes import templates, colors, styles, stickers, fonts, photos, videos, settings
-from routes.stickers import generate_thumbnail
+from routes import templates, colors, styles, stickers, fonts, photos, videos, settings, admin
+from utils.asset_sync import asset_sync
+from utils.retention import retention_manager
+from utils.lazy import preload
+from utils.static_files import CachedStaticFiles, ApiGZipMiddleware, precompress_static
+from utils.app_shell import app_shell
+from utils.video_composition import shutdown_render_pool, render_pool_queue_depth
+from utils.metrics import metrics, MetricsMiddleware
+from utils.profiling import ProfilingMiddleware
+from utils.logging_config import configure_logging, RequestContextMiddleware
+from utils.admission import admission, get_admission_limits, AdmissionMiddleware
+from utils.state_backend import create_state_backend, ProgressMap
+from utils.session_manager import session_manager
+from utils.sticker_atlas import sticker_atlas
+from utils.layout_catalog import layout_catalog
+from utils.common import threads_in_flight
+from utils.workers import set_worker_count
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # --- Global Configuration ---
 CONFIG_FILE = 'config.json'
 PORT = 8000
-
+# Import rembg and MoviePy in the background once the server is up, instead
+# of on the first background removal or video
+PRELOAD_MODULES = True
+PRELOAD_DELAY_SECONDS = 2.0
+# Rebuild the in-memory app shell when frontend files change
+DEV_MODE = False
+# Record stage timings and request latencies and serve them at /metrics
+METRICS_ENABLED = False
+# Level, format ("text" or "json") and per-module levels for the log output
+LOGGING_CONFIG = {}
+# Worker processes serving requests. More than one needs state shared
+# between them, so the state backend then defaults to SQLite
+WORKERS = 1
+STATE_BACKEND = None
+# Long enough for the startup writers on a cold start; a worker that dies
+# holding the lock frees it after this
+STARTUP_LOCK_LEASE_SECONDS = 10 * 60
+
+config_error = None
 if os.path.exists(CONFIG_FILE):
     try:
         with open(CONFIG_FILE, 'r') as f:
             config = json.load(f)
             PORT = config.get('port', 8000)
+            PRELOAD_MODULES = config.get('preload_modules', True)
+            DEV_MODE = config.get('dev_mode', False)
+            METRICS_ENABLED = config.get('metrics', False)
+            LOGGING_CONFIG = config.get('logging', {})
+            WORKERS = max(1, int(config.get('workers', 1)))
+            STATE_BACKEND = config.get('state_backend')
     except Exception as e:
-        print(f"Error loading config.json: {e}. Using default port {PORT}")
+        config_error = e
+
+configure_logging(LOGGING_CONFIG)
+set_worker_count(WORKERS)
+STATE_BACKEND = STATE_BACKEND or ("sqlite" if WORKERS > 1 else "memory")
+if config_error:
+    logger.error("Error loading config.json: %s. Using default port %s", config_error, PORT)
 
 DATABASE = 'photobooth.db'
 UPLOAD_DIR = "static/uploads"
@@ -35,15 +90,13 @@ RESULTS_DIR = "static/results"
 GENERATED_TEMPLATES_DIR = "static/generated_templates"
 VIDEOS_DIR = "static/videos"
 
-# Global dictionary to track video composition progress
-video_progress = {}  # {session_id: progress_percentage}
-
 
 # --- Lifespan Management (Startup/Shutdown) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.db_manager = DatabaseManager(DATABASE)
-    app.state.db_manager.init_db()
+    with startup_profiler.phase("init_db"):
+        app.state.db_manager = DatabaseManager(DATABASE)
+        app.state.db_manager.init_db()
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     os.makedirs(STICKERS_DIR, exist_ok=True)
     os.makedirs(FONTS_DIR, exist_ok=True)
@@ -51,75 +104,113 @@ async def lifespan(app: FastAPI):
     os.makedirs(GENERATED_TEMPLATES_DIR, exist_ok=True)
     os.makedirs(VIDEOS_DIR, exist_ok=True)
 
-    # --- Sync Stickers with DB ---
     db_manager = app.state.db_manager
-    
-    generate_default_templates(db_manager, GENERATED_TEMPLATES_DIR)
-
-    existing_stickers = {s['sticker_path'] for s in db_manager.get_all_stickers()}
-
-    for root, dirs, files in os.walk(STICKERS_DIR):
-        for filename in files:
-            # Skip thumbnail files themselves
-            if filename.endswith('_thumb.png') or root.endswith('thumbnails'):
-                continue
-                
-            cat = root.replace('\\', '/')
-            sticker_path = f"/{cat}/{filename}"
-            if sticker_path not in existing_stickers:
-                category = os.path.basename(root) if root != STICKERS_DIR else None
-                # Generate thumbnail for new sticker
-                file_path = sticker_path[1:]  # Remove leading slash
-                thumbnail_path = generate_thumbnail(file_path)
-                db_manager.add_sticker(sticker_path, category, thumbnail_path)
-                print(f"Added new sticker to DB: {sticker_path} with category: {category}")
-    
-    # Generate missing thumbnails for existing stickers
-    all_stickers = db_manager.get_all_stickers()
-    for sticker in all_stickers:
-        if not sticker.get('thumbnail_path'):
-            file_path = sticker['sticker_path'][1:]  # Remove leading slash
-            if os.path.exists(file_path):
-                thumbnail_path = generate_thumbnail(file_path)
-                if thumbnail_path:
-                    db_manager.update_sticker_thumbnail(sticker['id'], thumbnail_path)
-                    print(f"Generated thumbnail for existing sticker: {sticker['sticker_path']}")
-
-    # --- Sync Fonts with DB ---
-    existing_fonts = {f['font_path'] for f in db_manager.get_all_fonts()}
-    for filename in os.listdir(FONTS_DIR):
-        font_path = f"/{FONTS_DIR}/{filename}"
-        if font_path not in existing_fonts:
-            font_name = os.path.splitext(filename)[0]
-            db_manager.add_font(font_name, font_path)
-            print(f"Added new font to DB: {font_name}")
-
-    populate_default_colors(db_manager)
-    db_manager.populate_default_filter_presets()
+
+    # Progress, locks and cache versions go through the state backend, so
+    # they hold across worker processes
+    app.state.state_backend = create_state_backend(STATE_BACKEND, db_manager)
+    session_manager.state_backend = app.state.state_backend
+    retention_manager.state_backend = app.state.state_backend
+    asset_sync.state_backend = app.state.state_backend
+    layout_catalog.state_backend = app.state.state_backend
+    # {session_id: progress_percentage}
+    app.state.video_progress = ProgressMap(app.state.state_backend)
+
+    # Startup writers touch shared files and tables, so workers starting
+    # together take turns; a later one finds everything up to date
+    async with app.state.state_backend.lock("startup", timeout=STARTUP_LOCK_LEASE_SECONDS,
+                                            lease=STARTUP_LOCK_LEASE_SECONDS):
+        with startup_profiler.phase("generate_default_templates"):
+            generate_default_templates(db_manager, GENERATED_TEMPLATES_DIR)
+
+        with startup_profiler.phase("precompress_static"):
+            precompress_static("static")
+
+        with startup_profiler.phase("default colors & presets"):
+            populate_default_colors(db_manager)
+            db_manager.populate_default_filter_presets()
+
+    # --- Sync Stickers & Fonts with DB ---
+    # Runs in the background; only files changed since the last sync are processed
+    with startup_profiler.phase("asset_sync.start"):
+        asset_sync.start(db_manager)
+
+    # Ages out old results, uploads and temp files in the background
+    retention_manager.start(db_manager)
+
+    with startup_profiler.phase("app_shell"):
+        app_shell.dev_mode = DEV_MODE
+        app_shell.build()
+
+    admission.configure(*get_admission_limits(db_manager))
+
+    metrics.enabled = METRICS_ENABLED
+    if METRICS_ENABLED:
+        register_runtime_gauges(db_manager)
 
     # Load initial theme from DB, default to 'light'
     app.state.current_theme = db_manager.get_setting('theme', 'light')
     
-    # Make video_progress accessible to routes
-    app.state.video_progress = video_progress
     
-    print(f"Initial theme loaded: {app.state.current_theme}")
+    logger.info("Initial theme loaded: %s", app.state.current_theme)
+    startup_profiler.report()
+
+    if PRELOAD_MODULES:
+        # Delayed so the imports don't compete with binding the socket
+        asyncio.get_running_loop().call_later(PRELOAD_DELAY_SECONDS, preload)
 
     yield
 
+    asset_sync.stop()
+    retention_manager.stop()
+    shutdown_render_pool()
+    db_manager.close()
+
 
 # --- App Initialization ---
 app = FastAPI(lifespan=lifespan)
 
 
+def register_runtime_gauges(db_manager):
+    """Cache sizes and executor backlogs, read whenever /metrics is scraped."""
+    cache_entries = metrics.gauge("photobooth_cache_entries", "Entries held by in-memory caches", ["cache"])
+    cache_entries.set_function(sticker_atlas.cache_size, cache="sticker_atlas")
+    cache_entries.set_function(lambda: len(photos.SESSIONS), cache="rembg_sessions")
+    cache_bytes = metrics.gauge("photobooth_cache_bytes", "Size of cached response bodies", ["cache"])
+    cache_bytes.set_function(layout_catalog.cache_bytes, cache="layout_catalog")
+    cache_bytes.set_function(app_shell.cache_bytes, cache="app_shell")
+    queue_depth = metrics.gauge(
+        "photobooth_executor_queue_depth", "Work items submitted to an executor and not finished", ["executor"]
+    )
+    queue_depth.set_function(db_manager.aio.queue_depth, executor="db")
+    queue_depth.set_function(render_pool_queue_depth, executor="render_pool")
+    queue_depth.set_function(threads_in_flight, executor="to_thread")
+    admission_queued = metrics.gauge("photobooth_admission_queued", "Requests waiting for an admission slot", ["lane"])
+    admission_active = metrics.gauge("photobooth_admission_active", "Requests holding an admission slot", ["lane"])
+    for lane in admission.lanes:
+        admission_queued.set_function(lambda lane=lane: admission.lanes[lane].waiting, lane=lane)
+        admission_active.set_function(lambda lane=lane: admission.lanes[lane].active, lane=lane)
+
+
 def populate_default_colors(db_manager):
     default_colors = ['#FFFFFF', '#000000', '#FFDDC1', '#FFABAB', '#FFC3A0', '#B5EAD7', '#C7CEEA']
-    for color in default_colors:
-        db_manager.add_color(color)
+    db_manager.add_colors(default_colors)
 
 
 # --- Static Files ---
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Long-lived caching for write-once paths, ETag revalidation for the rest
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
+
+# Compress larger API responses; static text assets are precompressed at startup
+app.add_middleware(ApiGZipMiddleware, minimum_size=1024)
+# Opt-in cProfile/tracemalloc captures of single compose requests
+app.add_middleware(ProfilingMiddleware)
+# Bounded, prioritized queues in front of the expensive endpoints
+app.add_middleware(AdmissionMiddleware)
+# Added last so it wraps everything, compression included
+app.add_middleware(MetricsMiddleware)
+# Outermost, so the request ID is set for every log line of the request
+app.add_middleware(RequestContextMiddleware)
 
 
 # --- Include Routers ---
@@ -131,8 +222,9 @@ app.include_router(stickers.router, tags=["stickers"])
 app.include_router(fonts.router, tags=["fonts"])
 app.include_router(photos.router, tags=["photos"])
 app.include_router(videos.router, tags=["videos"])
+app.include_router(admin.router, tags=["admin"])
 
 
 # --- Main Entry Point ---
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=PORT, reload=False)
\ No newline at end of file
+    uvicorn.run("app:app", host="0.0.0.0", port=PORT, reload=False, workers=WORKERS)
\ No newline at end of file
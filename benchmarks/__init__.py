@@ -0,0 +1,2 @@
+# Benchmark scripts, run as modules from the project root, e.g.
+#   python -m benchmarks.video_filters
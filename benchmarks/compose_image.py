@@ -0,0 +1,296 @@
+"""Time the still-image compose pipeline, stage by stage and end to end.
+
+Builds synthetic fixtures (a generated template scaled to each canvas size,
+webcam-sized photos, an alpha sticker and a text layer) and runs the same
+steps compose_image does, timing decode, background removal, filters,
+resize/rotate, blending, stickers, text and encode separately. The whole
+/compose_image request is then timed through TestClient against a scratch
+copy of the app.
+
+Background removal uses a stub that feathers an ellipse instead of running
+the model, so the timings cover the compositing around rembg but not
+inference; pass --real-rembg to include it.
+
+    python -m benchmarks.compose_image --scales 1 2 3 --output results.json
+    python -m benchmarks.compose_image --baseline results.json --threshold 0.15
+"""
+import io
+import sys
+import json
+import time
+import argparse
+import statistics
+import contextlib
+import cv2
+import numpy as np
+from PIL import Image
+from benchmarks.fixtures import make_template, make_photo, make_sticker, scratch_app
+
+STAGES = ["decode", "rembg", "filters", "resize_rotate", "blend", "stickers", "draw_texts", "encode"]
+FILTER_PRESET = {"brightness": 110, "contrast": 120, "saturate": 80, "warmth": 110, "sharpness": 0, "blur": 0, "grain": 15}
+BACKGROUND_COLOR = "#3366cc"
+STICKER_PATH = "static/stickers/bench_sticker.png"
+STICKERS_PER_CANVAS = 6
+
+
+def stub_remove_background(photo_bytes):
+    """Stand-in for rembg.remove: the photo as a PNG with a feathered ellipse of alpha."""
+    image = Image.open(io.BytesIO(photo_bytes)).convert("RGB")
+    w, h = image.size
+    mask = np.zeros((h, w), np.uint8)
+    cv2.ellipse(mask, (w // 2, h // 2), (w // 3, h // 2 - 10), 0, 0, 360, 255, -1)
+    mask = cv2.GaussianBlur(mask, (31, 31), 0)
+    image.putalpha(Image.fromarray(mask))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def build_case(rng, scale, font_name):
+    """Inputs for one compose at a given canvas scale."""
+    template, holes = make_template(scale=scale)
+    ok, template_png = cv2.imencode(".png", template)
+    height, width = template.shape[:2]
+    size = int(120 * scale)
+    stickers = [
+        {"id": i, "path": f"/{STICKER_PATH}", "x": int(rng.integers(0, width - size)),
+         "y": int(rng.integers(0, height - size)), "width": size, "height": size,
+         "rotation": float(rng.uniform(-30, 30))}
+        for i in range(STICKERS_PER_CANVAS)
+    ]
+    texts = []
+    if font_name:
+        texts.append({
+            "id": STICKERS_PER_CANVAS, "text": "Benchmark\nBooth", "font": font_name,
+            "fontSize": int(48 * scale), "x": int(40 * scale), "y": height - int(160 * scale),
+            "width": int(400 * scale), "height": int(130 * scale), "justify": "center",
+            "color": "#222222", "rotation": 5,
+        })
+    return {
+        "canvas": f"{width}x{height}",
+        "template_png": template_png.tobytes(),
+        "holes": holes,
+        "photos": [make_photo(rng) for _ in holes],
+        "transformations": [{"scale": 1.1, "rotation": float(rng.uniform(-5, 5))} for _ in holes],
+        "stickers": stickers,
+        "texts": texts,
+    }
+
+
+class StageTimer:
+    """Accumulates wall time per stage over one compose."""
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+
+def run_stages(case, db_manager, remove_background):
+    """Run the compose_image steps in order and return seconds per stage."""
+    from utils.filters import apply_filters
+    from utils.drawing import draw_texts
+    from utils.image_processing import rotate_image
+
+    timer = StageTimer()
+    with timer.stage("decode"):
+        template_img = cv2.imdecode(np.frombuffer(case["template_png"], np.uint8), cv2.IMREAD_UNCHANGED)
+        height, width = template_img.shape[:2]
+        canvas = np.full((height, width, 3), 255, np.uint8)
+
+    rgb = tuple(int(BACKGROUND_COLOR[i:i + 2], 16) for i in (1, 3, 5)) + (255,)
+    for photo_bytes, hole, transform in zip(case["photos"], case["holes"], case["transformations"]):
+        with timer.stage("rembg"):
+            foreground = Image.open(io.BytesIO(remove_background(photo_bytes))).convert("RGBA")
+            background = Image.new("RGBA", foreground.size, rgb)
+            background.paste(foreground, (0, 0), foreground)
+            photo_img = np.array(background.convert("RGB"))[:, :, ::-1].copy()
+
+        with timer.stage("filters"):
+            photo_img = apply_filters(photo_img, FILTER_PRESET)
+
+        with timer.stage("resize_rotate"):
+            new_w = int(hole['w'] * transform['scale'])
+            new_h = int(hole['h'] * transform['scale'])
+            h_orig, w_orig = photo_img.shape[:2]
+            interpolation = cv2.INTER_AREA if new_w < w_orig or new_h < h_orig else cv2.INTER_LANCZOS4
+            rotated = rotate_image(cv2.resize(photo_img, (new_w, new_h), interpolation=interpolation), -transform['rotation'])
+
+        with timer.stage("blend"):
+            r_h, r_w = rotated.shape[:2]
+            pos_x = hole['x'] + (hole['w'] - r_w) // 2
+            pos_y = hole['y'] + (hole['h'] - r_h) // 2
+            x1, y1 = max(pos_x, 0), max(pos_y, 0)
+            x2, y2 = min(pos_x + r_w, width), min(pos_y + r_h, height)
+            canvas[y1:y2, x1:x2] = rotated[y1 - pos_y:y2 - pos_y, x1 - pos_x:x2 - pos_x]
+
+    with timer.stage("blend"):
+        alpha = template_img[:, :, 3] / 255.0
+        alpha_mask = np.dstack((alpha, alpha, alpha))
+        composite = ((template_img[:, :, :3] * alpha_mask) + (canvas * (1 - alpha_mask))).astype(np.uint8)
+        final_image = cv2.cvtColor(composite, cv2.COLOR_BGR2BGRA)
+
+    with timer.stage("stickers"):
+        with open(STICKER_PATH, "rb") as f:
+            sticker_bytes = f.read()
+        for sticker in case["stickers"]:
+            sticker_img = cv2.imdecode(np.frombuffer(sticker_bytes, np.uint8), cv2.IMREAD_UNCHANGED)
+            rotated = rotate_image(cv2.resize(sticker_img, (sticker['width'], sticker['height'])), -sticker['rotation'])
+            s_h, s_w = rotated.shape[:2]
+            pos_x = sticker['x'] - (s_w - sticker['width']) // 2
+            pos_y = sticker['y'] - (s_h - sticker['height']) // 2
+            x1, y1 = max(pos_x, 0), max(pos_y, 0)
+            x2, y2 = min(pos_x + s_w, width), min(pos_y + s_h, height)
+            clipped = rotated[y1 - pos_y:y2 - pos_y, x1 - pos_x:x2 - pos_x]
+            sticker_alpha = clipped[:, :, 3] / 255.0
+            mask = np.dstack((sticker_alpha,) * 4)
+            roi = final_image[y1:y2, x1:x2]
+            final_image[y1:y2, x1:x2] = (clipped * mask) + (roi * (1 - mask))
+
+    with timer.stage("draw_texts"):
+        if case["texts"]:
+            final_image = draw_texts(final_image, case["texts"], db_manager)
+
+    with timer.stage("encode"):
+        cv2.imencode(".png", final_image)
+
+    return timer.seconds
+
+
+def run_endpoint(client, case, real_rembg):
+    """Post one compose_image request and return its wall time in seconds."""
+    data = {
+        "holes": json.dumps(case["holes"]),
+        "stickers": json.dumps(case["stickers"]),
+        "texts": json.dumps(case["texts"]),
+        "filters": json.dumps(FILTER_PRESET),
+        "transformations": json.dumps(case["transformations"]),
+    }
+    if real_rembg:
+        # The stub cannot be injected into the route, so without --real-rembg
+        # the request skips background removal
+        data["background_colors"] = json.dumps([BACKGROUND_COLOR] * len(case["holes"]))
+    files = [("photos", (f"photo_{i}.jpg", photo, "image/jpeg")) for i, photo in enumerate(case["photos"])]
+    files.append(("template_file", ("template.png", case["template_png"], "image/png")))
+
+    start = time.perf_counter()
+    response = client.post("/compose_image", data=data, files=files)
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"compose_image returned {response.status_code}: {response.text[:200]}")
+    return elapsed
+
+
+def summarize(samples):
+    return {"median_ms": statistics.median(samples) * 1000, "min_ms": min(samples) * 1000}
+
+
+def find_regressions(results, baseline, threshold):
+    """List (scale, metric, baseline ms, current ms) for medians slower by more than threshold."""
+    regressions = []
+    for scale, current in results.items():
+        previous = baseline.get(scale)
+        if not previous:
+            continue
+        metrics = {f"stage:{name}": value for name, value in current["stages"].items()}
+        metrics["total"] = current["total"]
+        metrics["endpoint"] = current["endpoint"]
+        previous_metrics = {f"stage:{name}": value for name, value in previous["stages"].items()}
+        previous_metrics["total"] = previous["total"]
+        previous_metrics["endpoint"] = previous["endpoint"]
+        for metric, value in metrics.items():
+            before = previous_metrics.get(metric)
+            # Sub-millisecond stages are mostly noise
+            if before and before["median_ms"] >= 1 and value["median_ms"] > before["median_ms"] * (1 + threshold):
+                regressions.append((scale, metric, before["median_ms"], value["median_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 2, 3], help="Canvas scale factors of the 2x2 template")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per scale, after one warm-up")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--font", help="TrueType font for the text layer, defaults to the first one found")
+    parser.add_argument("--real-rembg", action="store_true", help="Run the background removal model instead of the stub")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a JSON file from an earlier --output")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before a median counts as a regression")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    with scratch_app(args.font) as (app, font_name):
+        with TestClient(app.app) as client:
+            db_manager = app.app.state.db_manager
+            with open(STICKER_PATH, "wb") as f:
+                f.write(make_sticker(rng))
+            if font_name:
+                db_manager.add_font(font_name, f"/static/fonts/{font_name}.ttf")
+            else:
+                print("No TrueType font found, skipping the text layer (use --font)")
+
+            if args.real_rembg:
+                from routes.photos import rembg, get_session
+                remove_background = lambda data: rembg.remove(data, session=get_session("u2net_human_seg"))
+            else:
+                remove_background = stub_remove_background
+
+            for scale in args.scales:
+                case = build_case(rng, scale, font_name)
+                run_stages(case, db_manager, remove_background)
+                run_endpoint(client, case, args.real_rembg)
+
+                stage_samples = {name: [] for name in STAGES}
+                totals, endpoint = [], []
+                for _ in range(args.repeat):
+                    seconds = run_stages(case, db_manager, remove_background)
+                    for name, value in seconds.items():
+                        stage_samples[name].append(value)
+                    totals.append(sum(seconds.values()))
+                    endpoint.append(run_endpoint(client, case, args.real_rembg))
+
+                results[f"scale_{scale:g}"] = {
+                    "canvas": case["canvas"],
+                    "stages": {name: summarize(samples) for name, samples in stage_samples.items()},
+                    "total": summarize(totals),
+                    "endpoint": summarize(endpoint),
+                }
+
+    for scale, result in results.items():
+        print(f"{scale} ({result['canvas']})")
+        for name, value in result["stages"].items():
+            print(f"  {name:<14} {value['median_ms']:9.1f} ms  (min {value['min_ms']:.1f})")
+        print(f"  {'stages total':<14} {result['total']['median_ms']:9.1f} ms")
+        print(f"  {'endpoint':<14} {result['endpoint']['median_ms']:9.1f} ms")
+
+    report = {
+        "benchmark": "compose_image",
+        "config": {"repeat": args.repeat, "seed": args.seed, "real_rembg": args.real_rembg, "text": bool(font_name)},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold:.0%}:")
+            for scale, metric, before, after in regressions:
+                print(f"  {scale} {metric}: {before:.1f} ms -> {after:.1f} ms (+{after / before - 1:.0%})")
+            sys.exit(1)
+        print(f"No regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Benchmark the video compose pipeline on synthetic clips.
+
+For every combination of source size, duration and container, generates a
+deterministic lavfi testsrc clip and composes it into every hole of a 2x2
+template with a static sticker, an animated WebP sticker and a text layer,
+the way compose_video does. Reports wall time per stage (probe/spec, clip
+graph build, encode), output frames per second, peak RSS of the Python
+process and of its ffmpeg children, and the output size.
+
+Each case runs in a fresh process so peak RSS is per case, against a
+scratch copy of the app so the real database and results are untouched.
+
+    python -m benchmarks.compose_video --sizes 640x480 1280x720 --durations 4 --containers mp4 webm
+    python -m benchmarks.compose_video --segments 3 --endpoint --output video.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from benchmarks.fixtures import make_template, make_sticker, make_animated_sticker, make_test_clip, scratch_app
+
+FILTER_PRESET = {"brightness": 110, "contrast": 120, "saturate": 80, "warmth": 110, "sharpness": 0, "blur": 0, "grain": 15}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its reaped children, in MB."""
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    return round(own, 1), round(children, 1)
+
+
+def write_fixtures(rng, size, duration, container, font_name):
+    """Write the template, clip and stickers into the scratch static tree.
+
+    Returns:
+        Dictionary of paths and layer descriptions for the case
+    """
+    template, holes = make_template()
+    template_path = os.path.join("static", "uploads", "bench_template.png")
+    cv2.imwrite(template_path, template)
+    clip_path = make_test_clip(os.path.join("static", "videos", f"bench_{size}_{duration}.{container}"), size, duration)
+    static_sticker = os.path.join("static", "stickers", "bench_static.png")
+    with open(static_sticker, "wb") as f:
+        f.write(make_sticker(rng))
+    animated_sticker = make_animated_sticker(os.path.join("static", "stickers", "bench_animated.webp"), rng)
+
+    height, width = template.shape[:2]
+    stickers = [
+        {"id": 1, "path": f"/{static_sticker}", "x": 60, "y": 60, "width": 180, "height": 180, "rotation": 15},
+        {"id": 2, "path": f"/{animated_sticker}", "x": width - 260, "y": height - 400, "width": 160, "height": 160, "rotation": -10},
+    ]
+    texts = []
+    if font_name:
+        texts.append({
+            "id": 3, "text": "Benchmark\nBooth", "font": font_name, "fontSize": 48,
+            "x": 40, "y": height - 160, "width": 400, "height": 130, "justify": "center",
+            "color": "#222222", "rotation": 5,
+        })
+    return {
+        "template_path": template_path,
+        "clip_path": clip_path,
+        "holes": holes,
+        "transformations": [{"scale": 1.1, "rotation": r} for r in (-3, 2, 4, -1)][:len(holes)],
+        "stickers": stickers,
+        "texts": texts,
+    }
+
+
+def post_compose_video(client, fixtures):
+    """Run the whole /compose_video request and return its wall time in seconds."""
+    data = {
+        "holes": json.dumps(fixtures["holes"]),
+        "video_paths": [f"/{fixtures['clip_path']}"] * len(fixtures["holes"]),
+        "stickers": json.dumps(fixtures["stickers"]),
+        "texts": json.dumps(fixtures["texts"]),
+        "transformations": json.dumps(fixtures["transformations"]),
+        "filters": json.dumps(FILTER_PRESET),
+    }
+    with open(fixtures["template_path"], "rb") as f:
+        files = [("template_file", ("template.png", f.read(), "image/png"))]
+    start = time.perf_counter()
+    response = client.post("/compose_video", data=data, files=files)
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"compose_video returned {response.status_code}: {response.text[:200]}")
+    return elapsed
+
+
+def run_case(size, duration, container, options):
+    """Compose one synthetic case and measure it. Runs in its own process."""
+    from fastapi.testclient import TestClient
+
+    with scratch_app(options["font"]) as (app, font_name):
+        from utils.retention import retention_manager
+        from utils.video_composition import (
+            build_composition_spec, build_composite_clip, close_clips, count_frames, render_composition
+        )
+        from utils.video_processing import get_encode_profile, write_clip_with_profile
+
+        rng = np.random.default_rng(options["seed"])
+        result = {"size": size, "duration": duration, "container": container, "stages_s": {}}
+        with TestClient(app.app) as client:
+            db_manager = app.app.state.db_manager
+            if font_name:
+                db_manager.add_font(font_name, f"/static/fonts/{font_name}.ttf")
+            db_manager.set_setting("video_render_segments", str(options["segments"]))
+            fixtures = write_fixtures(rng, size, duration, container, font_name)
+            profile = get_encode_profile(db_manager, options["profile"])
+
+            decorations = []
+            for sticker in fixtures["stickers"]:
+                decorations.append({**sticker, "type": "sticker", "full_path": os.path.abspath(sticker["path"].lstrip("/"))})
+            for text in fixtures["texts"]:
+                decorations.append({**text, "type": "text"})
+            decorations.sort(key=lambda deco: deco["id"])
+
+            output_path = os.path.join("static", "results", "bench_serial.mp4")
+            with retention_manager.job_temp_dir("bench") as temp_dir:
+                start = time.perf_counter()
+                spec = build_composition_spec(
+                    os.path.abspath(fixtures["template_path"]),
+                    [os.path.abspath(fixtures["clip_path"])] * len(fixtures["holes"]),
+                    fixtures["holes"], fixtures["transformations"], decorations,
+                    False, db_manager.db_path, filters=FILTER_PRESET
+                )
+                result["stages_s"]["spec"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                final_clip, sources = build_composite_clip(spec, db_manager, temp_dir=temp_dir)
+                result["stages_s"]["build"] = time.perf_counter() - start
+                try:
+                    start = time.perf_counter()
+                    write_clip_with_profile(final_clip, output_path, profile)
+                    result["stages_s"]["encode"] = time.perf_counter() - start
+                finally:
+                    close_clips(sources)
+
+                frames = count_frames(spec["duration"], profile.get("fps", 24))
+                result["frames"] = frames
+                result["fps"] = frames / result["stages_s"]["encode"]
+                result["wall_s"] = sum(result["stages_s"].values())
+                result["output_bytes"] = os.path.getsize(output_path)
+
+                if options["segments"] > 1:
+                    segmented_path = os.path.join("static", "results", "bench_segmented.mp4")
+                    start = time.perf_counter()
+                    render_composition(spec, profile, segmented_path, db_manager,
+                                       segments=options["segments"], temp_dir=temp_dir)
+                    result["segmented_s"] = time.perf_counter() - start
+                    result["segmented_fps"] = frames / result["segmented_s"]
+
+            if options["endpoint"]:
+                try:
+                    result["endpoint_s"] = post_compose_video(client, fixtures)
+                except Exception as e:
+                    # The route validates clips with ffprobe from PATH
+                    result["endpoint_error"] = str(e)
+
+        result["peak_rss_mb"], result["peak_child_rss_mb"] = peak_rss_mb()
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1280x720"], help="Source clip sizes, WxH")
+    parser.add_argument("--durations", type=float, nargs="+", default=[4], help="Source clip lengths in seconds")
+    parser.add_argument("--containers", nargs="+", default=["mp4", "webm"], choices=["mp4", "webm"])
+    parser.add_argument("--profile", default="share", help="Encode profile to render with")
+    parser.add_argument("--segments", type=int, default=1, help="Also time a segmented render with this many segments")
+    parser.add_argument("--endpoint", action="store_true", help="Also time the whole /compose_video request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--font", help="TrueType font for the text layer, defaults to the first one found")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    options = {"profile": args.profile, "segments": args.segments, "endpoint": args.endpoint,
+               "seed": args.seed, "font": args.font}
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size, duration, container in itertools.product(args.sizes, args.durations, args.containers):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(run_case, size, duration, container, options).result())
+
+    print(f"{'case':<22} {'spec':>7} {'build':>7} {'encode':>8} {'fps':>7} {'rss MB':>7} {'ffmpeg MB':>9} {'output':>9}")
+    for r in results:
+        case = f"{r['size']} {r['duration']:g}s {r['container']}"
+        stages = r["stages_s"]
+        print(f"{case:<22} {stages['spec']:6.2f}s {stages['build']:6.2f}s {stages['encode']:7.2f}s "
+              f"{r['fps']:7.1f} {r['peak_rss_mb'] or 0:7.0f} {r['peak_child_rss_mb'] or 0:9.0f} "
+              f"{r['output_bytes'] / 1024:7.0f}KB")
+        if "segmented_s" in r:
+            print(f"{'':<22} segmented x{args.segments}: {r['segmented_s']:.2f}s ({r['segmented_fps']:.1f} fps)")
+        if "endpoint_s" in r:
+            print(f"{'':<22} /compose_video: {r['endpoint_s']:.2f}s")
+        elif "endpoint_error" in r:
+            print(f"{'':<22} /compose_video failed: {r['endpoint_error']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "compose_video", "config": options, "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare query throughput of per-query connections vs persistent ones.
+
+Builds a scratch database with a realistic number of stickers, fonts and
+templates, then times the hot lookups with a DatabaseManager that opens a
+new connection per query (the previous behaviour) and with the current
+persistent, WAL-mode connections.
+
+    python -m benchmarks.db_queries --iterations 2000
+"""
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+from db_manager import DatabaseManager
+
+
+class PerQueryConnectionManager(DatabaseManager):
+    """DatabaseManager that opens a fresh connection for every query."""
+    def _get_connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+def populate(db_manager, stickers=2000, fonts=40):
+    db_manager.init_db()
+    db_manager.add_stickers(
+        (f"/static/stickers/cat{i % 20}/sticker_{i}.png", f"cat{i % 20}", None) for i in range(stickers)
+    )
+    db_manager.add_fonts((f"font_{i}", f"/static/fonts/font_{i}.ttf") for i in range(fonts))
+    for i in range(12):
+        db_manager.add_template(f"/t{i}.png", 4, [], "4:3", f"1x{i}", [], is_default=True)
+    db_manager.set_setting("theme", "light")
+
+
+def time_queries(db_manager, iterations):
+    queries = {
+        "get_setting": lambda: db_manager.get_setting("theme"),
+        "get_font_by_name": lambda: db_manager.get_font_by_name("font_7"),
+        "get_template_by_layout": lambda: db_manager.get_template_by_layout("4:3", "1x3"),
+        "get_all_stickers": lambda: db_manager.get_all_stickers(),
+        "add_color": lambda: db_manager.add_color("#123456"),
+    }
+    results = {}
+    for name, query in queries.items():
+        # Fewer rounds for the full sticker listing, it returns thousands of rows
+        rounds = iterations // 20 if name == "get_all_stickers" else iterations
+        start = time.perf_counter()
+        for _ in range(rounds):
+            query()
+        results[name] = rounds / (time.perf_counter() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000, help="Queries per lookup")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        persistent = DatabaseManager(db_path)
+        populate(persistent)
+
+        before = time_queries(PerQueryConnectionManager(db_path), args.iterations)
+        after = time_queries(persistent, args.iterations)
+        persistent.close()
+
+    print(f"{'query':<24} {'per-query conn':>16} {'persistent':>12} {'speedup':>8}")
+    for name in before:
+        print(f"{name:<24} {before[name]:>12.0f} q/s {after[name]:>8.0f} q/s {after[name] / before[name]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
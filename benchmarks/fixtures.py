@@ -0,0 +1,155 @@
+"""Synthetic inputs shared by the benchmarks.
+
+Everything is generated from a seed, so two runs of a benchmark see the
+same pixels. scratch_app() runs the FastAPI app against a throwaway working
+directory, so end-to-end benchmarks never touch the real database or
+static/results.
+"""
+import os
+import io
+import sys
+import glob
+import shutil
+import tempfile
+import contextlib
+import subprocess
+import cv2
+import numpy as np
+from PIL import Image
+from utils.template_generation import TEMPLATE_CONFIGS, create_template_image
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Read-only parts of the tree that the app needs to start
+SHARED_PATHS = ["templates", "static/js", "static/css", "static/components", "static/icons", "static/img"]
+FONT_SEARCH_PATHS = [
+    os.path.join(PROJECT_ROOT, "static", "fonts"),
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    "/Library/Fonts",
+    "C:\\Windows\\Fonts",
+]
+BENCH_FONT_NAME = "BenchFont"
+
+
+def make_template(layout="2x2", aspect_ratio="4:5", type_name="typeA", scale=1.0):
+    """Build a template and its holes, optionally scaled to a larger canvas.
+
+    Returns:
+        (BGRA template array, list of hole dicts)
+    """
+    ar_w, ar_h = map(int, aspect_ratio.split(':'))
+    cols, rows = map(int, layout.split('x'))
+    template, holes = create_template_image(ar_w, ar_h, cols, rows, TEMPLATE_CONFIGS[type_name])
+    if scale != 1.0:
+        size = (int(template.shape[1] * scale), int(template.shape[0] * scale))
+        template = cv2.resize(template, size, interpolation=cv2.INTER_NEAREST)
+        holes = [{key: int(value * scale) for key, value in hole.items()} for hole in holes]
+    return template, holes
+
+
+def make_photo(rng, size=(1280, 720)):
+    """A noisy gradient photo as JPEG bytes, like a webcam capture."""
+    w, h = size
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    base = np.dstack([np.broadcast_to(x, (h, w)), np.broadcast_to(y, (h, w)), np.full((h, w), 128, np.float32)])
+    noisy = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    ok, encoded = cv2.imencode(".jpg", noisy, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def make_sticker(rng, size=(256, 256)):
+    """An RGBA sticker with a soft-edged disc of alpha, as PNG bytes."""
+    w, h = size
+    yy, xx = np.mgrid[0:h, 0:w]
+    distance = np.hypot((xx - w / 2) / (w / 2), (yy - h / 2) / (h / 2))
+    alpha = np.clip((1.0 - distance) * 4, 0, 1) * 255
+    color = rng.integers(0, 256, 3)
+    rgba = np.dstack([np.full((h, w), c, np.uint8) for c in color] + [alpha.astype(np.uint8)])
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def make_animated_sticker(path, rng, size=(160, 160), frames=12, duration_ms=80):
+    """Write an animated WebP sticker of a disc sliding across the frame."""
+    w, h = size
+    r = w // 4
+    color = tuple(int(c) for c in rng.integers(0, 256, 3)) + (255,)
+    images = []
+    for i in range(frames):
+        cx = r + (w - 2 * r) * i // max(frames - 1, 1)
+        frame = np.zeros((h, w, 4), np.uint8)
+        cv2.circle(frame, (cx, h // 2), r, color, -1, lineType=cv2.LINE_AA)
+        images.append(Image.fromarray(frame, "RGBA"))
+    images[0].save(path, "WEBP", save_all=True, append_images=images[1:], duration=duration_ms, loop=0)
+    return path
+
+
+def make_test_clip(path, size, duration, fps=30):
+    """Render a deterministic lavfi testsrc clip; .webm gives VP8, anything else H.264."""
+    from moviepy.config import get_setting
+    if path.endswith(".webm"):
+        codec = ["-c:v", "libvpx", "-b:v", "2M", "-deadline", "realtime", "-cpu-used", "8"]
+    else:
+        codec = ["-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p"]
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=size={size}:rate={fps}",
+        "-t", str(duration), *codec, path,
+    ]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+def find_font(preferred=None):
+    """Path of a TrueType font to draw text with, or None if there is none."""
+    if preferred:
+        return preferred
+    for root in FONT_SEARCH_PATHS:
+        fonts = sorted(glob.glob(os.path.join(root, "**", "*.ttf"), recursive=True))
+        if fonts:
+            return fonts[0]
+    return None
+
+
+@contextlib.contextmanager
+def scratch_app(font_path=None):
+    """Import the app inside a throwaway working directory and yield it.
+
+    The frontend and templates are linked from the project, a font is
+    copied to static/fonts for text layers, and the database, results and
+    uploads all live in the scratch directory, which is removed afterwards.
+    Background preloading is turned off so it does not skew timings.
+
+    Args:
+        font_path: TrueType font to use instead of the first one found
+
+    Yields:
+        (app module, font name or None)
+    """
+    previous_cwd = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix="photobooth_bench_")
+    try:
+        for relative in SHARED_PATHS:
+            source = os.path.join(PROJECT_ROOT, relative)
+            if os.path.exists(source):
+                target = os.path.join(scratch, relative)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.symlink(source, target, target_is_directory=True)
+        font_name = None
+        font_path = find_font(font_path)
+        if font_path:
+            os.makedirs(os.path.join(scratch, "static", "fonts"), exist_ok=True)
+            shutil.copy(font_path, os.path.join(scratch, "static", "fonts", f"{BENCH_FONT_NAME}.ttf"))
+            font_name = BENCH_FONT_NAME
+
+        os.chdir(scratch)
+        if PROJECT_ROOT not in sys.path:
+            sys.path.insert(0, PROJECT_ROOT)
+        import app
+        app.PRELOAD_MODULES = False
+        yield app, font_name
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
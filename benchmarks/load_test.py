@@ -0,0 +1,263 @@
+"""Replay booth sessions against a running server to find where it saturates.
+
+Each simulated session does what a booth does for one customer: load the
+menu (/layouts, /stickers, /fonts), preview a filter, compose the photo
+strip, upload one clip per hole, compose the video while polling its
+progress. Sessions arrive as a Poisson process at each offered rate, with
+at most --booths of them in flight, as with that many physical booths.
+For every rate the run reports per-endpoint latency percentiles and error
+rates; the saturation point is the first rate the server cannot keep up
+with (throughput falls behind, errors appear or session p95 breaks --slo).
+
+Start the server first, then:
+
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --booths 4 --rates 0.02 0.05 0.1 --duration 120
+    python -m benchmarks.load_test --no-video --rates 0.5 1 2 4 --output load.json
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import httpx
+import numpy as np
+from benchmarks.fixtures import make_photo, make_test_clip
+
+FILTER_PRESET = {"brightness": 110, "contrast": 120, "saturate": 80, "warmth": 110, "sharpness": 0, "blur": 0, "grain": 15}
+PERCENTILES = (50, 90, 95, 99)
+# A rate counts as sustained while completed sessions keep up with this share of arrivals
+MIN_THROUGHPUT_RATIO = 0.9
+MAX_ERROR_RATE = 0.01
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class Recorder:
+    """Latency samples and failures per endpoint for one load level."""
+    def __init__(self):
+        self.samples = {}  # endpoint -> [seconds]
+        self.errors = {}  # endpoint -> count
+        self.sessions = []  # session wall times, successful sessions only
+        self.failed_sessions = 0
+
+    def record(self, endpoint, seconds, ok):
+        self.samples.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            endpoints[endpoint] = {
+                "count": len(samples),
+                "error_rate": self.errors.get(endpoint, 0) / len(samples),
+                **{f"p{p}_ms": percentile(ordered, p) * 1000 for p in PERCENTILES},
+                "max_ms": ordered[-1] * 1000,
+            }
+        sessions = sorted(self.sessions)
+        return {
+            "sessions": len(sessions),
+            "failed_sessions": self.failed_sessions,
+            "session_p50_s": percentile(sessions, 50),
+            "session_p95_s": percentile(sessions, 95),
+            "endpoints": endpoints,
+        }
+
+
+async def timed_request(client, recorder, endpoint, method, url, **kwargs):
+    """Send one request, record its latency under `endpoint` and return the response."""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError:
+        recorder.record(endpoint, time.perf_counter() - start, False)
+        raise
+    ok = response.status_code < 400
+    recorder.record(endpoint, time.perf_counter() - start, ok)
+    if not ok:
+        raise httpx.HTTPStatusError(f"{endpoint} returned {response.status_code}", request=response.request, response=response)
+    return response
+
+
+async def booth_session(client, recorder, fixtures, rng, options):
+    """One customer at a booth, from menu to video QR code."""
+    response = await timed_request(client, recorder, "GET /layouts", "GET", "/layouts")
+    layouts = response.json()
+    await timed_request(client, recorder, "GET /stickers", "GET", "/stickers")
+    await timed_request(client, recorder, "GET /fonts", "GET", "/fonts")
+
+    layout = rng.choice(layouts)
+    holes = layout["holes"]
+    photos = [fixtures["photo"]] * len(holes)
+
+    await timed_request(
+        client, recorder, "POST /apply_filters_to_image", "POST", "/apply_filters_to_image",
+        data={"filters": json.dumps(FILTER_PRESET)},
+        files={"file": ("photo_0.jpg", fixtures["photo"], "image/jpeg")},
+    )
+
+    form = {
+        "holes": json.dumps(holes),
+        "stickers": "[]",
+        "texts": "[]",
+        "filters": json.dumps(FILTER_PRESET),
+        "transformations": json.dumps(layout.get("transformations") or [{"scale": 1, "rotation": 0}] * len(holes)),
+        "template_path": layout["template_path"],
+    }
+    response = await timed_request(
+        client, recorder, "POST /compose_image", "POST", "/compose_image",
+        data=form, files=[("photos", (f"photo_{i}.jpg", photo, "image/jpeg")) for i, photo in enumerate(photos)],
+    )
+    session_id = response.json()["session_id"]
+
+    if options["video"]:
+        video_paths = []
+        for i in range(len(holes)):
+            response = await timed_request(
+                client, recorder, "POST /upload_video_chunk", "POST", "/upload_video_chunk",
+                files={"video": (f"clip_{i}.webm", fixtures["clip"], "video/webm")},
+            )
+            video_paths.append(response.json()["video_path"])
+
+        compose = asyncio.create_task(timed_request(
+            client, recorder, "POST /compose_video", "POST", "/compose_video",
+            data={**form, "video_paths": video_paths, "session_id": session_id},
+            timeout=options["video_timeout"],
+        ))
+        # The booth polls progress while the render runs
+        while not compose.done():
+            await asyncio.wait({compose}, timeout=options["poll_interval"])
+            if not compose.done():
+                try:
+                    await timed_request(client, recorder, "GET /video_progress", "GET", f"/video_progress/{session_id}")
+                except httpx.HTTPError:
+                    pass
+        await compose
+
+
+async def run_level(url, rate, options, fixtures, seed):
+    """Offer sessions at `rate` per second for the configured duration."""
+    recorder = Recorder()
+    rng = random.Random(seed)
+    booths = asyncio.Semaphore(options["booths"])
+    limits = httpx.Limits(max_connections=options["booths"] * 2)
+    timeout = httpx.Timeout(options["request_timeout"])
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def session():
+            # Waiting for a free booth counts towards the session time
+            start = time.perf_counter()
+            async with booths:
+                try:
+                    await booth_session(client, recorder, fixtures, rng, options)
+                    recorder.sessions.append(time.perf_counter() - start)
+                except (httpx.HTTPError, KeyError, ValueError):
+                    recorder.failed_sessions += 1
+
+        tasks = []
+        start = time.perf_counter()
+        deadline = start + options["duration"]
+        while True:
+            # Exponential gaps between arrivals make a Poisson process
+            arrival = time.perf_counter() + rng.expovariate(rate)
+            if arrival > deadline:
+                break
+            await asyncio.sleep(max(0, arrival - time.perf_counter()))
+            tasks.append(asyncio.create_task(session()))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    result = recorder.summary()
+    result.update({
+        "offered_rate": rate,
+        "arrivals": len(tasks),
+        "elapsed_s": elapsed,
+        "throughput": result["sessions"] / elapsed if elapsed else 0.0,
+    })
+    total_requests = sum(e["count"] for e in result["endpoints"].values())
+    total_errors = sum(e["error_rate"] * e["count"] for e in result["endpoints"].values())
+    result["error_rate"] = total_errors / total_requests if total_requests else 0.0
+    result["saturated"] = (
+        result["sessions"] < len(tasks) * MIN_THROUGHPUT_RATIO
+        or result["error_rate"] > MAX_ERROR_RATE
+        or (options["slo"] is not None and (result["session_p95_s"] or 0) > options["slo"])
+    )
+    return result
+
+
+def print_level(result):
+    print(f"\nOffered {result['offered_rate']:g} sessions/s: {result['arrivals']} arrivals, "
+          f"{result['sessions']} completed, {result['failed_sessions']} failed, "
+          f"{result['throughput']:.3f} sessions/s, errors {result['error_rate']:.1%}"
+          f"{'  SATURATED' if result['saturated'] else ''}")
+    if result["session_p50_s"] is not None:
+        print(f"  session p50 {result['session_p50_s']:.2f}s  p95 {result['session_p95_s']:.2f}s")
+    header = "".join(f"{f'p{p}':>9}" for p in PERCENTILES)
+    print(f"  {'endpoint':<30}{'count':>7}{header}{'max':>9}{'errors':>8}")
+    for endpoint, stats in result["endpoints"].items():
+        values = "".join(f"{stats[f'p{p}_ms']:>7.0f}ms" for p in PERCENTILES)
+        print(f"  {endpoint:<30}{stats['count']:>7}{values}{stats['max_ms']:>7.0f}ms{stats['error_rate']:>8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of a running server")
+    parser.add_argument("--booths", type=int, default=4, help="Maximum sessions in flight")
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.02, 0.05, 0.1], help="Offered session arrival rates per second, in increasing order")
+    parser.add_argument("--duration", type=float, default=120, help="Seconds of arrivals per rate")
+    parser.add_argument("--no-video", dest="video", action="store_false", help="Skip the clip upload and video compose")
+    parser.add_argument("--clip-size", default="640x480", help="Size of the uploaded test clip, WxH")
+    parser.add_argument("--clip-duration", type=float, default=3)
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between progress polls")
+    parser.add_argument("--request-timeout", type=float, default=60)
+    parser.add_argument("--video-timeout", type=float, default=600)
+    parser.add_argument("--slo", type=float, help="Session p95 in seconds above which a rate counts as saturated")
+    parser.add_argument("--stop-at-saturation", action="store_true", help="Skip the higher rates once one saturates")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    options = {
+        "booths": args.booths, "duration": args.duration, "video": args.video,
+        "poll_interval": args.poll_interval, "request_timeout": args.request_timeout,
+        "video_timeout": args.video_timeout, "slo": args.slo,
+    }
+    fixtures = {"photo": make_photo(np.random.default_rng(args.seed))}
+    if args.video:
+        with tempfile.TemporaryDirectory() as tmp:
+            clip_path = make_test_clip(os.path.join(tmp, "clip.webm"), args.clip_size, args.clip_duration)
+            with open(clip_path, "rb") as f:
+                fixtures["clip"] = f.read()
+
+    levels = []
+    for index, rate in enumerate(sorted(args.rates)):
+        result = asyncio.run(run_level(args.url, rate, options, fixtures, args.seed + index))
+        print_level(result)
+        levels.append(result)
+        if result["saturated"] and args.stop_at_saturation:
+            break
+
+    # A level without arrivals says nothing either way
+    sustained = [level["offered_rate"] for level in levels if level["arrivals"] and not level["saturated"]]
+    saturated = [level["offered_rate"] for level in levels if level["saturated"]]
+    print()
+    print(f"Highest sustained rate: {max(sustained):g} sessions/s" if sustained else "No rate was sustained")
+    print(f"Saturation point: {min(saturated):g} sessions/s" if saturated else "Not saturated at the rates tried")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "load_test", "config": {**options, "url": args.url, "rates": args.rates},
+                       "levels": levels}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
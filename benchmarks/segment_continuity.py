@@ -0,0 +1,122 @@
+"""Check that segmented video renders join frame-exactly.
+
+Renders a short synthetic composition twice with a lossless encode
+profile: once in a single pass and once split into time segments rendered
+in the worker pool and joined by the concat demuxer. Both outputs are
+decoded and compared frame by frame; any frame that differs, and the
+frames on either side of each segment boundary, are reported. Exits
+non-zero on a mismatch, so it can run as a check in CI.
+
+    python -m benchmarks.segment_continuity
+    python -m benchmarks.segment_continuity --segments 4 --duration 3 --size 640x480
+"""
+import os
+import sys
+import argparse
+import cv2
+import numpy as np
+from benchmarks.fixtures import make_template, make_sticker, make_test_clip, scratch_app
+
+# crf 0 makes libx264 lossless, and full-resolution chroma keeps the RGB
+# to YUV conversion identical however the frames reach the encoder
+LOSSLESS_PROFILE = {
+    "max_pixels": None,
+    "preset": "ultrafast",
+    "crf": 0,
+    "fps": 24,
+    "threads": None,
+    "pix_fmt": "yuv444p",
+    "faststart": False,
+}
+# Frames compared on each side of a boundary in the report
+BOUNDARY_WINDOW = 2
+
+
+def read_frames(path):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+    finally:
+        capture.release()
+    return frames
+
+
+def write_fixtures(rng, size, duration):
+    """Write a template, source clip and sticker into the scratch static tree."""
+    template, holes = make_template()
+    template_path = os.path.abspath(os.path.join("static", "uploads", "continuity_template.png"))
+    cv2.imwrite(template_path, template)
+    clip_path = os.path.abspath(make_test_clip(os.path.join("static", "videos", "continuity.mp4"), size, duration))
+    sticker_path = os.path.join("static", "stickers", "continuity_sticker.png")
+    with open(sticker_path, "wb") as f:
+        f.write(make_sticker(rng))
+
+    decorations = [{
+        "id": 1, "type": "sticker", "path": f"/{sticker_path}", "full_path": os.path.abspath(sticker_path),
+        "x": 40, "y": 40, "width": 200, "height": 200, "rotation": 15,
+    }]
+    transformations = [{"scale": 1, "rotation": 0}] * len(holes)
+    return template_path, [clip_path] * len(holes), holes, transformations, decorations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="640x480", help="Source clip size, WxH")
+    parser.add_argument("--duration", type=float, default=2, help="Source clip length in seconds")
+    parser.add_argument("--segments", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with scratch_app() as (app, _):
+        from fastapi.testclient import TestClient
+        from utils.retention import retention_manager
+        from utils.video_composition import (
+            build_composition_spec, count_frames, render_composition, shutdown_render_pool, split_frames
+        )
+
+        with TestClient(app.app):
+            db_manager = app.app.state.db_manager
+            rng = np.random.default_rng(args.seed)
+            template_path, clips, holes, transformations, decorations = write_fixtures(rng, args.size, args.duration)
+            spec = build_composition_spec(template_path, clips, holes, transformations, decorations,
+                                          False, db_manager.db_path)
+            total = count_frames(spec["duration"], LOSSLESS_PROFILE["fps"])
+            ranges = split_frames(total, args.segments)
+
+            serial_path = os.path.abspath(os.path.join("static", "results", "continuity_serial.mp4"))
+            segmented_path = os.path.abspath(os.path.join("static", "results", "continuity_segmented.mp4"))
+            try:
+                with retention_manager.job_temp_dir("continuity") as temp_dir:
+                    render_composition(spec, LOSSLESS_PROFILE, serial_path, db_manager, temp_dir=temp_dir)
+                    render_composition(spec, LOSSLESS_PROFILE, segmented_path, db_manager,
+                                       segments=args.segments, temp_dir=temp_dir)
+            finally:
+                shutdown_render_pool()
+
+            serial = read_frames(serial_path)
+            segmented = read_frames(segmented_path)
+
+    print(f"{total} frames expected, serial {len(serial)}, segmented {len(segmented)} "
+          f"in {len(ranges)} segments {ranges}")
+    failed = len(serial) != total or len(segmented) != total
+    mismatched = [i for i, (a, b) in enumerate(zip(serial, segmented)) if not np.array_equal(a, b)]
+    for start, _ in ranges[1:]:
+        window = range(max(0, start - BOUNDARY_WINDOW), min(len(serial), len(segmented), start + BOUNDARY_WINDOW))
+        bad = [i for i in window if i in mismatched]
+        print(f"boundary at frame {start}: frames {window.start}-{window.stop - 1} "
+              f"{'differ at ' + str(bad) if bad else 'identical'}")
+    if mismatched:
+        print(f"{len(mismatched)} frames differ, first at {mismatched[0]}")
+        failed = True
+
+    print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
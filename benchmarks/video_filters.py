@@ -0,0 +1,90 @@
+"""Measure the cost of colour filters on the video hole pipeline.
+
+Generates a synthetic clip with ffmpeg's testsrc, then pulls frames through
+the same per-hole path compose_video uses (decode -> filter -> warp) with
+and without a filter preset, and reports frames per second for each.
+
+    python -m benchmarks.video_filters --size 1280x720 --duration 5
+"""
+import os
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import moviepy.editor as mpe
+from moviepy.config import get_setting
+from utils.filters import build_frame_filter
+from utils.video_composition import VIDEO_GRAIN_FRAMES, compile_hole_warp, get_decode_resolution
+
+HOLE_SIZE = (480, 360)
+
+PRESETS = {
+    "none": None,
+    "retro": {"brightness": 110, "contrast": 120, "saturate": 80, "warmth": 110, "sharpness": 0, "blur": 0, "grain": 15},
+    "vivid": {"brightness": 100, "contrast": 110, "saturate": 150, "warmth": 100, "sharpness": 5, "blur": 0, "grain": 0},
+    "warm": {"brightness": 105, "contrast": 105, "saturate": 100, "warmth": 115, "sharpness": 0, "blur": 0, "grain": 0},
+}
+
+
+def make_test_clip(path, size, duration, fps=30):
+    """Render a deterministic test pattern clip with ffmpeg's lavfi testsrc."""
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=size={size}:rate={fps}",
+        "-t", str(duration), "-c:v", "libx264", "-pix_fmt", "yuv420p", path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def measure(path, filters, rotation=-8):
+    """Return frames per second through decode, optional filter and warp."""
+    new_w, new_h = HOLE_SIZE
+    probe = mpe.VideoFileClip(path)
+    target_resolution = get_decode_resolution(probe.size, new_w, new_h)
+    probe.close()
+
+    clip = mpe.VideoFileClip(path, target_resolution=target_resolution, resize_algorithm="area")
+    warp, _ = compile_hole_warp(clip.w, clip.h, new_w, new_h, rotation, mirror=True)
+    frame_filter = build_frame_filter(filters, channel_order='rgb', grain_frames=VIDEO_GRAIN_FRAMES) if filters else None
+
+    frames = 0
+    start = time.perf_counter()
+    for frame in clip.iter_frames():
+        if frame_filter:
+            frame = frame_filter(frame)
+        warp(frame)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    clip.close()
+    return frames / elapsed if elapsed else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1280x720", help="Source clip size, WxH")
+    parser.add_argument("--duration", type=float, default=5, help="Source clip length in seconds")
+    parser.add_argument("--output", help="Optional path for a JSON report")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clip_path = os.path.join(tmp, "testsrc.mp4")
+        make_test_clip(clip_path, args.size, args.duration)
+
+        results = {}
+        for name, filters in PRESETS.items():
+            results[name] = measure(clip_path, filters)
+
+    baseline = results["none"]
+    print(f"Source {args.size}, hole {HOLE_SIZE[0]}x{HOLE_SIZE[1]}")
+    for name, fps in results.items():
+        relative = fps / baseline if baseline else 0
+        print(f"  {name:<8} {fps:8.1f} fps  ({relative:.0%} of unfiltered)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"size": args.size, "duration": args.duration, "fps": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
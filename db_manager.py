@@ -1,93 +1,274 @@
 import sqlite3
 import json
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabaseManager:
+    """Awaitable facade over a DatabaseManager.
+
+    Every method of the wrapped manager is exposed as a coroutine that runs
+    the query on a dedicated thread pool, so disk waits don't block the
+    event loop. Each pool thread keeps its own persistent connection.
+    """
+    def __init__(self, db_manager, max_workers=4):
+        self._db_manager = db_manager
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._pending = 0  # queries submitted and not finished, only touched on the event loop
+
+    def __getattr__(self, name):
+        method = getattr(self._db_manager, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def run_in_executor(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            self._pending += 1
+            try:
+                return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+            finally:
+                self._pending -= 1
+
+        return run_in_executor
+
+    def queue_depth(self):
+        """Queries submitted to the pool that have not finished yet."""
+        return self._pending
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
 
 class DatabaseManager:
     def __init__(self, db_path):
         self.db_path = db_path
+        self._local = threading.local()
+        self._aio = None
+
+    @property
+    def aio(self):
+        """Awaitable version of this manager, for use from async route handlers."""
+        if self._aio is None:
+            self._aio = AsyncDatabaseManager(self)
+        return self._aio
 
     def _get_connection(self):
-        """Creates and returns a new database connection."""
-        conn = sqlite3.connect(self.db_path, timeout=10)
+        """Returns this thread's persistent database connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            # WAL lets readers run alongside the writer; NORMAL sync is safe with WAL
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
         return conn
 
-    def init_db(self):
-        """Initializes the database and creates the templates table if it doesn't exist."""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS templates (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    template_path TEXT NOT NULL,
-                    hole_count INTEGER NOT NULL,
-                    holes TEXT NOT NULL,
-                    aspect_ratio TEXT NOT NULL,
-                    cell_layout TEXT NOT NULL,
-                    transformations TEXT,
-                    is_default BOOLEAN DEFAULT 0
-                )
-            ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS stickers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sticker_path TEXT NOT NULL,
-                    category TEXT,
-                    thumbnail_path TEXT
-                )
-            ''')
+    def close_thread_connection(self):
+        """Closes the calling thread's connection, e.g. before a worker thread exits."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
 
-            cursor.execute("PRAGMA table_info(stickers)")
-            sticker_columns = [column[1] for column in cursor.fetchall()]
-            if 'category' not in sticker_columns:
-                cursor.execute("ALTER TABLE stickers ADD COLUMN category TEXT")
-            if 'thumbnail_path' not in sticker_columns:
-                cursor.execute("ALTER TABLE stickers ADD COLUMN thumbnail_path TEXT")
-
-            # Check if columns exist and add them if they don't
-            cursor.execute("PRAGMA table_info(templates)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'transformations' not in columns:
-                cursor.execute("ALTER TABLE templates ADD COLUMN transformations TEXT")
-            if 'is_default' not in columns:
-                cursor.execute("ALTER TABLE templates ADD COLUMN is_default BOOLEAN DEFAULT 0")
+    def close(self):
+        """Closes the calling thread's connection and the async facade's pool."""
+        self.close_thread_connection()
+        if self._aio is not None:
+            self._aio.shutdown()
+            self._aio = None
 
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS colors (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    hex_code TEXT NOT NULL UNIQUE
-                )
-            ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS styles (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE,
-                    prompt TEXT NOT NULL
-                )
-            ''')
+    def init_db(self):
+        """Initializes the database, applying any schema migrations not yet recorded.
+
+        The schema version is stored in SQLite's user_version, so a database that
+        is already up to date is left untouched on startup.
+        """
+        conn = self._get_connection()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target_version, migration in enumerate(self.MIGRATIONS, start=1):
+            if version >= target_version:
+                continue
+            with conn:
+                # DDL doesn't open a transaction implicitly, so do it here to keep
+                # each migration atomic. IMMEDIATE takes the write lock up front;
+                # another worker starting at the same time may have just applied it
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= target_version:
+                    continue
+                migration(self, conn.cursor())
+                # PRAGMA can't take a bound parameter; target_version is our own int
+                conn.execute(f"PRAGMA user_version = {target_version}")
+            logger.info("Applied database migration v%d", target_version)
+
+    def _migrate_v1(self, cursor):
+        """Base schema, including columns added before migrations were versioned."""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS templates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                template_path TEXT NOT NULL,
+                hole_count INTEGER NOT NULL,
+                holes TEXT NOT NULL,
+                aspect_ratio TEXT NOT NULL,
+                cell_layout TEXT NOT NULL,
+                transformations TEXT,
+                is_default BOOLEAN DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stickers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sticker_path TEXT NOT NULL,
+                category TEXT,
+                thumbnail_path TEXT
+            )
+        ''')
+
+        cursor.execute("PRAGMA table_info(stickers)")
+        sticker_columns = [column[1] for column in cursor.fetchall()]
+        if 'category' not in sticker_columns:
+            cursor.execute("ALTER TABLE stickers ADD COLUMN category TEXT")
+        if 'thumbnail_path' not in sticker_columns:
+            cursor.execute("ALTER TABLE stickers ADD COLUMN thumbnail_path TEXT")
+
+        # Check if columns exist and add them if they don't
+        cursor.execute("PRAGMA table_info(templates)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'transformations' not in columns:
+            cursor.execute("ALTER TABLE templates ADD COLUMN transformations TEXT")
+        if 'is_default' not in columns:
+            cursor.execute("ALTER TABLE templates ADD COLUMN is_default BOOLEAN DEFAULT 0")
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS colors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hex_code TEXT NOT NULL UNIQUE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS styles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                prompt TEXT NOT NULL
+            )
+        ''')
 
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS fonts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    font_name TEXT NOT NULL UNIQUE,
-                    font_path TEXT NOT NULL
-                )
-            ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fonts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                font_name TEXT NOT NULL UNIQUE,
+                font_path TEXT NOT NULL
+            )
+        ''')
 
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS filter_presets (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE,
-                    filter_values TEXT NOT NULL
-                )
-            ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS filter_presets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                filter_values TEXT NOT NULL
+            )
+        ''')
 
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
-                )
-            ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
+    def _migrate_v2(self, cursor):
+        """Indexes for layout lookups and unique sticker paths."""
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_templates_layout "
+            "ON templates (aspect_ratio, cell_layout, is_default)"
+        )
+        # Older syncs could insert the same sticker twice; keep the first row
+        cursor.execute(
+            "DELETE FROM stickers WHERE id NOT IN "
+            "(SELECT MIN(id) FROM stickers GROUP BY sticker_path)"
+        )
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_stickers_path ON stickers (sticker_path)"
+        )
+
+    def _migrate_v3(self, cursor):
+        """Manifest of synced asset files, so startup only reprocesses changes."""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS asset_manifest (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                hash TEXT NOT NULL
+            )
+        ''')
+
+    def _migrate_v4(self, cursor):
+        """Index for per-category sticker pages."""
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stickers_category ON stickers (category, id)"
+        )
+
+    def _migrate_v5(self, cursor):
+        """2x thumbnails and animated previews for stickers."""
+        cursor.execute("ALTER TABLE stickers ADD COLUMN thumbnail_2x_path TEXT")
+        cursor.execute("ALTER TABLE stickers ADD COLUMN preview_path TEXT")
+
+    def _migrate_v6(self, cursor):
+        """Reference counts for content-addressed upload blobs."""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_blobs_last_used ON blobs (last_used)")
+
+    def _migrate_v7(self, cursor):
+        """Shared state and leased locks, so several worker processes can cooperate."""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_state_expires_at ON state (expires_at)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+
+    def _migrate_v8(self, cursor):
+        """Finished compositions by spec hash, so identical compose requests reuse the result."""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS compose_results (
+                spec_hash TEXT PRIMARY KEY,
+                result_path TEXT NOT NULL,
+                qr_code_path TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_compose_results_result_path ON compose_results (result_path)")
 
-            conn.commit()
+    # Applied in order; the position in this list is the schema version
+    MIGRATIONS = [_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4, _migrate_v5, _migrate_v6, _migrate_v7, _migrate_v8]
 
     def add_filter_preset(self, name, filter_values):
         """Adds a new filter preset to the database."""
@@ -130,16 +311,10 @@ class DatabaseManager:
 
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            for preset in default_presets:
-                try:
-                    values_json = json.dumps(preset["values"])
-                    cursor.execute(
-                        "INSERT INTO filter_presets (name, filter_values) VALUES (?, ?)",
-                        (preset["name"], values_json)
-                    )
-                except sqlite3.IntegrityError:
-                    # Preset with the same name already exists, ignore.
-                    pass
+            cursor.executemany(
+                "INSERT OR IGNORE INTO filter_presets (name, filter_values) VALUES (?, ?)",
+                [(preset["name"], json.dumps(preset["values"])) for preset in default_presets]
+            )
             conn.commit()
 
     def update_filter_preset(self, preset_id, name, filter_values):
@@ -161,7 +336,7 @@ class DatabaseManager:
                 cursor.execute("DELETE FROM filter_presets WHERE id = ?", (preset_id,))
                 conn.commit()
         except Exception as e:
-            print(f"Error deleting filter preset from database: {e}")
+            logger.error("Error deleting filter preset from database: %s", e)
 
 
     def add_template(self, template_path, hole_count, holes, aspect_ratio, cell_layout, transformations, is_default=False):
@@ -176,16 +351,21 @@ class DatabaseManager:
             )
             conn.commit()
 
+    def add_colors(self, hex_codes):
+        """Adds several colors in one transaction, ignoring duplicates."""
+        with self._get_connection() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO colors (hex_code) VALUES (?)",
+                [(hex_code,) for hex_code in hex_codes]
+            )
+            conn.commit()
+
     def add_color(self, hex_code):
         """Adds a new color to the database, ignoring duplicates."""
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            try:
-                cursor.execute("INSERT INTO colors (hex_code) VALUES (?)", (hex_code,))
-                conn.commit()
-            except sqlite3.IntegrityError:
-                # Color already exists, ignore the error
-                pass
+            cursor.execute("INSERT OR IGNORE INTO colors (hex_code) VALUES (?)", (hex_code,))
+            conn.commit()
 
     def get_all_colors(self):
         """Fetches all colors from the database."""
@@ -196,6 +376,13 @@ class DatabaseManager:
             colors = [dict(row) for row in cursor.fetchall()]
         return colors
 
+    def get_template_paths(self):
+        """Fetches the path of every template, stock and custom."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT template_path FROM templates")
+            return [row[0] for row in cursor.fetchall()]
+
     def get_layouts(self):
         """Fetches distinct layouts (aspect_ratio and cell_layout) from the database."""
         with self._get_connection() as conn:
@@ -205,6 +392,27 @@ class DatabaseManager:
             layouts = [dict(row) for row in cursor.fetchall()]
         return layouts
 
+    def get_layout_catalog(self):
+        """Fetches the first template of every distinct layout in one query."""
+        with self._get_connection() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT t.* FROM templates t
+                JOIN (
+                    SELECT MIN(id) AS id FROM templates GROUP BY aspect_ratio, cell_layout
+                ) first_template ON t.id = first_template.id
+                ORDER BY t.id
+            ''')
+            templates = [dict(row) for row in cursor.fetchall()]
+
+        for t in templates:
+            if t.get('holes'):
+                t['holes'] = json.loads(t['holes'])
+            if t.get('transformations'):
+                t['transformations'] = json.loads(t['transformations'])
+        return templates
+
     def get_template_by_layout(self, aspect_ratio, cell_layout):
         """Fetches a single template that matches the given layout."""
         with self._get_connection() as conn:
@@ -265,6 +473,53 @@ class DatabaseManager:
             stickers = [dict(row) for row in cursor.fetchall()]
         return stickers
     
+    def get_stickers(self, category=None, after_id=None, limit=None):
+        """Fetches stickers newest first, optionally filtered and paginated.
+
+        Args:
+            category: Category name, "" for uncategorized stickers, or None for all
+            after_id: Keyset cursor; only stickers with a lower id are returned
+            limit: Maximum number of rows
+
+        Returns:
+            List of sticker dicts
+        """
+        clauses, params = [], []
+        if category == "":
+            clauses.append("(category IS NULL OR category = '')")
+        elif category is not None:
+            clauses.append("category = ?")
+            params.append(category)
+        if after_id is not None:
+            clauses.append("id < ?")
+            params.append(after_id)
+        query = "SELECT * FROM stickers"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_sticker_category_covers(self):
+        """Fetches the newest sticker of each category, used as the category icon."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT s.* FROM stickers s
+                JOIN (
+                    SELECT MAX(id) AS id FROM stickers
+                    WHERE category IS NOT NULL AND category != ''
+                    GROUP BY category
+                ) newest ON newest.id = s.id
+                ORDER BY s.category
+            ''')
+            return [dict(row) for row in cursor.fetchall()]
+
     def update_sticker_thumbnail(self, sticker_id, thumbnail_path):
         """Updates the thumbnail path for a sticker."""
         with self._get_connection() as conn:
@@ -275,13 +530,152 @@ class DatabaseManager:
             )
             conn.commit()
 
-    def add_sticker(self, sticker_path, category=None, thumbnail_path=None):
-        """Adds a new sticker record to the database."""
+    def add_sticker(self, sticker_path, category=None, thumbnail_path=None, thumbnail_2x_path=None, preview_path=None):
+        """Adds a new sticker record to the database, ignoring duplicate paths."""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "INSERT INTO stickers (sticker_path, category, thumbnail_path) VALUES (?, ?, ?)",
-                (sticker_path, category, thumbnail_path)
+                "INSERT OR IGNORE INTO stickers (sticker_path, category, thumbnail_path, thumbnail_2x_path, preview_path) VALUES (?, ?, ?, ?, ?)",
+                (sticker_path, category, thumbnail_path, thumbnail_2x_path, preview_path)
+            )
+            conn.commit()
+
+    def add_stickers(self, stickers):
+        """Adds several stickers in one transaction, ignoring duplicate paths.
+
+        Args:
+            stickers: Iterable of (sticker_path, category, thumbnail_path) tuples
+
+        Returns:
+            Number of stickers actually inserted
+        """
+        with self._get_connection() as conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO stickers (sticker_path, category, thumbnail_path) VALUES (?, ?, ?)",
+                list(stickers)
+            )
+            conn.commit()
+        return cursor.rowcount
+
+    def update_sticker_thumbnails(self, thumbnails):
+        """Updates several sticker thumbnails in one transaction.
+
+        Args:
+            thumbnails: Iterable of (sticker_id, thumbnail_path, thumbnail_2x_path, preview_path) tuples
+        """
+        with self._get_connection() as conn:
+            conn.executemany(
+                "UPDATE stickers SET thumbnail_path = ?, thumbnail_2x_path = ?, preview_path = ? WHERE id = ?",
+                [(thumbnail_path, thumbnail_2x_path, preview_path, sticker_id)
+                 for sticker_id, thumbnail_path, thumbnail_2x_path, preview_path in thumbnails]
+            )
+            conn.commit()
+
+    def get_asset_manifest(self):
+        """Fetches the asset manifest as a dict of path -> (size, mtime, hash)."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT path, size, mtime, hash FROM asset_manifest")
+            return {row['path']: (row['size'], row['mtime'], row['hash']) for row in cursor.fetchall()}
+
+    def update_asset_manifest(self, entries, removed_paths=()):
+        """Records synced asset files and forgets deleted ones in one transaction.
+
+        Args:
+            entries: Iterable of (path, size, mtime, hash) tuples
+            removed_paths: Paths that no longer exist on disk
+        """
+        with self._get_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO asset_manifest (path, size, mtime, hash) VALUES (?, ?, ?, ?)",
+                list(entries)
+            )
+            conn.executemany(
+                "DELETE FROM asset_manifest WHERE path = ?",
+                [(path,) for path in removed_paths]
+            )
+            conn.commit()
+
+    def add_blob_reference(self, blob_hash, path, size, used_at):
+        """Records one more reference to a blob, creating its row on first use.
+
+        Args:
+            blob_hash: SHA-256 hex digest of the contents
+            path: Where the blob is stored
+            size: Size in bytes
+            used_at: Unix timestamp of this use
+        """
+        with self._get_connection() as conn:
+            conn.execute('''
+                INSERT INTO blobs (hash, path, size, refcount, created_at, last_used)
+                VALUES (?, ?, ?, 1, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1, last_used = excluded.last_used
+            ''', (blob_hash, path, size, used_at, used_at))
+            conn.commit()
+
+    def release_blob_references(self, blob_hashes):
+        """Drops one reference per listed hash; rows are kept at zero for the sweeper."""
+        with self._get_connection() as conn:
+            conn.executemany(
+                "UPDATE blobs SET refcount = MAX(refcount - 1, 0) WHERE hash = ?",
+                [(blob_hash,) for blob_hash in blob_hashes]
+            )
+            conn.commit()
+
+    def get_blob(self, blob_hash):
+        """Fetches a blob row by hash."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM blobs WHERE hash = ?", (blob_hash,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def get_blob_usage(self):
+        """Fetches each blob's use, as a dict of path -> (last used timestamp, refcount)."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT path, last_used, refcount FROM blobs")
+            return {row['path']: (row['last_used'], row['refcount']) for row in cursor.fetchall()}
+
+    def delete_blobs(self, blob_hashes):
+        """Forgets blobs whose files have been removed."""
+        with self._get_connection() as conn:
+            conn.executemany(
+                "DELETE FROM blobs WHERE hash = ?",
+                [(blob_hash,) for blob_hash in blob_hashes]
+            )
+            conn.commit()
+
+    def get_compose_result(self, spec_hash):
+        """Fetches the stored result of a composition spec, or None."""
+        with self._get_connection() as conn:
+            row = conn.execute("SELECT * FROM compose_results WHERE spec_hash = ?", (spec_hash,)).fetchone()
+            return dict(row) if row else None
+
+    def add_compose_result(self, spec_hash, result_path, qr_code_path, created_at):
+        """Records the result of a composition spec, replacing any earlier one."""
+        with self._get_connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO compose_results (spec_hash, result_path, qr_code_path, hits, created_at, last_used)
+                VALUES (?, ?, ?, 0, ?, ?)
+            ''', (spec_hash, result_path, qr_code_path, created_at, created_at))
+            conn.commit()
+
+    def record_compose_hit(self, spec_hash, used_at):
+        """Counts one reuse of a stored composition result."""
+        with self._get_connection() as conn:
+            conn.execute(
+                "UPDATE compose_results SET hits = hits + 1, last_used = ? WHERE spec_hash = ?",
+                (used_at, spec_hash)
+            )
+            conn.commit()
+
+    def delete_compose_results(self, result_paths):
+        """Forgets stored compositions whose result files have been removed."""
+        with self._get_connection() as conn:
+            conn.executemany(
+                "DELETE FROM compose_results WHERE result_path = ?",
+                [(path,) for path in result_paths]
             )
             conn.commit()
 
@@ -298,12 +692,8 @@ class DatabaseManager:
         """Adds a new style to the database, ignoring duplicates."""
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            try:
-                cursor.execute("INSERT INTO styles (name, prompt) VALUES (?, ?)", (name, prompt))
-                conn.commit()
-            except sqlite3.IntegrityError:
-                # Style with the same name already exists, ignore the error
-                pass
+            cursor.execute("INSERT OR IGNORE INTO styles (name, prompt) VALUES (?, ?)", (name, prompt))
+            conn.commit()
 
     def delete_style(self, style_id):
         """Deletes a style from the database."""
@@ -313,7 +703,7 @@ class DatabaseManager:
                 cursor.execute("DELETE FROM styles WHERE id = ?", (style_id,))
                 conn.commit()
         except Exception as e:
-            print(f"Error deleting style from database: {e}")
+            logger.error("Error deleting style from database: %s", e)
 
     def update_style(self, style_id, name, prompt):
         """Updates a style in the database."""
@@ -338,12 +728,25 @@ class DatabaseManager:
         """Adds a new font to the database, ignoring duplicates."""
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            try:
-                cursor.execute("INSERT INTO fonts (font_name, font_path) VALUES (?, ?)", (font_name, font_path))
-                conn.commit()
-            except sqlite3.IntegrityError:
-                # Font with the same name already exists, ignore the error
-                pass
+            cursor.execute("INSERT OR IGNORE INTO fonts (font_name, font_path) VALUES (?, ?)", (font_name, font_path))
+            conn.commit()
+
+    def add_fonts(self, fonts):
+        """Adds several fonts in one transaction, ignoring duplicates.
+
+        Args:
+            fonts: Iterable of (font_name, font_path) tuples
+
+        Returns:
+            Number of fonts actually inserted
+        """
+        with self._get_connection() as conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO fonts (font_name, font_path) VALUES (?, ?)",
+                list(fonts)
+            )
+            conn.commit()
+        return cursor.rowcount
 
     def get_font_by_name(self, font_name):
         """Fetches a font by its name."""
@@ -354,6 +757,64 @@ class DatabaseManager:
             font = cursor.fetchone()
         return dict(font) if font else None
 
+    def get_state(self, namespace, key, now):
+        """Returns a shared state value as stored (JSON text), or None if missing or expired."""
+        with self._get_connection() as conn:
+            row = conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, now)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, namespace, key, value, expires_at=None):
+        """Creates or replaces a shared state value."""
+        with self._get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, expires_at)
+            )
+            conn.commit()
+
+    def delete_state(self, namespace, key):
+        with self._get_connection() as conn:
+            conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+            conn.commit()
+
+    def purge_expired_state(self, now):
+        """Removes expired state values and lock leases; returns how many rows went."""
+        with self._get_connection() as conn:
+            removed = conn.execute("DELETE FROM state WHERE expires_at <= ?", (now,)).rowcount
+            removed += conn.execute("DELETE FROM locks WHERE expires_at <= ?", (now,)).rowcount
+            conn.commit()
+        return removed
+
+    def try_acquire_lock(self, name, owner, expires_at, now):
+        """Takes a named lock unless someone else holds an unexpired lease on it.
+
+        Args:
+            name: Lock name
+            owner: Unique token of the caller, needed to release the lock
+            expires_at: Unix timestamp when the lease lapses if never released
+            now: Current Unix timestamp
+
+        Returns:
+            True if the lock was taken
+        """
+        with self._get_connection() as conn:
+            cursor = conn.execute('''
+                INSERT INTO locks (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE locks.expires_at <= ?
+            ''', (name, owner, expires_at, now))
+            conn.commit()
+        return cursor.rowcount == 1
+
+    def release_lock(self, name, owner):
+        """Releases a lock, if the caller still holds it."""
+        with self._get_connection() as conn:
+            conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+            conn.commit()
+
     def set_setting(self, key, value):
         """Sets a key-value pair in the settings table."""
         with self._get_connection() as conn:
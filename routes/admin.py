@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, FileResponse
+from utils.retention import retention_manager
+from utils.metrics import metrics, CONTENT_TYPE
+from utils.profiling import request_profiler
+from utils.admission import admission
+from utils.common import to_thread
+
+router = APIRouter()
+
+
+@router.get("/admin/storage")
+async def get_storage_usage(request: Request):
+    """Size, budget and age of each managed directory, plus free disk space."""
+    db_manager = request.app.state.db_manager
+    usage = await to_thread(retention_manager.usage, db_manager)
+    return JSONResponse(content=usage)
+
+
+@router.post("/admin/storage/sweep")
+async def sweep_storage(request: Request, dry_run: bool = False):
+    """Apply the retention policies now instead of waiting for the next sweep."""
+    db_manager = request.app.state.db_manager
+    summary = await to_thread(retention_manager.sweep, db_manager, dry_run)
+    return JSONResponse(content={"dry_run": dry_run, "policies": summary})
+
+
+@router.get("/admin/admission")
+async def get_admission_state():
+    """Running and queued requests per admission lane, with totals admitted and rejected."""
+    return JSONResponse(content=admission.snapshot())
+
+
+@router.get("/admin/profiles")
+async def list_profiles():
+    """Request profiles captured so far, newest first."""
+    captures = await to_thread(request_profiler.list_captures)
+    return JSONResponse(content=captures)
+
+
+@router.get("/admin/profiles/{filename}")
+async def get_profile_file(filename: str):
+    """Download a capture's .pstats file or its text report."""
+    path = request_profiler.file_path(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=filename)
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Stage timings, request latencies and runtime gauges for Prometheus."""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
@@ -6,7 +6,7 @@ router = APIRouter()
 
 @router.get("/colors")
 async def get_colors(request: Request):
-    colors = request.app.state.db_manager.get_all_colors()
+    colors = await request.app.state.db_manager.aio.get_all_colors()
     return JSONResponse(content=colors)
 
 
@@ -19,6 +19,6 @@ async def add_color(request: Request):
         raise HTTPException(status_code=400, detail="Hex code not provided.")
     
     db_manager = request.app.state.db_manager
-    db_manager.add_color(hex_code)
+    await db_manager.aio.add_color(hex_code)
     
     return JSONResponse(content={"message": "Color added successfully"})
@@ -10,7 +10,7 @@ FONTS_DIR = "static/fonts"
 
 @router.get("/fonts")
 async def get_fonts(request: Request):
-    return JSONResponse(content=request.app.state.db_manager.get_all_fonts())
+    return JSONResponse(content=await request.app.state.db_manager.aio.get_all_fonts())
 
 
 @router.post("/upload_font")
@@ -31,7 +31,7 @@ async def upload_font(request: Request, file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Invalid font filename.")
 
     # Check if font with the sanitized name already exists
-    if db_manager.get_font_by_name(sanitized_font_name):
+    if await db_manager.aio.get_font_by_name(sanitized_font_name):
         raise HTTPException(status_code=409, detail=f"Font with name '{sanitized_font_name}' already exists.")
 
     # Use the sanitized font name for the filename
@@ -43,7 +43,7 @@ async def upload_font(request: Request, file: UploadFile = File(...)):
             content = await file.read()
             await out_file.write(content)
         
-        db_manager.add_font(sanitized_font_name, f"/{file_path}")
+        await db_manager.aio.add_font(sanitized_font_name, f"/{file_path}")
         return JSONResponse(content={"font_name": sanitized_font_name, "font_path": f"/{file_path}"}, status_code=201)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading font: {e}")
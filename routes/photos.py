@@ -8,21 +8,30 @@ import random
 import qrcode
 import asyncio
 import httpx
-import aiofiles
 import shutil
+import logging
 from typing import List, Optional
 from zipfile import ZipFile
 from urllib.parse import quote, unquote
 from PIL import Image
 from fastapi import APIRouter, File, UploadFile, Form, HTTPException, Response
 from fastapi.responses import JSONResponse, StreamingResponse
-from rembg import remove, new_session
-from utils.common import get_ip_address
+from utils.common import get_ip_address, to_thread
 from utils.filters import apply_filters
 from utils.drawing import draw_texts, draw_texts_on_pil
 from utils.image_processing import load_image_with_premultiplied_alpha, rotate_image
 from utils.session_manager import session_manager
+from utils.blob_store import blob_store
+from utils.compose_cache import compose_cache
+from utils.metrics import metrics
+from utils.logging_config import session_id_var
+from utils.lazy import lazy_import
 
+# onnxruntime and the matting stack take over a second to import, so rembg
+# is only loaded when background removal is first used
+rembg = lazy_import("rembg")
+
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 PORT = 8000
@@ -40,11 +49,21 @@ SESSIONS = {}
 
 def get_session(model_name: str = "u2net_human_seg"):
     if model_name not in SESSIONS:
-        print(f"Loading rembg model: {model_name}...")
-        SESSIONS[model_name] = new_session(model_name)
+        logger.info("Loading rembg model: %s", model_name)
+        SESSIONS[model_name] = rembg.new_session(model_name)
     return SESSIONS[model_name]
 
 
+def write_result_qr(result_filename, session_id):
+    """Write the QR code linking to a session's result and return its filename."""
+    ip_address = get_ip_address()
+    full_url = f"http://{ip_address}:{PORT}/static/results/{result_filename}"
+    qr_img = qrcode.make(full_url)
+    qr_filename = f"qr_{session_id}.png"
+    qr_img.save(os.path.join(RESULTS_DIR, qr_filename))
+    return qr_filename
+
+
 @router.post("/zip_originals")
 async def zip_originals(photos: List[UploadFile] = File(...)):
     zip_filename = f"{uuid.uuid4()}.zip"
@@ -75,20 +94,31 @@ async def zip_session_originals(session_id: str = Form(...)):
     if not session_data:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    session_dir = os.path.join(SESSIONS_DIR, session_id)
-    photos_dir = os.path.join(session_dir, "photos")
-    
-    if not os.path.exists(photos_dir):
+    # Originals live in the blob store and are listed in the session;
+    # older sessions kept them in a per-session photos folder
+    originals = []
+    for i, photo_path in enumerate(session_data.get("photos", [])):
+        file_path = unquote(photo_path.lstrip('/'))
+        if os.path.isfile(file_path):
+            originals.append((file_path, f"photo_{i}{os.path.splitext(file_path)[1]}"))
+    if not originals:
+        photos_dir = os.path.join(SESSIONS_DIR, session_id, "photos")
+        if os.path.isdir(photos_dir):
+            originals = [
+                (os.path.join(photos_dir, filename), filename)
+                for filename in sorted(os.listdir(photos_dir))
+                if os.path.isfile(os.path.join(photos_dir, filename))
+            ]
+
+    if not originals:
         raise HTTPException(status_code=404, detail="Session photos not found")
 
     zip_filename = f"originals_{session_id}.zip"
     zip_path = os.path.join(RESULTS_DIR, zip_filename)
 
     with ZipFile(zip_path, 'w') as zf:
-        for filename in os.listdir(photos_dir):
-            file_path = os.path.join(photos_dir, filename)
-            if os.path.isfile(file_path):
-                zf.write(file_path, arcname=filename)
+        for file_path, arcname in originals:
+            zf.write(file_path, arcname=arcname)
 
     ip_address = get_ip_address()
     full_url = f"http://{ip_address}:{PORT}/static/results/{zip_filename}"
@@ -123,23 +153,24 @@ async def apply_filters_to_image(file: UploadFile = File(...), filters: str = Fo
 async def remove_background_api(file: UploadFile = File(...), threshold: int = Form(0), bg_threshold: int = Form(10), erode_size: int = Form(10)):
     try:
         input_bytes = await file.read()
-        if threshold > 0:
-            # Alpha Matting
-            t_fg = max(10, min(threshold, 250))
-            t_bg = max(0, min(bg_threshold, 250))
-            t_erode = max(0, min(erode_size, 50)) # Cap erode size to prevent errors
+        with metrics.span("remove_background", "rembg"):
+            if threshold > 0:
+                # Alpha Matting
+                t_fg = max(10, min(threshold, 250))
+                t_bg = max(0, min(bg_threshold, 250))
+                t_erode = max(0, min(erode_size, 50)) # Cap erode size to prevent errors
             
-            output_bytes = remove(
-                input_bytes, 
-                session=get_session("u2net_human_seg"),
-                alpha_matting=True,
-                alpha_matting_foreground_threshold=t_fg,
-                alpha_matting_background_threshold=t_bg, 
-                alpha_matting_erode_size=t_erode
-            )
-        else:
-             # Default fast mode
-             output_bytes = remove(input_bytes, session=get_session("u2net_human_seg"))
+                output_bytes = rembg.remove(
+                    input_bytes, 
+                    session=get_session("u2net_human_seg"),
+                    alpha_matting=True,
+                    alpha_matting_foreground_threshold=t_fg,
+                    alpha_matting_background_threshold=t_bg, 
+                    alpha_matting_erode_size=t_erode
+                )
+            else:
+                 # Default fast mode
+                 output_bytes = rembg.remove(input_bytes, session=get_session("u2net_human_seg"))
 
         return StreamingResponse(io.BytesIO(output_bytes), media_type="image/png")
     except Exception as e:
@@ -151,7 +182,7 @@ async def process_and_stylize_image(prompt: str = Form(...), file: UploadFile =
     api_key = os.getenv("POLLINATIONS_API_KEY")
     headers = {}
     if api_key:
-        print("Using Pollinations API Key.")
+        logger.debug("Using Pollinations API key")
         headers["Authorization"] = f"Bearer {api_key}"
 
     max_retries = 3
@@ -163,7 +194,8 @@ async def process_and_stylize_image(prompt: str = Form(...), file: UploadFile =
         # Step 1: Upload to tmpfiles.org
         async with httpx.AsyncClient() as client:
             files = {'file': (file.filename, await file.read(), file.content_type)}
-            upload_response = await client.post("https://tmpfiles.org/api/v1/upload", files=files, timeout=30.0)
+            with metrics.span("stylize", "upload"):
+                upload_response = await client.post("https://tmpfiles.org/api/v1/upload", files=files, timeout=30.0)
             upload_response.raise_for_status()
             upload_data = upload_response.json()
 
@@ -172,7 +204,7 @@ async def process_and_stylize_image(prompt: str = Form(...), file: UploadFile =
 
             temp_url = upload_data["data"]["url"]
             direct_link = temp_url.replace("tmpfiles.org/", "tmpfiles.org/dl/")
-            print(f"Temporarily hosted at: {direct_link}")
+            logger.info("Temporarily hosted at: %s", direct_link)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload to temporary storage: {e}")
@@ -198,11 +230,11 @@ async def process_and_stylize_image(prompt: str = Form(...), file: UploadFile =
                 "image": direct_link,
                 "guidance_scale": 1
             }
-            print(f"Proxying request to: {pollinations_url}")
-            print(params)
+            logger.debug("Proxying request to %s with %s", pollinations_url, params)
 
             async with httpx.AsyncClient() as client:
-                stylize_response = await client.get(pollinations_url, headers=headers, params=params, timeout=100.0, follow_redirects=True)
+                with metrics.span("stylize", "generate"):
+                    stylize_response = await client.get(pollinations_url, headers=headers, params=params, timeout=100.0, follow_redirects=True)
                 stylize_response.raise_for_status()
 
             # Step 3: Stream the final image back
@@ -210,12 +242,12 @@ async def process_and_stylize_image(prompt: str = Form(...), file: UploadFile =
             return StreamingResponse(io.BytesIO(stylize_response.content), media_type=content_type)
 
         except Exception as e:
-            print(f"Attempt {attempt + 1} of {max_retries} failed: {e}")
+            logger.warning("Stylize attempt %d of %d failed: %s", attempt + 1, max_retries, e)
             if attempt < max_retries - 1:
                 await asyncio.sleep(3)
             else:
                 error_message = f"Failed to stylize image after {max_retries} attempts: {e}"
-                print(f"Error in /process_and_stylize_image: {error_message}")
+                logger.error(error_message)
                 return Response(content=error_message, status_code=500)
 
 
@@ -224,48 +256,48 @@ from fastapi import Request
 
 @router.post("/compose_image")
 async def compose_image(request: Request, holes: str = Form(...), photos: List[UploadFile] = File(...), stickers: str = Form(...), texts: str = Form(None), filters: str = Form(...), transformations: str = Form(...), template_path: str = Form(None), template_file: UploadFile = File(None), background_colors: str = Form(None), video_paths: str = Form(None), is_inverted: bool = Form(False)):
+    db_manager = request.app.state.db_manager
+    # Blob references taken by this request; its session releases them when
+    # it expires, so they are dropped here if no session gets saved
+    stored_hashes = []
     try:
         session_id = str(uuid.uuid4())
-        
-        # --- Persistence Setup ---
-        # Create session directory structure: static/results/sessions/{session_id}/photos/
-        session_dir = os.path.join(SESSIONS_DIR, session_id)
-        session_photos_dir = os.path.join(session_dir, "photos")
-        os.makedirs(session_photos_dir, exist_ok=True)
+        session_id_var.set(session_id)
 
         if template_file:
-            # Save the uploaded colored template
-            temp_filename = f"{uuid.uuid4()}.png"
-            base_template_path = os.path.join(UPLOAD_DIR, temp_filename)
-            async with aiofiles.open(base_template_path, 'wb') as out_file:
-                content = await template_file.read()
-                await out_file.write(content)
+            # Save the uploaded colored template; identical colorings share one blob
+            content = await template_file.read()
+            template_hash, base_template_path = await blob_store.put(db_manager, content, ".png")
+            stored_hashes.append(template_hash)
             
             # Also save template path to session data
             saved_template_path = base_template_path
         elif template_path:
             # Use the path from the form
+            template_hash = None
             base_template_path = os.path.join(os.getcwd(), template_path.lstrip('/'))
             saved_template_path = template_path
         else:
             raise HTTPException(status_code=400, detail="No template provided.")
 
-        print(f"Received filters: {filters}")
+        logger.debug("Received filters: %s", filters)
         hole_data = json.loads(holes)
         filter_data = json.loads(filters)
         transform_data = json.loads(transformations)
-        
-        # Unicode safe path handling
-        if template_path:
-             # Unquote if it was Url encoded
-             base_template_path = unquote(base_template_path)
+        placed_stickers = json.loads(stickers)
+        placed_texts = json.loads(texts) if texts else []
+        bg_colors_list = []
+        if background_colors:
+            try:
+                bg_colors_list = json.loads(background_colors)
+            except:
+                pass
 
-        # Use imdecode for Unicode path support
-        with open(base_template_path, "rb") as f:
-            file_bytes = np.frombuffer(f.read(), dtype=np.uint8)
-        template_img = cv2.imdecode(file_bytes, cv2.IMREAD_UNCHANGED)
-        height, width, _ = template_img.shape
-        canvas = np.full((height, width, 3), 255, np.uint8)
+        # Add type identifiers
+        for s in placed_stickers:
+            s['type'] = 'sticker'
+        for t in placed_texts:
+            t['type'] = 'text'
 
         parsed_video_paths = []
         if video_paths:
@@ -274,115 +306,175 @@ async def compose_image(request: Request, holes: str = Form(...), photos: List[U
              except:
                  pass
 
+        # Save original photos for persistence (retakes and re-edits of the
+        # same shot reuse the stored blob); their hashes key the result cache
+        photo_contents = []
+        photo_hashes = []
         saved_photo_paths = []
+        with metrics.span("compose_image", "store"):
+            for photo_file in photos:
+                photo_content = await photo_file.read()
+                photo_hash, saved_photo_path = await blob_store.put(db_manager, photo_content, ".jpg")
+                photo_contents.append(photo_content)
+                photo_hashes.append(photo_hash)
+                stored_hashes.append(photo_hash)
+                saved_photo_paths.append(f"/{saved_photo_path.replace(os.path.sep, '/')}")
 
-        for i, photo_file in enumerate(photos):
+        session_metadata = {
+            "session_id": session_id,
+            "holes": hole_data,
+            "stickers": placed_stickers,
+            "texts": json.loads(texts) if texts else [],
+            "filters": filter_data,
+            "transformations": transform_data,
+            "template_path": saved_template_path,
+            "background_colors": bg_colors_list,
+            "photos": saved_photo_paths,
+            "videos": parsed_video_paths,
+            "is_inverted": is_inverted,
+        }
+
+        # use session_id in filename
+        result_filename = f"{session_id}.png"
+        result_path = os.path.join(RESULTS_DIR, result_filename)
+
+        # "Print again" and back-and-forth in the review screen resend the
+        # same composition; a new session then gets a copy of the earlier
+        # result, so the gallery lists it under its own session
+        use_cache = await compose_cache.enabled(db_manager)
+        if use_cache:
+            spec_hash = compose_cache.spec_hash(
+                template_hash, template_path, photo_hashes, hole_data, transform_data,
+                filter_data, bg_colors_list, placed_stickers, placed_texts
+            )
+            cached = await compose_cache.lookup(db_manager, spec_hash)
+            if cached:
+                try:
+                    with metrics.span("compose_image", "reuse"):
+                        await to_thread(shutil.copyfile, cached.lstrip('/'), result_path)
+                        qr_filename = await to_thread(write_result_qr, result_filename, session_id)
+                except OSError as e:
+                    # Swept between the lookup and the copy
+                    logger.warning("Could not reuse %s, composing afresh: %s", cached, e)
+                    cached = None
+            if cached:
+                session_metadata.update({
+                    "result_path": f"/static/results/{result_filename}",
+                    "qr_code_path": f"/static/results/{qr_filename}",
+                    "timestamp": os.path.getmtime(result_path)
+                })
+                await session_manager.save_session(session_id, session_metadata)
+                stored_hashes.clear()
+                return JSONResponse(content={
+                    "result_path": f"/static/results/{result_filename}",
+                    "qr_code_path": f"/static/results/{qr_filename}",
+                    "session_id": session_id
+                })
+
+        # Unicode safe path handling
+        if template_path:
+             # Unquote if it was Url encoded
+             base_template_path = unquote(base_template_path)
+
+        with metrics.span("compose_image", "load_template"):
+            # Use imdecode for Unicode path support
+            with open(base_template_path, "rb") as f:
+                file_bytes = np.frombuffer(f.read(), dtype=np.uint8)
+            template_img = cv2.imdecode(file_bytes, cv2.IMREAD_UNCHANGED)
+            height, width, _ = template_img.shape
+            canvas = np.full((height, width, 3), 255, np.uint8)
+
+        for i, photo_content in enumerate(photo_contents):
             hole = hole_data[i]
             transform = transform_data[i]
-            photo_content = await photo_file.read()
-
-            # Save Original Photo for persistence
-            photo_filename = f"photo_{i}.jpg"
-            saved_photo_path = os.path.join(session_photos_dir, photo_filename)
-            async with aiofiles.open(saved_photo_path, 'wb') as f:
-                await f.write(photo_content)
-            saved_photo_paths.append(f"/{saved_photo_path.replace(os.path.sep, '/')}")
             
             # --- Background Removal & Coloring ---
             bg_color_hex = None
-            if background_colors:
-                try:
-                    bg_colors_list = json.loads(background_colors)
-                    if i < len(bg_colors_list):
-                        bg_color_hex = bg_colors_list[i]
-                except:
-                    pass
+            if i < len(bg_colors_list):
+                bg_color_hex = bg_colors_list[i]
 
             if bg_color_hex:
                 # Remove background
-                output_bytes = remove(photo_content, session=get_session("u2net_human_seg"))
-                foreground = Image.open(io.BytesIO(output_bytes)).convert("RGBA")
+                with metrics.span("compose_image", "rembg"):
+                    output_bytes = rembg.remove(photo_content, session=get_session("u2net_human_seg"))
+                    foreground = Image.open(io.BytesIO(output_bytes)).convert("RGBA")
                 
-                # Create solid color background
-                # Hex to RGB
-                h = bg_color_hex.lstrip('#')
-                rgb = tuple(int(h[i:i+2], 16) for i in (0, 2, 4)) + (255,) # Add alpha
+                    # Create solid color background
+                    # Hex to RGB
+                    h = bg_color_hex.lstrip('#')
+                    rgb = tuple(int(h[i:i+2], 16) for i in (0, 2, 4)) + (255,) # Add alpha
                 
-                background = Image.new("RGBA", foreground.size, rgb)
-                background.paste(foreground, (0, 0), foreground)
+                    background = Image.new("RGBA", foreground.size, rgb)
+                    background.paste(foreground, (0, 0), foreground)
                 
-                # Convert PIL image back to OpenCV format
-                background = background.convert("RGB")
-                open_cv_image = np.array(background)
-                photo_img = open_cv_image[:, :, ::-1].copy() # Convert RGB to BGR
+                    # Convert PIL image back to OpenCV format
+                    background = background.convert("RGB")
+                    open_cv_image = np.array(background)
+                    photo_img = open_cv_image[:, :, ::-1].copy() # Convert RGB to BGR
             else:
-                nparr = np.frombuffer(photo_content, np.uint8)
-                photo_img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                with metrics.span("compose_image", "decode"):
+                    nparr = np.frombuffer(photo_content, np.uint8)
+                    photo_img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-            filtered_photo = apply_filters(photo_img, filter_data)
+            with metrics.span("compose_image", "filters"):
+                filtered_photo = apply_filters(photo_img, filter_data)
 
             # Apply transformations
-            scale = transform.get('scale', 1)
-            rotation = -transform.get('rotation', 0)
-            new_w = int(hole['w'] * scale)
-            new_h = int(hole['h'] * scale)
-
-            # High-Quality Resizing Logic
-            h_orig, w_orig = filtered_photo.shape[:2]
+            with metrics.span("compose_image", "transform"):
+                scale = transform.get('scale', 1)
+                rotation = -transform.get('rotation', 0)
+                new_w = int(hole['w'] * scale)
+                new_h = int(hole['h'] * scale)
+
+                # High-Quality Resizing Logic
+                h_orig, w_orig = filtered_photo.shape[:2]
             
-            if new_w < w_orig or new_h < h_orig:
-                interpolation = cv2.INTER_AREA
-            else:
-                interpolation = cv2.INTER_LANCZOS4
+                if new_w < w_orig or new_h < h_orig:
+                    interpolation = cv2.INTER_AREA
+                else:
+                    interpolation = cv2.INTER_LANCZOS4
                 
-            resized_photo = cv2.resize(filtered_photo, (new_w, new_h), interpolation=interpolation)
-            rotated_photo = rotate_image(resized_photo, rotation)
+                resized_photo = cv2.resize(filtered_photo, (new_w, new_h), interpolation=interpolation)
+                rotated_photo = rotate_image(resized_photo, rotation)
 
             # Calculate position for centered placement
-            r_h, r_w, _ = rotated_photo.shape
-            pos_x = hole['x'] + (hole['w'] - r_w) // 2
-            pos_y = hole['y'] + (hole['h'] - r_h) // 2
-
-            # Create a mask from the rotated photo's alpha channel if it exists, otherwise just use the photo
-            if rotated_photo.shape[2] == 4:
-                alpha_mask = rotated_photo[:, :, 3] / 255.0
-                alpha_mask_3c = np.dstack((alpha_mask, alpha_mask, alpha_mask))
+            with metrics.span("compose_image", "blend"):
+                r_h, r_w, _ = rotated_photo.shape
+                pos_x = hole['x'] + (hole['w'] - r_w) // 2
+                pos_y = hole['y'] + (hole['h'] - r_h) // 2
+
+                # Create a mask from the rotated photo's alpha channel if it exists, otherwise just use the photo
+                if rotated_photo.shape[2] == 4:
+                    alpha_mask = rotated_photo[:, :, 3] / 255.0
+                    alpha_mask_3c = np.dstack((alpha_mask, alpha_mask, alpha_mask))
                 
-                # Bounds checking
-                x1, y1 = max(pos_x, 0), max(pos_y, 0)
-                x2, y2 = min(pos_x + r_w, width), min(pos_y + r_h, height)
+                    # Bounds checking
+                    x1, y1 = max(pos_x, 0), max(pos_y, 0)
+                    x2, y2 = min(pos_x + r_w, width), min(pos_y + r_h, height)
                 
-                w, h = x2 - x1, y2 - y1
-                if w > 0 and h > 0:
-                    canvas_roi = canvas[y1:y2, x1:x2]
-                    photo_roi = rotated_photo[y1-pos_y:y1-pos_y+h, x1-pos_x:x1-pos_x+w, :3]
-                    alpha_roi = alpha_mask_3c[y1-pos_y:y1-pos_y+h, x1-pos_x:x1-pos_x+w]
-
-                    canvas[y1:y2, x1:x2] = canvas_roi * (1 - alpha_roi) + photo_roi * alpha_roi
-            else:
-                # Bounds checking for BGR images
-                x1, y1 = max(pos_x, 0), max(pos_y, 0)
-                x2, y2 = min(pos_x + r_w, width), min(pos_y + r_h, height)
-
-                w, h = x2 - x1, y2 - y1
-                if w > 0 and h > 0:
-                    canvas[y1:y2, x1:x2] = rotated_photo[y1-pos_y:y1-pos_y+h, x1-pos_x:x1-pos_x+w]
-
-        template_bgr = template_img[:, :, 0:3]
-        alpha_channel = template_img[:, :, 3] / 255.0
-        alpha_mask = np.dstack((alpha_channel, alpha_channel, alpha_channel))
-        composite_img = ((template_bgr * alpha_mask) + (canvas * (1 - alpha_mask))).astype(np.uint8)
+                    w, h = x2 - x1, y2 - y1
+                    if w > 0 and h > 0:
+                        canvas_roi = canvas[y1:y2, x1:x2]
+                        photo_roi = rotated_photo[y1-pos_y:y1-pos_y+h, x1-pos_x:x1-pos_x+w, :3]
+                        alpha_roi = alpha_mask_3c[y1-pos_y:y1-pos_y+h, x1-pos_x:x1-pos_x+w]
+
+                        canvas[y1:y2, x1:x2] = canvas_roi * (1 - alpha_roi) + photo_roi * alpha_roi
+                else:
+                    # Bounds checking for BGR images
+                    x1, y1 = max(pos_x, 0), max(pos_y, 0)
+                    x2, y2 = min(pos_x + r_w, width), min(pos_y + r_h, height)
+
+                    w, h = x2 - x1, y2 - y1
+                    if w > 0 and h > 0:
+                        canvas[y1:y2, x1:x2] = rotated_photo[y1-pos_y:y1-pos_y+h, x1-pos_x:x1-pos_x+w]
+
+        with metrics.span("compose_image", "template_overlay"):
+            template_bgr = template_img[:, :, 0:3]
+            alpha_channel = template_img[:, :, 3] / 255.0
+            alpha_mask = np.dstack((alpha_channel, alpha_channel, alpha_channel))
+            composite_img = ((template_bgr * alpha_mask) + (canvas * (1 - alpha_mask))).astype(np.uint8)
 
         # --- Sticker & Text Overlay Logic (Unified Chronological Layering) ---
-        placed_stickers = json.loads(stickers)
-        placed_texts = json.loads(texts) if texts else []
-        
-        # Add type identifiers
-        for s in placed_stickers:
-            s['type'] = 'sticker'
-        for t in placed_texts:
-            t['type'] = 'text'
-            
         # Combine and sort by ID (timestamp)
         decorations = placed_stickers + placed_texts
         decorations.sort(key=lambda x: x.get('id', 0))
@@ -391,109 +483,99 @@ async def compose_image(request: Request, holes: str = Form(...), photos: List[U
 
         for deco in decorations:
             if deco['type'] == 'sticker':
-                sticker_data = deco
-                # --- Server-side validation for sticker dimensions ---
-                try:
-                    width = int(sticker_data.get('width'))
-                    height = int(sticker_data.get('height'))
-                    if width <= 0 or height <= 0:
-                        print(f"Skipping sticker with invalid dimensions: {sticker_data}")
+                with metrics.span("compose_image", "stickers"):
+                    sticker_data = deco
+                    # --- Server-side validation for sticker dimensions ---
+                    try:
+                        width = int(sticker_data.get('width'))
+                        height = int(sticker_data.get('height'))
+                        if width <= 0 or height <= 0:
+                            logger.warning("Skipping sticker with invalid dimensions: %s", sticker_data)
+                            continue
+                    except (ValueError, TypeError):
+                        logger.warning("Skipping sticker with non-numeric dimensions: %s", sticker_data)
                         continue
-                except (ValueError, TypeError):
-                    print(f"Skipping sticker with non-numeric dimensions: {sticker_data}")
-                    continue
-
-                # Decode path and use unicode-safe read
-                raw_path = sticker_data['path'].lstrip('/')
-                decoded_path = unquote(raw_path)
-                sticker_path = os.path.join(os.getcwd(), decoded_path)
+
+                    # Decode path and use unicode-safe read
+                    raw_path = sticker_data['path'].lstrip('/')
+                    decoded_path = unquote(raw_path)
+                    sticker_path = os.path.join(os.getcwd(), decoded_path)
                 
-                if not os.path.exists(sticker_path):
-                    print(f"Sticker not found: {sticker_path} (Decoded: {decoded_path})")
-                    continue # Skip if sticker image not found
-
-                # cv2.imread doesn't support unicode on windows, use imdecode
-                with open(sticker_path, "rb") as f:
-                    file_bytes = np.frombuffer(f.read(), dtype=np.uint8)
-                sticker_img = cv2.imdecode(file_bytes, cv2.IMREAD_UNCHANGED)
-                if sticker_img.shape[2] == 3:
-                    sticker_img = cv2.cvtColor(sticker_img, cv2.COLOR_BGR2BGRA)
+                    if not os.path.exists(sticker_path):
+                        logger.warning("Sticker not found: %s (decoded: %s)", sticker_path, decoded_path)
+                        continue # Skip if sticker image not found
+
+                    # cv2.imread doesn't support unicode on windows, use imdecode
+                    with open(sticker_path, "rb") as f:
+                        file_bytes = np.frombuffer(f.read(), dtype=np.uint8)
+                    sticker_img = cv2.imdecode(file_bytes, cv2.IMREAD_UNCHANGED)
+                    if sticker_img.shape[2] == 3:
+                        sticker_img = cv2.cvtColor(sticker_img, cv2.COLOR_BGR2BGRA)
                 
-                sticker_img_resized = cv2.resize(sticker_img, (width, height))
-                sticker_rotated = rotate_image(sticker_img_resized, -sticker_data.get('rotation', 0))
+                    sticker_img_resized = cv2.resize(sticker_img, (width, height))
+                    sticker_rotated = rotate_image(sticker_img_resized, -sticker_data.get('rotation', 0))
                 
-                s_h, s_w, _ = sticker_rotated.shape
-                pos_x = sticker_data['x'] - (s_w - sticker_data['width']) // 2
-                pos_y = sticker_data['y'] - (s_h - sticker_data['height']) // 2
-                img_h, img_w, _ = final_image_bgra.shape
-
-                # --- Clipping Logic ---
-                # Calculate the intersection of the sticker and the main image
-                x1 = int(max(pos_x, 0))
-                y1 = int(max(pos_y, 0))
-                x2 = int(min(pos_x + s_w, img_w))
-                y2 = int(min(pos_y + s_h, img_h))
-
-                # Calculate the width and height of the overlapping area
-                w = x2 - x1
-                h = y2 - y1
-
-                # If there is no overlap, skip this sticker
-                if w <= 0 or h <= 0:
-                    continue
-
-                # Get the corresponding region from the sticker
-                sticker_x1 = 0 if pos_x > 0 else -pos_x
-                sticker_y1 = 0 if pos_y > 0 else -pos_y
-                clipped_sticker = sticker_rotated[int(sticker_y1):int(sticker_y1+h), int(sticker_x1):int(sticker_x1+w)]
-
-                # Get the region of interest from the main image
-                roi = final_image_bgra[y1:y2, x1:x2]
-
-                # Alpha blending for the clipped sticker
-                sticker_alpha = clipped_sticker[:, :, 3] / 255.0
-                sticker_alpha_mask = np.dstack((sticker_alpha, sticker_alpha, sticker_alpha, sticker_alpha))
+                    s_h, s_w, _ = sticker_rotated.shape
+                    pos_x = sticker_data['x'] - (s_w - sticker_data['width']) // 2
+                    pos_y = sticker_data['y'] - (s_h - sticker_data['height']) // 2
+                    img_h, img_w, _ = final_image_bgra.shape
+
+                    # --- Clipping Logic ---
+                    # Calculate the intersection of the sticker and the main image
+                    x1 = int(max(pos_x, 0))
+                    y1 = int(max(pos_y, 0))
+                    x2 = int(min(pos_x + s_w, img_w))
+                    y2 = int(min(pos_y + s_h, img_h))
+
+                    # Calculate the width and height of the overlapping area
+                    w = x2 - x1
+                    h = y2 - y1
+
+                    # If there is no overlap, skip this sticker
+                    if w <= 0 or h <= 0:
+                        continue
+
+                    # Get the corresponding region from the sticker
+                    sticker_x1 = 0 if pos_x > 0 else -pos_x
+                    sticker_y1 = 0 if pos_y > 0 else -pos_y
+                    clipped_sticker = sticker_rotated[int(sticker_y1):int(sticker_y1+h), int(sticker_x1):int(sticker_x1+w)]
+
+                    # Get the region of interest from the main image
+                    roi = final_image_bgra[y1:y2, x1:x2]
+
+                    # Alpha blending for the clipped sticker
+                    sticker_alpha = clipped_sticker[:, :, 3] / 255.0
+                    sticker_alpha_mask = np.dstack((sticker_alpha, sticker_alpha, sticker_alpha, sticker_alpha))
                 
-                blended_roi = (clipped_sticker * sticker_alpha_mask) + (roi * (1 - sticker_alpha_mask))
-                final_image_bgra[y1:y2, x1:x2] = blended_roi
+                    blended_roi = (clipped_sticker * sticker_alpha_mask) + (roi * (1 - sticker_alpha_mask))
+                    final_image_bgra[y1:y2, x1:x2] = blended_roi
 
             elif deco['type'] == 'text':
-                texts_data = [deco] # Pass single text to draw_texts
-                db_manager = request.app.state.db_manager
-                final_image_bgra = draw_texts(final_image_bgra, texts_data, db_manager)
+                with metrics.span("compose_image", "texts"):
+                    texts_data = [deco] # Pass single text to draw_texts
+                    final_image_bgra = draw_texts(final_image_bgra, texts_data, db_manager)
 
         # --- Save final image and generate QR code ---
-        # use session_id in filename
-        result_filename = f"{session_id}.png"
-        result_path = os.path.join(RESULTS_DIR, result_filename)
-        cv2.imwrite(result_path, final_image_bgra)
-
-        ip_address = get_ip_address()
-        full_url = f"http://{ip_address}:{PORT}/static/results/{result_filename}"
-        qr_img = qrcode.make(full_url)
-        qr_filename = f"qr_{session_id}.png"
-        qr_path = os.path.join(RESULTS_DIR, qr_filename)
-        qr_img.save(qr_path)
+        with metrics.span("compose_image", "encode"):
+            cv2.imwrite(result_path, final_image_bgra)
+
+        with metrics.span("compose_image", "qr"):
+            qr_filename = write_result_qr(result_filename, session_id)
         
-        # --- Save Session Metadata ---
-        session_metadata = {
-            "session_id": session_id,
-            "holes": hole_data,
-            "stickers": placed_stickers,
-            "texts": json.loads(texts) if texts else [],
-            "filters": filter_data,
-            "transformations": transform_data,
-            "template_path": saved_template_path,
-            "background_colors": json.loads(background_colors) if background_colors else [],
-            "photos": saved_photo_paths,
-            "videos": parsed_video_paths,
-            "is_inverted": is_inverted,
-            "result_path": f"/static/results/{result_filename}",
-            "qr_code_path": f"/static/results/{qr_filename}",
-            "timestamp": os.path.getmtime(result_path)
-        }
+        with metrics.span("compose_image", "session"):
+            # --- Save Session Metadata ---
+            session_metadata.update({
+                "result_path": f"/static/results/{result_filename}",
+                "qr_code_path": f"/static/results/{qr_filename}",
+                "timestamp": os.path.getmtime(result_path)
+            })
         
-        await session_manager.save_session(session_id, session_metadata)
+            await session_manager.save_session(session_id, session_metadata)
+            stored_hashes.clear()
+            if use_cache:
+                await compose_cache.store(
+                    db_manager, spec_hash, f"/static/results/{result_filename}", f"/static/results/{qr_filename}"
+                )
 
         return JSONResponse(content={
             "result_path": f"/static/results/{result_filename}",
@@ -501,8 +583,9 @@ async def compose_image(request: Request, holes: str = Form(...), photos: List[U
             "session_id": session_id
         })
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Failed to compose image")
+        if stored_hashes:
+            await db_manager.aio.release_blob_references(stored_hashes)
         raise HTTPException(status_code=500, detail=f"Failed to compose image: {e}")
 
 
@@ -1,25 +1,25 @@
-from fastapi import APIRouter, Request, Form
+from fastapi import APIRouter, Request, Form, HTTPException
 from fastapi.responses import JSONResponse, HTMLResponse
-import aiofiles
+from utils.app_shell import app_shell
+from utils.common import etag_response, to_thread
 
 router = APIRouter()
 
 
 @router.get("/", response_class=HTMLResponse)
-async def read_root():
+async def read_root(request: Request):
     try:
-        async with aiofiles.open('templates/index.html', mode='r', encoding='utf-8') as f:
-            content = await f.read()
-        return HTMLResponse(content=content)
+        # Assembled at startup; in dev mode this rebuilds after file changes
+        body, etag = await to_thread(app_shell.get)
     except FileNotFoundError:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="index.html not found")
+    return etag_response(request, body, etag, media_type="text/html")
 
 
 @router.post("/set_theme")
 async def set_theme(request: Request, theme: str = Form(...)):
     db_manager = request.app.state.db_manager
-    db_manager.set_setting('theme', theme)
+    await db_manager.aio.set_setting('theme', theme)
     request.app.state.current_theme = theme
     return JSONResponse(content={"message": "Theme updated successfully"})
 
@@ -1,70 +1,165 @@
+import io
 import os
-import uuid
+import json
+import math
+import hashlib
+import logging
 import aiofiles
-from fastapi import APIRouter, Request, HTTPException, File, UploadFile, Form
+from typing import Optional
+from fastapi import APIRouter, Request, HTTPException, File, UploadFile, Form, Query
 from fastapi.responses import JSONResponse
-from PIL import Image
+from PIL import Image, ImageSequence
+from utils.common import etag_response, to_thread
+from utils.sticker_atlas import sticker_atlas
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 STICKERS_DIR = "static/stickers"
 THUMBNAILS_DIR = "static/stickers/thumbnails"
 
 
-def generate_thumbnail(source_path, thumbnail_size=(100, 100)):
-    """Generate a thumbnail from an image or animated WebP.
-    
+# Animated previews keep at most this many frames, spread over the whole loop
+PREVIEW_MAX_FRAMES = 24
+
+
+def _web_path(path):
+    # Return path with forward slashes for web
+    return "/" + path.replace('\\', '/')
+
+
+def generate_thumbnail(source_path, thumbnail_size=(100, 100), content_hash=None):
+    """Generate 1x and 2x WebP thumbnails, plus a looping preview for animations.
+
+    Files are named after the source's content hash, so the same image always
+    maps to the same thumbnails and an existing set is reused without
+    decoding anything. All outputs come from a single pass over the frames.
+
     Args:
         source_path: Path to the source image
-        thumbnail_size: Tuple of (width, height) for the thumbnail
-    
+        thumbnail_size: Tuple of (width, height) for the 1x thumbnail
+        content_hash: SHA-256 hex digest of the source, if already known
+
     Returns:
-        Path to the generated thumbnail, or None if generation fails
+        Dict with 'thumbnail_path', 'thumbnail_2x_path' and 'preview_path'
+        (None for still images), or None if generation fails
     """
     try:
         os.makedirs(THUMBNAILS_DIR, exist_ok=True)
-        
-        # Open the image (PIL automatically extracts first frame from animated WebP)
-        with Image.open(source_path) as img:
-            # Convert to RGB if necessary (for PNG output)
-            if img.mode in ('RGBA', 'LA', 'P'):
+
+        with open(source_path, 'rb') as f:
+            data = f.read()
+        if content_hash is None:
+            content_hash = hashlib.sha256(data).hexdigest()
+
+        width, height = thumbnail_size
+        base = os.path.join(THUMBNAILS_DIR, content_hash[:20])
+        paths = {
+            'thumbnail_path': f"{base}_{width}.webp",
+            'thumbnail_2x_path': f"{base}_{width * 2}.webp",
+            'preview_path': f"{base}_{width}_anim.webp",
+        }
+
+        if os.path.exists(paths['thumbnail_path']) and os.path.exists(paths['thumbnail_2x_path']):
+            preview = paths['preview_path'] if os.path.exists(paths['preview_path']) else None
+            return {
+                'thumbnail_path': _web_path(paths['thumbnail_path']),
+                'thumbnail_2x_path': _web_path(paths['thumbnail_2x_path']),
+                'preview_path': _web_path(preview) if preview else None,
+            }
+
+        with Image.open(io.BytesIO(data)) as img:
+            n_frames = getattr(img, 'n_frames', 1)
+            animated = getattr(img, 'is_animated', False) and n_frames > 1
+            step = max(1, math.ceil(n_frames / PREVIEW_MAX_FRAMES))
+
+            still_2x = None
+            preview_frames = []
+            preview_durations = []
+            for index, frame in enumerate(ImageSequence.Iterator(img)):
                 # Preserve transparency by using RGBA
-                img = img.convert('RGBA')
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Create thumbnail (maintains aspect ratio)
-            img.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-            
-            # Generate thumbnail filename
-            source_basename = os.path.basename(source_path)
-            name_without_ext = os.path.splitext(source_basename)[0]
-            
-            # Check for naming conflicts and add number suffix if needed
-            thumbnail_filename = f"{name_without_ext}_thumb.png"
-            thumbnail_path = os.path.join(THUMBNAILS_DIR, thumbnail_filename)
-            
-            # If file exists, add number suffix
-            counter = 1
-            while os.path.exists(thumbnail_path):
-                thumbnail_filename = f"{name_without_ext}_thumb_{counter}.png"
-                thumbnail_path = os.path.join(THUMBNAILS_DIR, thumbnail_filename)
-                counter += 1
-            
-            # Save as PNG
-            img.save(thumbnail_path, 'PNG', optimize=True)
-            
-            # Return path with forward slashes for web
-            return "/" + thumbnail_path.replace('\\', '/')
-            
+                frame = frame.convert('RGBA')
+                if still_2x is None:
+                    still_2x = frame.copy()
+                    still_2x.thumbnail((width * 2, height * 2), Image.Resampling.LANCZOS)
+                    if not animated:
+                        break
+
+                # Skipped frames lend their time to the kept one, so the loop
+                # plays at the original speed
+                duration = frame.info.get('duration', img.info.get('duration', 100)) or 100
+                if index % step == 0:
+                    frame.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
+                    preview_frames.append(frame)
+                    preview_durations.append(duration)
+                else:
+                    preview_durations[-1] += duration
+
+        # The 1x still is derived from the 2x one rather than decoded again
+        still = still_2x.copy()
+        still.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
+        still_2x.save(paths['thumbnail_2x_path'], 'WEBP', quality=85, method=4)
+        still.save(paths['thumbnail_path'], 'WEBP', quality=85, method=4)
+
+        preview_path = None
+        if animated and len(preview_frames) > 1:
+            preview_frames[0].save(
+                paths['preview_path'], 'WEBP', save_all=True,
+                append_images=preview_frames[1:], duration=preview_durations,
+                loop=0, quality=70, method=4
+            )
+            preview_path = _web_path(paths['preview_path'])
+
+        return {
+            'thumbnail_path': _web_path(paths['thumbnail_path']),
+            'thumbnail_2x_path': _web_path(paths['thumbnail_2x_path']),
+            'preview_path': preview_path,
+        }
+
     except Exception as e:
-        print(f"Error generating thumbnail for {source_path}: {e}")
+        logger.warning("Error generating thumbnail for %s: %s", source_path, e)
         return None
 
 
 @router.get("/stickers")
-async def get_stickers(request: Request):
-    return JSONResponse(content=request.app.state.db_manager.get_all_stickers())
+async def get_stickers(
+    request: Request,
+    category: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+):
+    """List stickers, newest first.
+
+    Without parameters every sticker is returned. `category` filters to one
+    category ("" for uncategorized), and `limit` with `after_id` pages
+    through the results; when more rows remain, the id to pass as the next
+    `after_id` is sent in the X-Next-After-Id header.
+    """
+    db_manager = request.app.state.db_manager
+    # Fetch one extra row to know whether another page follows
+    fetch_limit = limit + 1 if limit else None
+    stickers = await db_manager.aio.get_stickers(category=category, after_id=after_id, limit=fetch_limit)
+
+    headers = {}
+    if limit and len(stickers) > limit:
+        stickers = stickers[:limit]
+        headers["X-Next-After-Id"] = str(stickers[-1]['id'])
+
+    body = json.dumps(stickers).encode('utf-8')
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    return etag_response(request, body, etag, headers=headers)
+
+
+@router.get("/sticker_atlas")
+async def get_sticker_atlas(request: Request, category: str = ""):
+    """Sprite sheet map for one sticker drawer view.
+
+    The JSON lists the stickers of `category` (or, for the top level,
+    uncategorized stickers plus a cover per category) with their rectangle
+    in a single WebP sheet, so the drawer needs the map and one image.
+    """
+    body, etag = await to_thread(sticker_atlas.get, request.app.state.db_manager, category)
+    return etag_response(request, body, etag)
 
 
 @router.post("/upload_sticker")
@@ -78,23 +173,28 @@ async def upload_sticker(request: Request, file: UploadFile = File(...), categor
     else:
         sticker_dir = STICKERS_DIR
 
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(sticker_dir, unique_filename)
+    content = await file.read()
+    # Name by content so re-uploading a sticker maps onto the existing file and row
+    content_hash = hashlib.sha256(content).hexdigest()
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    file_path = os.path.join(sticker_dir, f"{content_hash}{file_extension}")
 
     try:
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await file.read()
-            await out_file.write(content)
+        if not os.path.exists(file_path):
+            async with aiofiles.open(file_path, 'wb') as out_file:
+                await out_file.write(content)
         
         # Generate thumbnail
-        thumbnail_path = generate_thumbnail(file_path)
+        thumbnails = await to_thread(generate_thumbnail, file_path, (100, 100), content_hash) or {}
         
         db_manager = request.app.state.db_manager
         cat = file_path.replace('\\', '/')
         sticker_path_for_db = f"/{cat}"
-        db_manager.add_sticker(sticker_path_for_db, category, thumbnail_path)
-        return JSONResponse(content={"sticker_path": sticker_path_for_db, "thumbnail_path": thumbnail_path}, status_code=201)
+        await db_manager.aio.add_sticker(
+            sticker_path_for_db, category,
+            thumbnails.get('thumbnail_path'), thumbnails.get('thumbnail_2x_path'), thumbnails.get('preview_path')
+        )
+        return JSONResponse(content={"sticker_path": sticker_path_for_db, **thumbnails}, status_code=201)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading sticker: {e}")
 
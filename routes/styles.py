@@ -6,7 +6,7 @@ router = APIRouter()
 
 @router.get("/styles")
 async def get_styles(request: Request):
-    styles = request.app.state.db_manager.get_all_styles()
+    styles = await request.app.state.db_manager.aio.get_all_styles()
     return JSONResponse(content=styles)
 
 
@@ -19,7 +19,7 @@ async def add_style(request: Request):
         raise HTTPException(status_code=400, detail="Name and prompt are required.")
     
     db_manager = request.app.state.db_manager
-    db_manager.add_style(name, prompt)
+    await db_manager.aio.add_style(name, prompt)
     
     return JSONResponse(content={"message": "Style added successfully"})
 
@@ -28,7 +28,7 @@ async def add_style(request: Request):
 async def delete_style(request: Request, style_id: int):
     try:
         db_manager = request.app.state.db_manager
-        db_manager.delete_style(style_id)
+        await db_manager.aio.delete_style(style_id)
         return Response(status_code=204)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete style: {e}")
@@ -41,7 +41,7 @@ async def update_style(request: Request, style_id: int):
         name = data.get("name")
         prompt = data.get("prompt")
         db_manager = request.app.state.db_manager
-        db_manager.update_style(style_id, name, prompt)
+        await db_manager.aio.update_style(style_id, name, prompt)
         return JSONResponse(content={"message": "Style updated successfully"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update style: {e}")
@@ -49,7 +49,7 @@ async def update_style(request: Request, style_id: int):
 
 @router.get("/filter_presets")
 async def get_filter_presets(request: Request):
-    presets = request.app.state.db_manager.get_all_filter_presets()
+    presets = await request.app.state.db_manager.aio.get_all_filter_presets()
     return JSONResponse(content=presets)
 
 
@@ -62,7 +62,7 @@ async def add_filter_preset(request: Request):
         raise HTTPException(status_code=400, detail="Name and values are required.")
     
     db_manager = request.app.state.db_manager
-    db_manager.add_filter_preset(name, filter_values)
+    await db_manager.aio.add_filter_preset(name, filter_values)
     
     return JSONResponse(content={"message": "Filter preset added successfully"})
 
@@ -74,7 +74,7 @@ async def update_filter_preset(request: Request, preset_id: int):
         name = data.get("name")
         filter_values = data.get("filter_values")
         db_manager = request.app.state.db_manager
-        db_manager.update_filter_preset(preset_id, name, filter_values)
+        await db_manager.aio.update_filter_preset(preset_id, name, filter_values)
         return JSONResponse(content={"message": "Filter preset updated successfully"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update filter preset: {e}")
@@ -84,7 +84,7 @@ async def update_filter_preset(request: Request, preset_id: int):
 async def delete_filter_preset(request: Request, preset_id: int):
     try:
         db_manager = request.app.state.db_manager
-        db_manager.delete_filter_preset(preset_id)
+        await db_manager.aio.delete_filter_preset(preset_id)
         return Response(status_code=204)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete filter preset: {e}")
@@ -4,8 +4,9 @@ import cv2
 import aiofiles
 from fastapi import APIRouter, Request, HTTPException, File, UploadFile
 from fastapi.responses import JSONResponse
-from utils.template_generation import generate_layout_thumbnail, generate_template_if_not_exists
-from utils.common import gcd
+from utils.template_generation import generate_template_if_not_exists
+from utils.common import gcd, etag_response, to_thread
+from utils.layout_catalog import layout_catalog
 
 router = APIRouter()
 
@@ -15,37 +16,15 @@ GENERATED_TEMPLATES_DIR = "static/generated_templates"
 
 @router.get("/layouts")
 async def get_layouts(request: Request):
-    layouts = request.app.state.db_manager.get_layouts()
-    
-    # Create a directory for generated layout thumbnails if it doesn't exist
-    layout_thumbnail_dir = "static/layouts"
-    os.makedirs(layout_thumbnail_dir, exist_ok=True)
-
-    for layout in layouts:
-        thumbnail_path = generate_layout_thumbnail(layout['aspect_ratio'], layout['cell_layout'], layout_thumbnail_dir)
-        layout['thumbnail_path'] = thumbnail_path
-        
-        # Find a template that matches the layout to get the holes info
-        template = request.app.state.db_manager.get_template_by_layout(layout['aspect_ratio'], layout['cell_layout'])
-        if template:
-            layout['template_path'] = template['template_path']
-            layout['holes'] = template['holes']
-            layout['hole_count'] = template['hole_count']
-            layout['transformations'] = template.get('transformations', [])
-            layout['is_default'] = template.get('is_default', False)
-        else:
-            # Handle case where no matching template is found, though this should ideally not happen
-            layout['template_path'] = None
-            layout['holes'] = []
-            layout['hole_count'] = 0
-            layout['transformations'] = []
-
-    return JSONResponse(content=layouts)
+    body, etag = await to_thread(layout_catalog.get, request.app.state.db_manager)
+
+    # The kiosk reloads the main menu often, let it revalidate cheaply
+    return etag_response(request, body, etag)
 
 
 @router.get("/templates_by_layout")
 async def get_templates_by_layout(request: Request, aspect_ratio: str, cell_layout: str):
-    templates = request.app.state.db_manager.get_templates_by_layout(aspect_ratio, cell_layout)
+    templates = await request.app.state.db_manager.aio.get_templates_by_layout(aspect_ratio, cell_layout)
     return JSONResponse(content=templates)
 
 
@@ -136,9 +115,12 @@ async def save_template(request: Request):
     transformations = data.get('transformations')
 
     db_manager = request.app.state.db_manager
-    db_manager.add_template(template_path, hole_count, holes, aspect_ratio, cell_layout, transformations, is_default=False)
+    await db_manager.aio.add_template(template_path, hole_count, holes, aspect_ratio, cell_layout, transformations, is_default=False)
 
     # Ensure a default version of this new layout exists
     generate_template_if_not_exists(db_manager, aspect_ratio, cell_layout, GENERATED_TEMPLATES_DIR)
 
+    # New layouts and templates must show up on the main menu
+    layout_catalog.invalidate()
+
     return JSONResponse(content={"message": "Template saved successfully"})
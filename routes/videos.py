@@ -3,21 +3,24 @@ import uuid
 import json
 import subprocess
 import asyncio
+import logging
 import aiofiles
 import qrcode
-import numpy as np
-import moviepy.editor as mpe
 from urllib.parse import unquote
 from typing import List
-from PIL import Image
 from fastapi import APIRouter, Request, File, UploadFile, Form, HTTPException
 from fastapi.responses import JSONResponse
-from utils.common import get_ip_address
-from utils.image_processing import load_image_with_premultiplied_alpha
-from utils.drawing import draw_texts_on_pil
-from utils.video_processing import CustomProgressLogger
+from utils.common import get_ip_address, to_thread
+from utils.video_processing import CustomProgressLogger, parse_encode_profiles, select_encode_profile
+from utils.video_composition import build_composition_spec, choose_segment_count, render_composition
 from utils.session_manager import session_manager
+from utils.blob_store import blob_store
+from utils.retention import retention_manager
+from utils.metrics import metrics
+from utils.logging_config import session_id_var
+from utils.admission import admission
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 PORT = 8000
@@ -29,112 +32,27 @@ TEMP_DIR = "static/temp"
 # Ensure temp directory exists
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Keep references to fire-and-forget renders so they aren't garbage collected
+_background_renders = set()
 
-def is_animated_webp(path):
-    """Check if a WebP file contains animation frames."""
-    try:
-        with Image.open(path) as img:
-            return getattr(img, 'is_animated', False)
-    except Exception as e:
-        print(f"Error checking if WebP is animated: {e}")
-        return False
 
+def get_segment_count(setting, duration):
+    """Resolve the 'video_render_segments' setting for a clip of this length.
+
+    "auto" (the default) adapts to the clip length and available cores,
+    a number forces that many segments and 1 disables parallel rendering.
 
-def load_animated_webp(path, resize_to=None, rotate_deg=0, target_duration=None):
-    """
-    Load an animated WebP file as a MoviePy VideoClip with alpha channel.
-    
     Args:
-        path: Path to the WebP file
-        resize_to: Tuple (width, height) for resizing
-        rotate_deg: Rotation in degrees
-        target_duration: Target duration in seconds (for looping)
-    
-    Returns:
-        MoviePy VideoClip with transparency
+        setting: Stored value of the setting
+        duration: Clip length in seconds
     """
+    if str(setting).lower() == 'auto':
+        return choose_segment_count(duration)
     try:
-        frame_paths = []
-        
-        # Open WebP and extract frames
-        with Image.open(path) as img:
-            # Get frame duration (in milliseconds)
-            # Some WebP files don't have duration in info, try to get from first frame
-            duration_ms = img.info.get('duration', None)
-            
-            if duration_ms and duration_ms > 0:
-                fps = 1000 / duration_ms
-            else:
-                # Default to 10 FPS for WebP without duration metadata
-                fps = 10
-                print(f"WebP has no duration metadata, using default {fps} FPS")
-            
-            # Calculate how many times to repeat frames to cover target duration
-            single_loop_duration = img.n_frames / fps
-            if target_duration:
-                num_loops = int(np.ceil(target_duration / single_loop_duration))
-            else:
-                num_loops = 1
-            
-            # Extract frames and duplicate them for looping
-            for loop_num in range(num_loops):
-                for frame_num in range(img.n_frames):
-                    img.seek(frame_num)
-                    frame = img.convert('RGBA')
-                    
-                    # Apply resize if needed
-                    if resize_to:
-                        frame = frame.resize(resize_to, Image.Resampling.LANCZOS)
-                    
-                    # Apply rotation if needed (do this per-frame to allow defringing after)
-                    if rotate_deg != 0:
-                        frame = frame.rotate(rotate_deg, resample=Image.Resampling.BICUBIC, expand=True)
-                    
-                    # Remove white edges (defringing) - AFTER rotation
-                    # This fixes white halos introduced by rotation interpolation
-                    np_frame = np.array(frame).astype(float)
-                    alpha = np_frame[..., 3:4] / 255.0
-                    
-                    # For semi-transparent pixels, remove white matting
-                    # Rotation with interpolation creates semi-transparent edge pixels with white
-                    semi_transparent = (alpha > 0) & (alpha < 1)
-                    if np.any(semi_transparent):
-                        # Unmultiply white: new_color = (color - white * (1 - alpha)) / alpha
-                        rgb = np_frame[..., :3]
-                        white_contribution = 255 * (1 - alpha)
-                        
-                        # Only apply to semi-transparent pixels
-                        mask = semi_transparent.squeeze()
-                        rgb[mask] = np.clip((rgb[mask] - white_contribution[mask]) / alpha[mask], 0, 255)
-                        
-                        np_frame[..., :3] = rgb
-                    
-                    # Convert back to uint8 and PIL
-                    np_frame = np_frame.astype(np.uint8)
-                    frame_defringed = Image.fromarray(np_frame, mode='RGBA')
-                    
-                    # Save frame as temporary PNG
-                    frame_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}_l{loop_num}_f{frame_num}.png")
-                    frame_defringed.save(frame_path)
-                    frame_paths.append(frame_path)
-        
-        # Create video clip from image sequence with transparency
-        # ismask=False ensures this is treated as a regular RGBA clip, not a mask
-        clip = mpe.ImageSequenceClip(frame_paths, fps=fps, ismask=False)
-        
-        # Rotation already applied to individual frames, so skip clip rotation
-        
-        # Set exact duration to avoid extending beyond target
-        if target_duration:
-            clip = clip.set_duration(target_duration)
-        
-        return clip
-        
-    except Exception as e:
-        print(f"Error loading animated WebP: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+        return max(1, int(setting))
+    except ValueError:
+        logger.warning("Invalid video_render_segments setting '%s', rendering serially", setting)
+        return 1
 
 
 @router.post("/upload_video_chunk")
@@ -158,8 +76,9 @@ async def get_video_progress(request: Request, session_id: str):
     """Get the current progress of video composition"""
     # Access video_progress from app state
     video_progress = request.app.state.video_progress
-    progress = video_progress.get(session_id, 0)
-    print(f"[ProgressEndpoint] Session {session_id}: {progress}%")
+    progress = await video_progress.aget(session_id, 0)
+    session_id_var.set(session_id)
+    logger.debug("Progress poll for session %s: %s%%", session_id, progress)
     return JSONResponse(content={"progress": progress})
 
 
@@ -174,20 +93,27 @@ async def compose_video(
     template_path: str = Form(None),
     template_file: UploadFile = File(None),
     is_inverted: bool = Form(False),
-    session_id: str = Form(None)  # Session ID for progress tracking
+    session_id: str = Form(None),  # Session ID for progress tracking
+    filters: str = Form(None),
+    encode_profile: str = Form(None),  # Named encode profile, defaults to "share"
+    include_archive: bool = Form(False)  # Also render the "archive" profile in the background
 ):
+    db_manager = request.app.state.db_manager
+    # An uploaded template is only needed while rendering, so its blob
+    # reference is dropped once the renders that use it are done
+    template_hashes = []
     try:
         # Generate session ID if not provided
         if not session_id:
             session_id = str(uuid.uuid4())
+        # Tags this request's log lines, including those from the render thread
+        session_id_var.set(session_id)
 
         # --- Handle template file or path ---
         if template_file:
-            temp_filename = f"{uuid.uuid4()}.png"
-            base_template_path = os.path.join(UPLOAD_DIR, temp_filename)
-            async with aiofiles.open(base_template_path, "wb") as out_file:
-                content = await template_file.read()
-                await out_file.write(content)
+            content = await template_file.read()
+            template_hash, base_template_path = await blob_store.put(db_manager, content, ".png")
+            template_hashes.append(template_hash)
         elif template_path:
             # Unquote template path
             decoded_path = unquote(template_path.lstrip("/"))
@@ -241,201 +167,117 @@ async def compose_video(
                     raise HTTPException(status_code=400, detail=f"Invalid or corrupted video file: {path}")
             return path
 
-        # --- Load and validate video clips ---
-        clips = []
+        # --- Validate video clips ---
+        full_video_paths = []
         for path in video_paths:
             # Unquote video path
             decoded_path = unquote(path.lstrip("/"))
             full_path = os.path.join(os.getcwd(), decoded_path)
-            full_path = fix_webm_metadata(full_path)  # ensure reindexed
-            full_path = validate_video(full_path)
-            clips.append(mpe.VideoFileClip(full_path))
-
-        min_duration = min(clip.duration for clip in clips)
-        clips = [clip.subclip(clip.duration - min_duration) for clip in clips]
-
-        # --- Template prep ---
-        template_np = load_image_with_premultiplied_alpha(base_template_path)
-        height, width, _ = template_np.shape
-        background_clip = mpe.ColorClip(size=(width, height), color=(0, 0, 0), duration=min_duration)
-        template_clip = mpe.ImageClip(template_np, transparent=True).set_duration(min_duration)
-
-        # --- Place videos ---
-        video_clips = []
-        for i, clip in enumerate(clips):
-            hole = hole_data[i]
-            transform = transform_data[i]
-            scale = transform.get("scale", 1)
-            rotation = -transform.get("rotation", 0)
-            new_w = int(hole["w"] * scale)
-            new_h = int(hole["h"] * scale)
-
-            # Center Crop Logic to prevent stretching
-            target_aspect_ratio = new_w / new_h
-            video_w, video_h = clip.w, clip.h
-            video_aspect_ratio = video_w / video_h
-
-            if video_aspect_ratio > target_aspect_ratio:
-                # Video is wider than target: Crop width
-                crop_h = video_h
-                crop_w = crop_h * target_aspect_ratio
-                x1 = (video_w - crop_w) / 2
-                y1 = 0
-            else:
-                # Video is taller than target: Crop height
-                crop_w = video_w
-                crop_h = crop_w / target_aspect_ratio
-                x1 = 0
-                y1 = (video_h - crop_h) / 2
-            
-            # Apply crop and then resize
-            cropped_clip = clip.crop(x1=x1, y1=y1, width=crop_w, height=crop_h)
-            resized_clip = cropped_clip.resize((new_w, new_h)).rotate(rotation)
-
-            if is_inverted:
-                resized_clip = resized_clip.fx(mpe.vfx.mirror_x)
-            pos_x = hole["x"] + (hole["w"] - resized_clip.w) // 2
-            pos_y = hole["y"] + (hole["h"] - resized_clip.h) // 2
-            video_clips.append(resized_clip.set_position((pos_x, pos_y)).set_duration(min_duration))
+            with metrics.span("compose_video", "validate"):
+                full_path = fix_webm_metadata(full_path)  # ensure reindexed
+                full_path = validate_video(full_path)
+            full_video_paths.append(full_path)
 
         # --- Decorations (Stickers & Text unified) ---
         sticker_data_list = json.loads(stickers)
         texts_data_list = json.loads(texts) if texts else []
-        
+
         for s in sticker_data_list:
             s['type'] = 'sticker'
+            # Unquote sticker path
+            decoded_path = unquote(s["path"].lstrip("/"))
+            s['full_path'] = os.path.join(os.getcwd(), decoded_path)
         for t in texts_data_list:
             t['type'] = 'text'
 
         decorations = sticker_data_list + texts_data_list
         decorations.sort(key=lambda x: x.get('id', 0))
 
-        deco_clips = []
-        for deco in decorations:
-            if deco['type'] == 'sticker':
-                sticker = deco
-                 # Unquote sticker path
-                decoded_path = unquote(sticker["path"].lstrip("/"))
-                sticker_path = os.path.join(os.getcwd(), decoded_path)
-                resize_size = (sticker["width"], sticker["height"])
-                rotation = -float(sticker.get("rotation", 0))
-
-                # Check if the sticker is an animated WebP
-                if sticker_path.lower().endswith('.webp') and is_animated_webp(sticker_path):
-                    # Load as animated video clip with looping built-in
-                    sticker_clip = load_animated_webp(
-                        sticker_path,
-                        resize_to=resize_size,
-                        rotate_deg=rotation,
-                        target_duration=min_duration
-                    )
-                    
-                    if sticker_clip:
-                        # Get actual dimensions after rotation
-                        clip_w, clip_h = sticker_clip.size
-                        
-                        # Calculate centered position to account for rotation expansion
-                        pos_x = int(sticker["x"]) - (clip_w - int(sticker["width"])) // 2
-                        pos_y = int(sticker["y"]) - (clip_h - int(sticker["height"])) // 2
-                        
-                        # Set position
-                        sticker_clip = sticker_clip.set_position((pos_x, pos_y))
-                        
-                        deco_clips.append(sticker_clip)
-                    else:
-                        # Fallback to static image if animated loading fails
-                        print(f"Failed to load animated WebP, falling back to static: {sticker_path}")
-                        sticker_np = load_image_with_premultiplied_alpha(
-                            sticker_path,
-                            resize_to=resize_size,
-                            rotate_deg=rotation
-                        )
-                        s_h, s_w, _ = sticker_np.shape
-                        pos_x = int(sticker["x"]) - (s_w - int(sticker["width"])) // 2
-                        pos_y = int(sticker["y"]) - (s_h - int(sticker["height"])) // 2
-                        
-                        sticker_clip = (
-                            mpe.ImageClip(sticker_np, transparent=True)
-                            .set_duration(min_duration)
-                            .set_position((pos_x, pos_y))
-                        )
-                        deco_clips.append(sticker_clip)
-                else:
-                    # Static image (original behavior)
-                    sticker_np = load_image_with_premultiplied_alpha(
-                        sticker_path,
-                        resize_to=resize_size,
-                        rotate_deg=rotation
-                    )
-
-                    # Calculate centered position to account for rotation expansion
-                    s_h, s_w, _ = sticker_np.shape
-                    pos_x = int(sticker["x"]) - (s_w - int(sticker["width"])) // 2
-                    pos_y = int(sticker["y"]) - (s_h - int(sticker["height"])) // 2
-
-                    sticker_clip = (
-                        mpe.ImageClip(sticker_np, transparent=True)
-                        .set_duration(min_duration)
-                        .set_position((pos_x, pos_y))
-                    )
-                    deco_clips.append(sticker_clip)
-
-            elif deco['type'] == 'text':
-                
-                # Create a full-size transparent image for this text layer
-                layer_pil = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-                db_manager = request.app.state.db_manager
-                
-                # Pass list containing just this text
-                layer_pil = draw_texts_on_pil(layer_pil, [deco], db_manager)
-                layer_np = np.array(layer_pil)
-                
-                text_clip = (
-                    mpe.ImageClip(layer_np, transparent=True)
-                    .set_duration(min_duration)
-                    .set_position((0, 0)) # Position is embedded in the full-frame layer
-                )
-                deco_clips.append(text_clip)
-
-        # --- Combine all layers ---
-        final_clip = mpe.CompositeVideoClip(
-            [background_clip] + video_clips + [template_clip] + deco_clips,
-            size=(width, height),
-        )
+        with metrics.span("compose_video", "spec"):
+            spec = build_composition_spec(
+                base_template_path, full_video_paths, hole_data, transform_data,
+                decorations, is_inverted, db_manager.db_path,
+                filters=json.loads(filters) if filters else None
+            )
 
         # --- Write output ---
         result_filename = f"{uuid.uuid4()}.mp4"
         result_path = os.path.join(RESULTS_DIR, result_filename)
-        
+
         # Use custom logger to track progress (pass video_progress from app state)
         video_progress = request.app.state.video_progress
-        logger = CustomProgressLogger(session_id, video_progress)
-        
-        # Run video composition in background thread to avoid blocking progress requests
+        progress_logger = CustomProgressLogger(session_id, video_progress)
+
+        # Read once and shared by the share and archive renditions
+        profiles = parse_encode_profiles(await db_manager.aio.get_setting('video_encode_profiles'))
+        profile = select_encode_profile(profiles, encode_profile)
+        render_archive = include_archive and encode_profile != "archive"
+        segments = get_segment_count(
+            await db_manager.aio.get_setting('video_render_segments', 'auto'), spec["duration"]
+        )
+
+        def update_progress(percentage):
+            video_progress[session_id] = percentage
+
+        # Run video composition in background thread to avoid blocking progress requests.
+        # Each render gets its own temp directory, removed when it finishes,
+        # so concurrent renders never delete each other's frames
         def compose_video_sync():
-            final_clip.write_videofile(result_path, codec="libx264", fps=24, logger=logger)
+            with metrics.track("video"), metrics.span("compose_video", "render"), \
+                    retention_manager.job_temp_dir(session_id) as job_temp_dir:
+                render_composition(
+                    spec, profile, result_path, db_manager,
+                    segments=segments, logger=progress_logger, on_progress=update_progress,
+                    temp_dir=job_temp_dir
+                )
             video_progress[session_id] = 100
-            
-            # Cleanup temp files after successful composition
-            try:
-                for file in os.listdir(TEMP_DIR):
-                    if file.endswith('.png'):
-                        file_path = os.path.join(TEMP_DIR, file)
-                        os.remove(file_path)
-                print(f"Cleaned up temp files for session {session_id}")
-            except Exception as e:
-                print(f"Warning: Failed to cleanup temp files: {e}")
-        
+
         # Execute in thread pool to not block the event loop
-        await asyncio.to_thread(compose_video_sync)
+        await to_thread(compose_video_sync)
+
+        if render_archive:
+            archive_filename = f"{os.path.splitext(result_filename)[0]}_archive.mp4"
+            archive_path = os.path.join(RESULTS_DIR, archive_filename)
+            archive_profile = select_encode_profile(profiles, "archive")
+
+            def compose_archive_sync():
+                with metrics.track("archive"), metrics.span("compose_video", "archive"), \
+                        retention_manager.job_temp_dir(session_id) as job_temp_dir:
+                    render_composition(spec, archive_profile, archive_path, db_manager,
+                                       segments=segments, temp_dir=job_temp_dir)
+
+            # The background render holds the template from here on
+            archive_hashes = template_hashes[:]
+            template_hashes.clear()
+
+            async def render_archive_in_background():
+                try:
+                    # Lowest priority: waits whenever previews or renders need the CPU
+                    async with admission.slot("archive"):
+                        await to_thread(compose_archive_sync)
+                    await session_manager.update_session(
+                        session_id, {"video_archive_path": f"/static/results/{archive_filename}"}
+                    )
+                    logger.info("Archive rendition ready for session %s", session_id)
+                except Exception as e:
+                    logger.error("Failed to render archive rendition for session %s: %s", session_id, e)
+                finally:
+                    if archive_hashes:
+                        await db_manager.aio.release_blob_references(archive_hashes)
+
+            # The share rendition is already done, so the QR code doesn't wait on this
+            task = asyncio.create_task(render_archive_in_background())
+            _background_renders.add(task)
+            task.add_done_callback(_background_renders.discard)
 
         # --- Generate QR code ---
         ip_address = get_ip_address()
         full_url = f"http://{ip_address}:{PORT}/static/results/{result_filename}"
-        qr_img = qrcode.make(full_url)
-        qr_filename = f"qr_{uuid.uuid4()}.png"
-        qr_path = os.path.join(RESULTS_DIR, qr_filename)
-        qr_img.save(qr_path)
+        with metrics.span("compose_video", "qr"):
+            qr_img = qrcode.make(full_url)
+            qr_filename = f"qr_{uuid.uuid4()}.png"
+            qr_path = os.path.join(RESULTS_DIR, qr_filename)
+            qr_img.save(qr_path)
 
         # --- Update Session Metadata ---
         try:
@@ -444,9 +286,9 @@ async def compose_video(
                 "video_qr_path": f"/static/results/{qr_filename}"
             }
             await session_manager.update_session(session_id, updates)
-            print(f"Updated session {session_id} with video result.")
+            logger.info("Updated session %s with video result", session_id)
         except Exception as e:
-            print(f"Failed to update session metadata with video path: {e}")
+            logger.error("Failed to update session metadata with video path: %s", e)
 
         return JSONResponse(
             content={
@@ -458,3 +300,6 @@ async def compose_video(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to compose video: {e}")
+    finally:
+        if template_hashes:
+            await db_manager.aio.release_blob_references(template_hashes)
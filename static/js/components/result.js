@@ -326,6 +326,12 @@ window.eventBus.on('app:init', (appState) => {
           d.append('transformations', JSON.stringify(appState.templateInfo.transformations));
           d.append('is_inverted', appState.isStreamInverted);
 
+          // Filters, so the video matches the printed strip
+          const videoFilters = data.filters !== undefined ? data.filters : appState.filters;
+          if (videoFilters) {
+            d.append('filters', JSON.stringify(videoFilters));
+          }
+
           // Videos
           // For past sessions, appState is mock. data.videos has paths from session JSON.
           for (const video_path of data.videos) {
@@ -336,14 +336,67 @@ window.initReviewDecorations = (appState, callbacks) => {
         return ax.length - bx.length;
     }
 
+    // Draws one sprite from a sticker atlas, scaled to fit a size x size box
+    function createSprite(atlas, sprite, size) {
+        const scale = size / Math.max(sprite.w, sprite.h);
+        const el = document.createElement('div');
+        el.className = 'sticker-sprite';
+        el.style.width = `${sprite.w * scale}px`;
+        el.style.height = `${sprite.h * scale}px`;
+        el.style.backgroundImage = `url('${atlas.sheet}')`;
+        el.style.backgroundSize = `${atlas.width * scale}px ${atlas.height * scale}px`;
+        el.style.backgroundPosition = `-${sprite.x * scale}px -${sprite.y * scale}px`;
+        return el;
+    }
+
+    function createStickerItem(entry, atlas) {
+        const { sprite, ...s } = entry;
+        const i = document.createElement('div');
+        i.className = 'sticker-item';
+
+        const m = document.createElement('img');
+        m.draggable = false;
+
+        if (sprite) {
+            // The still comes from the shared sheet; animated stickers fetch
+            // their small looping preview only on hover
+            const still = createSprite(atlas, sprite, 70);
+            i.appendChild(still);
+            if (s.preview_path) {
+                i.addEventListener('mouseenter', () => {
+                    if (!m.parentNode) {
+                        m.src = s.preview_path;
+                        i.appendChild(m);
+                    }
+                    still.style.display = 'none';
+                    m.style.display = '';
+                });
+                i.addEventListener('mouseleave', () => {
+                    m.style.display = 'none';
+                    still.style.display = '';
+                });
+            }
+        } else {
+            m.src = s.thumbnail_path || s.sticker_path;
+            if (s.thumbnail_2x_path) {
+                m.srcset = `${s.thumbnail_path} 1x, ${s.thumbnail_2x_path} 2x`;
+            }
+            i.appendChild(m);
+        }
+
+        // Click handler works immediately
+        i.addEventListener('click', () => addStickerToCenter(s));
+        return i;
+    }
+
     async function loadStickerGallery(selectedCategory = null, shouldUpdateHeader = true) {
         try {
-            const [stickersResponse, categoriesResponse] = await Promise.all([
-                fetch('/stickers'),
-                fetch('/sticker_categories')
+            // One sprite sheet per drawer view instead of one request per thumbnail
+            const [atlasResponse, categoriesResponse] = await Promise.all([
+                fetch(`/sticker_atlas?category=${encodeURIComponent(selectedCategory || '')}`),
+                selectedCategory ? null : fetch('/sticker_categories')
             ]);
-            const stickers = await stickersResponse.json();
-            const fetchedCategories = await categoriesResponse.json();
+            const atlas = await atlasResponse.json();
 
             const stickerGallery = document.getElementById('sticker-gallery');
             const categoryGallery = document.getElementById('sticker-category-gallery');
@@ -357,34 +410,8 @@ window.initReviewDecorations = (appState, callbacks) => {
                 categoryGallery.dataset.category = selectedCategory;
 
                 // Sort stickers naturally by filename
-                const categoryStickers = stickers.filter(s => s.category === selectedCategory).sort(naturalSort);
-
-                categoryStickers.forEach((s) => {
-                    const i = document.createElement('div');
-                    i.className = 'sticker-item';
-                    const m = document.createElement('img');
-                    m.draggable = false;
-
-                    // Use thumbnail if available, otherwise use original
-                    const thumbnailSrc = s.thumbnail_path || s.sticker_path;
-                    m.src = thumbnailSrc;
-                    m.dataset.thumbnailSrc = thumbnailSrc;
-                    m.dataset.animatedSrc = s.sticker_path;
-
-                    // Hover to animate (only if thumbnail exists)
-                    if (s.thumbnail_path) {
-                        i.addEventListener('mouseenter', () => {
-                            m.src = m.dataset.animatedSrc;
-                        });
-                        i.addEventListener('mouseleave', () => {
-                            m.src = m.dataset.thumbnailSrc;
-                        });
-                    }
-
-                    // Click handler works immediately
-                    i.addEventListener('click', () => addStickerToCenter(s));
-                    i.appendChild(m);
-                    stickerGallery.appendChild(i);
+                atlas.stickers.sort(naturalSort).forEach((s) => {
+                    stickerGallery.appendChild(createStickerItem(s, atlas));
                 });
 
                 // Update panel header with category name and back button
@@ -400,8 +427,9 @@ window.initReviewDecorations = (appState, callbacks) => {
                 stickerGallery.style.display = 'none';
                 delete categoryGallery.dataset.category;
 
-                const stickerCategories = stickers.map(s => s.category).filter(Boolean);
-                const allCategories = [...new Set([...fetchedCategories, ...stickerCategories])];
+                const fetchedCategories = await categoriesResponse.json();
+                const covers = new Map(atlas.categories.map(c => [c.name, c.sprite]));
+                const allCategories = [...new Set([...fetchedCategories, ...covers.keys()])];
 
                 const pastelColors = [
                     'rgba(255, 204, 204, 1)',  // Light Pink
@@ -419,12 +447,10 @@ window.initReviewDecorations = (appState, callbacks) => {
                     // Apply pastel background color (rotational)
                     categoryItem.style.backgroundColor = pastelColors[index % pastelColors.length];
 
-                    // Find first sticker in this category for the icon
-                    const firstSticker = stickers.find(s => s.category === category);
-                    if (firstSticker) {
-                        const icon = document.createElement('img');
-                        icon.src = firstSticker.sticker_path;
-                        categoryItem.appendChild(icon);
+                    // The newest sticker in this category is the icon
+                    const cover = covers.get(category);
+                    if (cover) {
+                        categoryItem.appendChild(createSprite(atlas, cover, 32));
                     }
 
                     const label = document.createElement('span');
@@ -436,34 +462,8 @@ window.initReviewDecorations = (appState, callbacks) => {
                 });
 
                 // Sort uncategorized stickers naturally by filename
-                const uncategorizedStickers = stickers.filter(s => !s.category).sort(naturalSort);
-
-                uncategorizedStickers.forEach((s) => {
-                    const i = document.createElement('div');
-                    i.className = 'sticker-item';
-                    const m = document.createElement('img');
-                    m.draggable = false;
-
-                    // Use thumbnail if available, otherwise use original
-                    const thumbnailSrc = s.thumbnail_path || s.sticker_path;
-                    m.src = thumbnailSrc;
-                    m.dataset.thumbnailSrc = thumbnailSrc;
-                    m.dataset.animatedSrc = s.sticker_path;
-
-                    // Hover to animate (only if thumbnail exists)
-                    if (s.thumbnail_path) {
-                        i.addEventListener('mouseenter', () => {
-                            m.src = m.dataset.animatedSrc;
-                        });
-                        i.addEventListener('mouseleave', () => {
-                            m.src = m.dataset.thumbnailSrc;
-                        });
-                    }
-
-                    // Click handler works immediately
-                    i.addEventListener('click', () => addStickerToCenter(s));
-                    i.appendChild(m);
-                    categoryGallery.appendChild(i);
+                atlas.stickers.sort(naturalSort).forEach((s) => {
+                    categoryGallery.appendChild(createStickerItem(s, atlas));
                 });
 
                 // Update panel header to show "Stickers" (no back button)
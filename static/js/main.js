@@ -9,6 +9,11 @@ document.addEventListener('DOMContentLoaded', () => {
         },
     };
 
+    // The server-assembled shell inlines component markup and provides
+    // content-hashed URLs for static assets
+    const shell = window.APP_SHELL || { assets: {} };
+    const assetUrl = (url) => shell.assets[url] || url;
+
     // Loads the HTML for each component into the main index.html file
     async function loadHtmlComponents() {
         const components = [
@@ -26,12 +31,17 @@ document.addEventListener('DOMContentLoaded', () => {
 
         for (const component of components) {
             try {
-                const response = await fetch(component.url);
+                const container = document.getElementById(component.id);
+                // Already inlined (with its stylesheet linked) by the server
+                if (container.hasAttribute('data-inlined')) {
+                    continue;
+                }
+                const response = await fetch(assetUrl(component.url));
                 const html = await response.text();
-                document.getElementById(component.id).innerHTML = html;
+                container.innerHTML = html;
 
                 if (component.css) {
-                    await loadStyleSheet(component.css, component.id);
+                    await loadStyleSheet(assetUrl(component.css), component.id);
                 }
             } catch (error) {
                 console.error(`Error loading component or CSS for ${component.id}:`, error);
@@ -63,7 +73,7 @@ document.addEventListener('DOMContentLoaded', () => {
             try {
                 await new Promise((resolve, reject) => {
                     const scriptElement = document.createElement('script');
-                    scriptElement.src = script;
+                    scriptElement.src = assetUrl(script);
                     scriptElement.onload = resolve;
                     scriptElement.onerror = reject;
                     document.body.appendChild(scriptElement);
@@ -0,0 +1,286 @@
+import os
+import json
+import math
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextlib
+from utils.metrics import metrics
+from utils.workers import worker_count
+
+logger = logging.getLogger(__name__)
+
+# Expensive endpoints and the lane each one is admitted through
+LANES_BY_PATH = {
+    "/apply_filters_to_image": "preview",
+    "/remove_background": "preview",
+    "/compose_image": "compose_image",
+    "/compose_video": "compose_video",
+    "/process_and_stylize_image": "stylize",
+}
+
+# One lane per kind of work. `priority` orders waiters when CPU slots free
+# up (lower goes first), so previews a customer is staring at overtake
+# final renders, and those overtake archive renditions nobody waits for.
+# A lane runs at most `max_concurrent` requests and queues at most
+# `max_queue` more (None for no bound) for up to `max_wait_seconds` (None
+# to wait indefinitely); beyond that requests get a 503. Lanes with `cpu`
+# set also share the global CPU slots. Overridable through the
+# 'admission_limits' setting, e.g. {"compose_video": {"max_queue": 2}}.
+DEFAULT_ADMISSION_LIMITS = {
+    "preview": {"priority": 0, "max_concurrent": 4, "max_queue": 16, "max_wait_seconds": 10, "cpu": True},
+    "compose_image": {"priority": 1, "max_concurrent": 2, "max_queue": 8, "max_wait_seconds": 30, "cpu": True},
+    "compose_video": {"priority": 2, "max_concurrent": 1, "max_queue": 4, "max_wait_seconds": 120, "cpu": True},
+    "archive": {"priority": 3, "max_concurrent": 1, "max_queue": None, "max_wait_seconds": None, "cpu": True},
+    # Waits on a remote API rather than the CPU
+    "stylize": {"priority": 1, "max_concurrent": 4, "max_queue": 8, "max_wait_seconds": 30, "cpu": False},
+}
+# CPU-bound requests running at once across all lanes, for the whole
+# machine; each worker process gets its share
+DEFAULT_CPU_SLOTS = max(2, os.cpu_count() or 2)
+# Weight of the newest sample in each lane's average service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+def get_admission_limits(db_manager):
+    """Return the lane limits, merging any overrides stored in settings.
+
+    Args:
+        db_manager: DatabaseManager instance
+
+    Returns:
+        Tuple of (lane name -> limits, CPU slot count)
+    """
+    limits = {name: dict(values) for name, values in DEFAULT_ADMISSION_LIMITS.items()}
+    cpu_slots = max(1, DEFAULT_CPU_SLOTS // worker_count())
+    stored = db_manager.get_setting('admission_limits')
+    if stored:
+        try:
+            for name, values in json.loads(stored).items():
+                if name == "cpu_slots":
+                    cpu_slots = max(1, int(values))
+                elif name in limits:
+                    limits[name].update(values)
+        except (ValueError, AttributeError, TypeError) as e:
+            logger.warning("Ignoring invalid admission_limits setting: %s", e)
+    return limits, cpu_slots
+
+
+class AdmissionRejected(Exception):
+    """A lane is full, or a request waited too long for a slot."""
+    def __init__(self, lane, reason, retry_after):
+        super().__init__(f"{lane} lane {reason}")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Lane:
+    def __init__(self, name, limits):
+        self.name = name
+        self.priority = limits["priority"]
+        self.max_concurrent = max(1, int(limits["max_concurrent"]))
+        self.max_queue = limits.get("max_queue")
+        self.max_wait_seconds = limits.get("max_wait_seconds")
+        self.cpu = limits.get("cpu", True)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.service_seconds = None  # moving average of time holding a slot
+
+
+class AdmissionController:
+    """Bounded, prioritized admission to the expensive endpoints.
+
+    All state lives on the event loop thread, so no locks are needed.
+    Waiters sit in one heap ordered by lane priority, then arrival; when a
+    slot frees up the first waiter whose lane has room is let in.
+    """
+    def __init__(self, limits=None, cpu_slots=DEFAULT_CPU_SLOTS):
+        self._seq = itertools.count()
+        self._waiters = []  # heap of (priority, seq, lane, future)
+        self.configure(limits or DEFAULT_ADMISSION_LIMITS, cpu_slots)
+
+    def configure(self, limits, cpu_slots=DEFAULT_CPU_SLOTS):
+        """Replace the lane limits; counts of running requests carry over."""
+        lanes = {name: _Lane(name, values) for name, values in limits.items()}
+        for name, lane in getattr(self, "lanes", {}).items():
+            if name in lanes:
+                lanes[name].active = lane.active
+                lanes[name].waiting = lane.waiting
+        self.lanes = lanes
+        self.cpu_slots = cpu_slots
+        self.cpu_active = sum(lane.active for lane in lanes.values() if lane.cpu)
+
+    def _has_room(self, lane):
+        return lane.active < lane.max_concurrent and (not lane.cpu or self.cpu_active < self.cpu_slots)
+
+    def _grantable(self, entry):
+        """Whether a queued waiter could be let in right now."""
+        return not entry[3].done() and self._has_room(entry[2])
+
+    def _take(self, lane):
+        lane.active += 1
+        lane.admitted += 1
+        if lane.cpu:
+            self.cpu_active += 1
+
+    def retry_after(self, lane):
+        """Seconds until the lane's queue has likely drained, at least 1."""
+        service = lane.service_seconds or 1.0
+        return max(1, math.ceil(service * (lane.waiting + 1) / lane.max_concurrent))
+
+    def _reject(self, lane, reason):
+        lane.rejected += 1
+        if metrics.enabled:
+            metrics.counter(
+                "photobooth_admission_rejected_total", "Requests turned away by admission control", ["lane", "reason"]
+            ).inc(lane=lane.name, reason=reason)
+        return AdmissionRejected(lane.name, reason, self.retry_after(lane))
+
+    async def acquire(self, lane_name):
+        """Wait for a slot in a lane.
+
+        Raises:
+            AdmissionRejected: If the lane's queue is full or the wait timed out
+        """
+        lane = self.lanes[lane_name]
+        # Only jump straight in when nobody of the same or higher priority is
+        # waiting who could take the slot instead. Waiters held back by their
+        # own lane's limit don't count, or a full video lane would stall previews
+        if self._has_room(lane) and not any(
+            entry[0] <= lane.priority and self._grantable(entry) for entry in self._waiters
+        ):
+            self._take(lane)
+            return
+        if lane.max_queue is not None and lane.waiting >= lane.max_queue:
+            raise self._reject(lane, "queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane.priority, next(self._seq), lane, future))
+        lane.waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), lane.max_wait_seconds)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Granted at the same moment the wait ran out; keep the slot
+                return
+            future.cancel()
+            raise self._reject(lane, "timeout")
+        except asyncio.CancelledError:
+            # The client went away; hand the slot on if it had been granted
+            if future.done() and not future.cancelled():
+                self.release(lane_name)
+            else:
+                future.cancel()
+            raise
+        finally:
+            lane.waiting -= 1
+
+    def release(self, lane_name, service_seconds=None):
+        lane = self.lanes[lane_name]
+        lane.active -= 1
+        if lane.cpu:
+            self.cpu_active -= 1
+        if service_seconds is not None:
+            if lane.service_seconds is None:
+                lane.service_seconds = service_seconds
+            else:
+                lane.service_seconds += SERVICE_TIME_SMOOTHING * (service_seconds - lane.service_seconds)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant freed slots to the best waiters whose lanes have room.
+
+        A waiter whose own lane is full is passed over, not waited on, so it
+        never holds back lower-priority lanes.
+        """
+        skipped = []
+        while self._waiters:
+            entry = heapq.heappop(self._waiters)
+            priority, _, lane, future = entry
+            if future.done():
+                continue
+            if self._grantable(entry):
+                self._take(lane)
+                future.set_result(None)
+            else:
+                skipped.append(entry)
+                if lane.cpu and self.cpu_active >= self.cpu_slots:
+                    # CPU is saturated; only non-CPU lanes could still go
+                    skipped.extend(e for e in self._waiters if e[2].cpu)
+                    self._waiters = [e for e in self._waiters if not e[2].cpu]
+                    heapq.heapify(self._waiters)
+        for entry in skipped:
+            heapq.heappush(self._waiters, entry)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, lane_name):
+        """Hold a slot in a lane for the duration of the block."""
+        await self.acquire(lane_name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(lane_name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """Running and queued requests per lane, for operators sizing hardware."""
+        return {
+            "cpu_slots": self.cpu_slots,
+            "cpu_active": self.cpu_active,
+            "lanes": {
+                name: {
+                    "priority": lane.priority,
+                    "active": lane.active,
+                    "waiting": lane.waiting,
+                    "max_concurrent": lane.max_concurrent,
+                    "max_queue": lane.max_queue,
+                    "admitted": lane.admitted,
+                    "rejected": lane.rejected,
+                    "avg_service_seconds": round(lane.service_seconds, 3) if lane.service_seconds else None,
+                }
+                for name, lane in self.lanes.items()
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """Admits requests to the expensive endpoints through their lanes.
+
+    Runs before the request body is read, so a rejected upload costs
+    little. Rejections are 503s with a Retry-After header.
+    """
+    def __init__(self, app, controller=None):
+        self.app = app
+        self.controller = controller or admission
+
+    async def __call__(self, scope, receive, send):
+        lane = LANES_BY_PATH.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if lane is None or lane not in self.controller.lanes:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            async with self.controller.slot(lane):
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            logger.warning("Rejected %s: %s, retry after %ds", scope["path"], e, e.retry_after)
+            body = json.dumps({"detail": f"Server busy ({e.reason}), try again shortly"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(e.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+
+
+# Global instance
+admission = AdmissionController()
@@ -0,0 +1,132 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+INDEX_PATH = "templates/index.html"
+STATIC_DIR = "static"
+# Folders whose files get a ?v=<hash> entry in the asset manifest
+VERSIONED_DIRS = ("js", "css", "components", "icons", "img")
+
+# Screen containers and their markup/stylesheet, as loaded by main.js
+# (keep the two lists in sync)
+COMPONENTS = [
+    ("photo-hanging-gallery", "components/photo_hanging_gallery.html", "css/photo_hanging_gallery.css"),
+    ("main-menu", "components/main_menu.html", "css/main_menu.css"),
+    ("app-content", "components/photo_taking_screen.html", "css/photo_taking_screen.css"),
+    ("review-screen", "components/review_screen.html", "css/review_screen.css"),
+    ("result-screen", "components/result_screen.html", "css/result_screen.css"),
+    ("template-edit-screen", "components/template_edit_screen.html", "css/template_edit_screen.css"),
+    ("crop-modal-container", "components/shared/crop_modal.html", "css/shared/crop_modal.css"),
+    ("color-picker-modal-container", "components/shared/color_picker_modal.html", "css/shared/color_picker_modal.css"),
+    ("text-edit-modal-container", "components/shared/text_edit.html", "css/shared/text_edit.css"),
+    ("settings-modal-container", "components/settings_modal.html", "css/settings_modal.css"),
+]
+
+STATIC_REF_PATTERN = re.compile(r'(src|href)="(/static/[^"?#]+)"')
+
+
+class AppShell:
+    """The index page, assembled once and kept in memory.
+
+    Component markup is inlined into its container, component stylesheets
+    are linked from the head, and every /static reference carries a content
+    hash (?v=...) so the static layer can cache it as immutable. The asset
+    manifest is embedded for main.js, which loads the component scripts.
+    In dev mode the shell is rebuilt whenever a source file changes.
+    """
+    def __init__(self, index_path=INDEX_PATH, static_dir=STATIC_DIR, dev_mode=False):
+        self.index_path = index_path
+        self.static_dir = static_dir
+        self.dev_mode = dev_mode
+        self._body = None
+        self._etag = None
+        self._sources = {}  # path -> mtime of everything the shell was built from
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the shell as (HTML body bytes, ETag)."""
+        with self._lock:
+            if self._body is None or (self.dev_mode and self._changed()):
+                self._build()
+            return self._body, self._etag
+
+    def cache_bytes(self):
+        """Size of the cached shell body, 0 before it is built."""
+        return len(self._body or b"")
+
+    def build(self):
+        """Assemble the shell now, e.g. at startup."""
+        with self._lock:
+            self._build()
+
+    def _changed(self):
+        for path, mtime in self._sources.items():
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        # New files only matter if they are versioned assets
+        return self._versioned_files() != {p for p in self._sources if p != self.index_path}
+
+    def _versioned_files(self):
+        files = set()
+        for subdir in VERSIONED_DIRS:
+            for root, dirs, filenames in os.walk(os.path.join(self.static_dir, subdir)):
+                files.update(os.path.join(root, f) for f in filenames if not f.endswith(".gz"))
+        return files
+
+    def _build(self):
+        sources = {self.index_path: os.stat(self.index_path).st_mtime}
+        manifest = {}
+        for path in sorted(self._versioned_files()):
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:12]
+            sources[path] = os.stat(path).st_mtime
+            url = "/" + path.replace(os.sep, "/")
+            manifest[url] = f"{url}?v={digest}"
+
+        def version(match):
+            return f'{match.group(1)}="{manifest.get(match.group(2), match.group(2))}"'
+
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            html = f.read()
+
+        stylesheets = []
+        preloads = []
+        for container_id, component_path, css_path in COMPONENTS:
+            component_file = os.path.join(self.static_dir, component_path)
+            if not os.path.exists(component_file):
+                continue
+            with open(component_file, 'r', encoding='utf-8') as f:
+                markup = f.read()
+            html, count = re.subn(
+                rf'<div id="{re.escape(container_id)}"([^>]*)></div>',
+                lambda m: f'<div id="{container_id}"{m.group(1)} data-inlined>{markup}</div>',
+                html, count=1
+            )
+            if count and css_path:
+                stylesheets.append(
+                    f'    <link rel="stylesheet" href="/static/{css_path}" data-component-id="{container_id}">\n'
+                )
+
+        # Let the browser fetch component scripts in parallel while main.js
+        # works through them in order
+        for url in manifest:
+            if url.startswith("/static/js/components/") and url.endswith(".js"):
+                preloads.append(f'    <link rel="preload" as="script" href="{url}">\n')
+
+        boot = json.dumps({"assets": manifest}, separators=(",", ":"))
+        head_extra = "".join(stylesheets) + "".join(preloads) + f"    <script>window.APP_SHELL = {boot};</script>\n"
+        html = html.replace("</head>", head_extra + "</head>", 1)
+        html = STATIC_REF_PATTERN.sub(version, html)
+
+        self._body = html.encode('utf-8')
+        self._etag = f'"{hashlib.sha1(self._body).hexdigest()}"'
+        self._sources = sources
+
+
+# Global instance
+app_shell = AppShell()
@@ -0,0 +1,220 @@
+import os
+import hashlib
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from routes.stickers import generate_thumbnail
+from utils.state_backend import MemoryStateBackend
+from utils.workers import cpu_share
+
+logger = logging.getLogger(__name__)
+
+STICKERS_DIR = "static/stickers"
+THUMBNAILS_DIR = "static/stickers/thumbnails"
+FONTS_DIR = "static/fonts"
+
+# Below this many thumbnails, starting worker processes costs more than it saves
+MIN_POOL_JOBS = 16
+# A sync holding the lock longer than this is presumed to have died with its worker
+SYNC_LOCK_LEASE_SECONDS = 30 * 60
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_stickers(stickers_dir=STICKERS_DIR):
+    """Walk the sticker library.
+
+    Returns:
+        Dict of web path -> (category, size, mtime) for every sticker file
+    """
+    found = {}
+    for root, dirs, files in os.walk(stickers_dir):
+        # Skip thumbnail files themselves
+        if root.endswith('thumbnails'):
+            continue
+        category = os.path.basename(root) if root != stickers_dir else None
+        cat = root.replace('\\', '/')
+        for filename in files:
+            if filename.endswith('_thumb.png'):
+                continue
+            stat = os.stat(os.path.join(root, filename))
+            found[f"/{cat}/{filename}"] = (category, stat.st_size, stat.st_mtime)
+    return found
+
+
+class AssetSync:
+    """Brings the sticker and font tables in line with the files on disk.
+
+    A manifest of (path, size, mtime, hash) persisted in the database lets a
+    warm start skip every unchanged file without reading it. Only new or
+    modified stickers, or those whose thumbnails are missing, get thumbnails,
+    and large batches are spread over a process pool. The sync runs on a
+    background thread so the server can take requests while it finishes.
+    With several workers, only the one holding the state backend's
+    "asset_sync" lock syncs; the others skip it.
+    """
+    def __init__(self, stickers_dir=STICKERS_DIR, fonts_dir=FONTS_DIR, state_backend=None):
+        self.stickers_dir = stickers_dir
+        self.fonts_dir = fonts_dir
+        self.state_backend = state_backend or MemoryStateBackend()
+        self.state = "idle"
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, db_manager):
+        """Run the sync on a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(db_manager,), name="asset-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Ask a running sync to stop after its current batch and wait for it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self, db_manager):
+        self.state = "running"
+        try:
+            with self.state_backend.try_lock("asset_sync", lease=SYNC_LOCK_LEASE_SECONDS) as acquired:
+                if not acquired:
+                    logger.info("Another worker is syncing assets, skipping")
+                    self.state = "skipped"
+                    return
+                self.sync_fonts(db_manager)
+                self.sync_stickers(db_manager)
+                self.state = "stopped" if self._stop.is_set() else "done"
+        except Exception as e:
+            self.state = "failed"
+            logger.error("Asset sync failed: %s", e)
+        finally:
+            # The connection belongs to this thread, which is about to exit
+            db_manager.close_thread_connection()
+
+    def sync_fonts(self, db_manager):
+        if not os.path.isdir(self.fonts_dir):
+            return
+        font_rows = [
+            (os.path.splitext(filename)[0], f"/{self.fonts_dir}/{filename}")
+            for filename in os.listdir(self.fonts_dir)
+        ]
+        added = db_manager.add_fonts(font_rows)
+        if added:
+            logger.info("Added %d new fonts to DB", added)
+
+    def sync_stickers(self, db_manager):
+        on_disk = scan_stickers(self.stickers_dir)
+        manifest = db_manager.get_asset_manifest()
+
+        # Uniqueness is enforced by the database, so every file on disk is
+        # offered and already-known paths are ignored
+        added = db_manager.add_stickers(
+            (path, category, None) for path, (category, size, mtime) in on_disk.items()
+        )
+        if added:
+            logger.info("Added %d new stickers to DB", added)
+
+        stickers = {s['sticker_path']: s for s in db_manager.get_all_stickers()}
+        manifest_entries = []
+        thumbnail_jobs = []
+        for path, (category, size, mtime) in on_disk.items():
+            known = manifest.get(path)
+            entry = None
+            if known and known[0] == size and known[1] == mtime:
+                content_hash = known[2]
+                changed = False
+            else:
+                content_hash = hash_file(path[1:])
+                entry = (path, size, mtime, content_hash)
+                # A new manifest entry for a sticker that already has a thumbnail
+                # (first run, or an upload) is not a content change
+                changed = known is not None and known[2] != content_hash
+
+            sticker = stickers.get(path)
+            if sticker and (changed or self._thumbnails_missing(sticker)):
+                # The entry is only written once the thumbnail is stored, so an
+                # interrupted sync still sees the change on its next run
+                thumbnail_jobs.append((sticker['id'], path[1:], content_hash, entry))
+            elif entry:
+                manifest_entries.append(entry)
+
+        removed = [path for path in manifest if path not in on_disk]
+        db_manager.update_asset_manifest(manifest_entries, removed)
+
+        if thumbnail_jobs:
+            self._generate_thumbnails(db_manager, thumbnail_jobs)
+
+    def _thumbnails_missing(self, sticker):
+        # Rows from before 2x thumbnails existed are regenerated as well
+        for key in ('thumbnail_path', 'thumbnail_2x_path'):
+            path = sticker.get(key)
+            if not path or not os.path.exists(path[1:]):
+                return True
+        return False
+
+    def _generate_thumbnails(self, db_manager, jobs):
+        os.makedirs(THUMBNAILS_DIR, exist_ok=True)
+        if len(jobs) < MIN_POOL_JOBS:
+            results = (generate_thumbnail(source, content_hash=content_hash) for _, source, content_hash, _ in jobs)
+            self._store_thumbnails(db_manager, jobs, results)
+            return
+
+        # Spawn rather than fork: the server process runs threads and an
+        # event loop that must not be duplicated into the workers.
+        # Other workers keep serving requests meanwhile, so only this one's share of the cores
+        context = multiprocessing.get_context("spawn")
+        workers = max(1, cpu_share() - 1)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = pool.map(
+                generate_thumbnail,
+                [source for _, source, _, _ in jobs],
+                [(100, 100)] * len(jobs),
+                [content_hash for _, _, content_hash, _ in jobs],
+                chunksize=max(1, len(jobs) // (workers * 4)),
+            )
+            self._store_thumbnails(db_manager, jobs, results)
+            if self._stop.is_set():
+                pool.shutdown(cancel_futures=True)
+
+    def _store_thumbnails(self, db_manager, jobs, results, batch_size=200):
+        """Write thumbnail paths back in batches so progress shows up as it happens.
+
+        Each sticker's manifest entry is written with its thumbnail, never
+        before it.
+        """
+        batch = []
+        entries = []
+        generated = 0
+        for (sticker_id, _, _, entry), thumbnails in zip(jobs, results):
+            if thumbnails:
+                batch.append((
+                    sticker_id, thumbnails['thumbnail_path'],
+                    thumbnails['thumbnail_2x_path'], thumbnails['preview_path']
+                ))
+                if entry:
+                    entries.append(entry)
+                generated += 1
+            if len(batch) >= batch_size:
+                db_manager.update_sticker_thumbnails(batch)
+                db_manager.update_asset_manifest(entries)
+                batch = []
+                entries = []
+            if self._stop.is_set():
+                break
+        db_manager.update_sticker_thumbnails(batch)
+        db_manager.update_asset_manifest(entries)
+        logger.info("Generated %d sticker thumbnails", generated)
+
+
+# Global instance
+asset_sync = AssetSync()
@@ -0,0 +1,72 @@
+import os
+import time
+import hashlib
+import tempfile
+from utils.common import to_thread
+
+BLOB_DIR = "static/uploads/blobs"
+DEFAULT_EXTENSION = ".bin"
+
+
+class BlobStore:
+    """Content-addressed storage for uploaded templates and photos.
+
+    Each blob is stored once at <blob_dir>/<hash[:2]>/<hash><ext>, where hash
+    is the SHA-256 of its contents, so identical uploads share one file and
+    the path doubles as a cache key. The blobs table counts references and
+    records when a blob was last used, for the cleanup sweeper.
+    """
+    def __init__(self, blob_dir=BLOB_DIR):
+        self.blob_dir = blob_dir
+
+    def path_for(self, blob_hash, extension):
+        return os.path.join(self.blob_dir, blob_hash[:2], f"{blob_hash}{extension}")
+
+    def write(self, data, extension=DEFAULT_EXTENSION):
+        """Store bytes unless an identical blob already exists.
+
+        Args:
+            data: File contents
+            extension: File extension including the dot, e.g. ".png"
+
+        Returns:
+            (hash, path) tuple, path being relative to the working directory
+        """
+        extension = (extension or DEFAULT_EXTENSION).lower()
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(blob_hash, extension)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so a concurrent upload of the same bytes
+            # never sees a half-written file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return blob_hash, path
+
+    async def put(self, db_manager, data, extension=DEFAULT_EXTENSION):
+        """Store bytes and count a reference to them.
+
+        Returns:
+            (hash, path) tuple, as for write()
+        """
+        blob_hash, path = await to_thread(self.write, data, extension)
+        await db_manager.aio.add_blob_reference(
+            blob_hash, path.replace(os.sep, '/'), len(data), time.time()
+        )
+        return blob_hash, path
+
+    async def put_upload(self, db_manager, upload, default_extension=DEFAULT_EXTENSION):
+        """Store an UploadFile, keeping its extension."""
+        extension = os.path.splitext(upload.filename or "")[1] or default_extension
+        return await self.put(db_manager, await upload.read(), extension)
+
+
+# Global instance
+blob_store = BlobStore()
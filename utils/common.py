@@ -1,4 +1,9 @@
 import socket
+import asyncio
+from fastapi import Response
+
+# asyncio.to_thread calls started through to_thread and not finished yet
+_threads_in_flight = 0
 
 
 def get_ip_address():
@@ -13,8 +18,42 @@ def get_ip_address():
     return IP
 
 
+async def to_thread(func, *args, **kwargs):
+    """asyncio.to_thread, counted so /metrics can report the backlog."""
+    global _threads_in_flight
+    _threads_in_flight += 1
+    try:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    finally:
+        _threads_in_flight -= 1
+
+
+def threads_in_flight():
+    """Calls made through to_thread that have not returned yet."""
+    return _threads_in_flight
+
+
 def gcd(a, b):
     """Calculate the greatest common divisor of two numbers."""
     while b:
         a, b = b, a % b
     return a
+
+
+def etag_response(request, body, etag, media_type="application/json", headers=None):
+    """Return body with its ETag, or 304 if the client already has it.
+
+    Args:
+        request: Incoming request, checked for If-None-Match
+        body: Encoded response body
+        etag: Quoted entity tag for body
+        media_type: Content type of body
+        headers: Extra response headers
+
+    Returns:
+        Response
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache", **(headers or {})}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
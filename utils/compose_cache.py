@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from urllib.parse import unquote
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump when the compose pipeline changes its output, so results rendered
+# by older code are not handed out for new requests
+COMPOSE_CACHE_VERSION = 1
+# Set to "false" to always re-render
+COMPOSE_CACHE_SETTING = "compose_cache"
+
+
+def _canonical(value):
+    """Normalize a parsed JSON value so equal specs serialize identically.
+
+    The browser sends 1 and 1.0 interchangeably depending on how a value
+    was last edited; both are written as 1.
+    """
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def _file_stamp(web_path):
+    """Size and mtime of a file named by a web path, or None if it is missing."""
+    path = os.path.join(os.getcwd(), unquote(web_path).lstrip('/'))
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class ComposeCache:
+    """Maps composition specs to results already on disk.
+
+    A spec is everything that decides the pixels of a composed image: the
+    template, the photos (by blob hash), holes, transformations, filters,
+    background colors, stickers and texts. Its hash is the key into the
+    compose_results table. Templates and stickers named by path are keyed
+    on their size and mtime too, so replacing an asset invalidates results
+    that used it. Fonts are looked up by name and are not stamped.
+    """
+    def spec_hash(self, template_hash, template_path, photo_hashes, holes, transformations, filters,
+                  background_colors, stickers, texts):
+        """Hash a composition spec.
+
+        Args:
+            template_hash: Blob hash of an uploaded template, or None
+            template_path: Web path of a stock template, used when template_hash is None
+            photo_hashes: Blob hashes of the photos, in hole order
+            holes, transformations, filters, background_colors, stickers, texts:
+                The parsed form fields of the compose request
+
+        Returns:
+            SHA-256 hex digest
+        """
+        spec = {
+            "version": COMPOSE_CACHE_VERSION,
+            "template": template_hash or template_path,
+            "template_stamp": None if template_hash else _file_stamp(template_path),
+            "photos": list(photo_hashes),
+            "holes": holes,
+            "transformations": transformations,
+            "filters": filters,
+            "background_colors": background_colors,
+            "stickers": stickers,
+            "sticker_stamps": [_file_stamp(s['path']) if isinstance(s.get('path'), str) else None for s in stickers],
+            "texts": texts,
+        }
+        encoded = json.dumps(_canonical(spec), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    async def enabled(self, db_manager):
+        setting = await db_manager.aio.get_setting(COMPOSE_CACHE_SETTING, "true")
+        return str(setting).lower() not in ("0", "false", "no")
+
+    async def lookup(self, db_manager, spec_hash):
+        """Find a stored result for a spec whose file is still on disk.
+
+        The caller copies the result for its own session; the file itself is
+        left untouched, and the sessions that name it keep it from the sweeper.
+
+        Returns:
+            Result web path, or None
+        """
+        row = await db_manager.aio.get_compose_result(spec_hash)
+        hit = None
+        if row:
+            if os.path.isfile(os.path.join(os.getcwd(), row["result_path"].lstrip('/'))):
+                hit = row["result_path"]
+            else:
+                # Swept since it was recorded
+                await db_manager.aio.delete_compose_results([row["result_path"]])
+        if hit:
+            logger.info("Reusing %s for an identical composition", hit)
+            await db_manager.aio.record_compose_hit(spec_hash, time.time())
+        if metrics.enabled:
+            metrics.counter(
+                "photobooth_compose_cache_total", "Compose requests answered from, or missing, the result cache", ["result"]
+            ).inc(result="hit" if hit else "miss")
+        return hit
+
+    async def store(self, db_manager, spec_hash, result_path, qr_code_path):
+        """Remember the result of a freshly composed spec."""
+        await db_manager.aio.add_compose_result(spec_hash, result_path, qr_code_path, time.time())
+
+
+# Global instance
+compose_cache = ComposeCache()
@@ -1,9 +1,12 @@
 import os
+import logging
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from utils.image_processing import hex_to_rgba
 
+logger = logging.getLogger(__name__)
+
 
 def draw_texts_on_pil(base_image, texts_data, db_manager):
     """Draw text overlays on a PIL image.
@@ -23,12 +26,12 @@ def draw_texts_on_pil(base_image, texts_data, db_manager):
         font_name = text_info.get('font')
         font_info = db_manager.get_font_by_name(font_name)
         if not font_info:
-            print(f"Font '{font_name}' not found in database. Skipping text.")
+            logger.warning("Font '%s' not found in database. Skipping text.", font_name)
             continue
 
         font_path = os.path.join(os.getcwd(), font_info['font_path'].lstrip('/'))
         if not os.path.exists(font_path):
-            print(f"Font file not found at '{font_path}'. Skipping text.")
+            logger.warning("Font file not found at '%s'. Skipping text.", font_path)
             continue
 
         text = text_info.get('text', '')
@@ -45,7 +48,7 @@ def draw_texts_on_pil(base_image, texts_data, db_manager):
         try:
             font = ImageFont.truetype(font_path, font_size)
         except IOError:
-            print(f"Failed to load font '{font_path}'. Skipping text.")
+            logger.warning("Failed to load font '%s'. Skipping text.", font_path)
             continue
         # spacing = Target - Default = (1.3 * font_size) - ascent
         ascent, descent = font.getmetrics()
@@ -109,12 +112,12 @@ def draw_texts(image, texts_data, db_manager):
         font_name = text_info.get('font')
         font_info = db_manager.get_font_by_name(font_name)
         if not font_info:
-            print(f"Font '{font_name}' not found in database. Skipping text.")
+            logger.warning("Font '%s' not found in database. Skipping text.", font_name)
             continue
 
         font_path = os.path.join(os.getcwd(), font_info['font_path'].lstrip('/'))
         if not os.path.exists(font_path):
-            print(f"Font file not found at '{font_path}'. Skipping text.")
+            logger.warning("Font file not found at '%s'. Skipping text.", font_path)
             continue
 
         text = text_info.get('text', '')
@@ -131,7 +134,7 @@ def draw_texts(image, texts_data, db_manager):
         try:
             font = ImageFont.truetype(font_path, font_size)
         except IOError:
-            print(f"Failed to load font '{font_path}'. Skipping text.")
+            logger.warning("Failed to load font '%s'. Skipping text.", font_path)
             continue
             
         # Calculate dynamic line spacing to match CSS line-height: 1.3
@@ -2,15 +2,22 @@ import cv2
 import numpy as np
 
 
-def apply_filters(image, filters):
-    """Apply image filters to a photo.
-    
+def build_frame_filter(filters, channel_order='bgr', grain_frames=None):
+    """Precompute a filter dict into a reusable per-frame function.
+
+    Brightness, contrast and warmth are folded into 256-entry lookup tables
+    and saturation scales the HSV S channel through a table as well, so the
+    per-frame cost is a few cv2.LUT/cvtColor calls instead of float maths
+    over the whole image. Results match the float pipeline exactly.
+
     Args:
-        image: Input image (BGR numpy array)
         filters: Dictionary of filter values
-        
+        channel_order: 'bgr' for OpenCV images, 'rgb' for MoviePy frames
+        grain_frames: For video, draw grain from this many precomputed noise
+            fields in rotation instead of generating fresh noise per frame
+
     Returns:
-        Filtered image (BGR numpy array)
+        Function taking and returning a uint8 image in the given channel order
     """
     brightness = int(filters.get('brightness', 100))
     contrast = int(filters.get('contrast', 100))
@@ -20,62 +27,116 @@ def apply_filters(image, filters):
     blur = int(filters.get('blur', 0))
     grain = int(filters.get('grain', 0))
 
+    red, blue = (2, 0) if channel_order == 'bgr' else (0, 2)
+    to_hsv, from_hsv = (
+        (cv2.COLOR_BGR2HSV, cv2.COLOR_HSV2BGR) if channel_order == 'bgr'
+        else (cv2.COLOR_RGB2HSV, cv2.COLOR_HSV2RGB)
+    )
+    levels = np.arange(256, dtype=np.float32)
+
     # --- Brightness & Contrast ---
-    img_float = image.astype(np.float32)
-    brightness_factor = brightness / 100.0
-    img_float = img_float * brightness_factor
+    tone = levels * (brightness / 100.0)
     contrast_factor = contrast / 100.0
     if contrast_factor != 1.0:
-        mean = np.array([128, 128, 128], dtype=np.float32)
-        img_float = mean + contrast_factor * (img_float - mean)
-    img_float = np.clip(img_float, 0, 255)
-    image = img_float.astype(np.uint8)
+        tone = np.float32(128) + contrast_factor * (tone - np.float32(128))
+    tone_lut = np.clip(tone, 0, 255).astype(np.uint8)
 
     # --- Saturation ---
+    saturation_lut = None
     if saturate != 100:
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV).astype(np.float32)
-        h, s, v = cv2.split(hsv)
-        saturation_factor = saturate / 100.0
-        s = s * saturation_factor
-        s = np.clip(s, 0, 255)
-        final_hsv = cv2.merge([h, s, v])
-        image = cv2.cvtColor(final_hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
+        saturation_lut = np.clip(levels * (saturate / 100.0), 0, 255).astype(np.uint8)
 
     # --- Warmth ---
-    if warmth != 100:
-        # Map 0-200 slider to a range of -50 to 50 for adjustment
-        warmth_value = (warmth - 100) / 2.0 
-        # Split channels
-        b, g, r = cv2.split(image.astype(np.float32))
-        # Add warmth (increase red, decrease blue)
-        r += warmth_value
-        b -= warmth_value
-        # Clip values
-        r = np.clip(r, 0, 255)
-        b = np.clip(b, 0, 255)
-        image = cv2.merge([b, g, r]).astype(np.uint8)
+    # Map 0-200 slider to a range of -50 to 50 for adjustment
+    warmth_value = (warmth - 100) / 2.0
+    warmth_lut = np.stack([levels] * 3, axis=-1)
+    warmth_lut[:, red] += warmth_value
+    warmth_lut[:, blue] -= warmth_value
+    warmth_lut = np.clip(warmth_lut, 0, 255).astype(np.uint8)
+
+    if saturation_lut is None:
+        # Nothing in between, so tone and warmth collapse into a single table
+        first_lut = warmth_lut[tone_lut]
+        second_lut = None
+    else:
+        first_lut = np.stack([tone_lut] * 3, axis=-1)
+        second_lut = warmth_lut if warmth != 100 else None
+    first_lut = first_lut.reshape(1, 256, 3)
+    if second_lut is not None:
+        second_lut = second_lut.reshape(1, 256, 3)
 
     # --- Sharpness ---
+    kernel = None
     if sharpness > 0:
         amount = sharpness / 100.0
         # This kernel matches the SVG filter on the frontend
         kernel = np.array([[0, -amount, 0],
                            [-amount, 1 + 4 * amount, -amount],
                            [0, -amount, 0]])
-        # Work with a float image for convolution, then clip and convert back
-        float_image = image.astype(np.float32)
-        sharpened_float = cv2.filter2D(float_image, -1, kernel)
-        image = np.clip(sharpened_float, 0, 255).astype(np.uint8)
-
-    # --- Blur --
-    if blur > 0:
-        # The CSS blur() pixel value corresponds to sigma. We pass it directly.
-        # Setting kernel size to (0,0) makes OpenCV calculate it from sigma.
-        image = cv2.GaussianBlur(image, (0, 0), blur)
-
-    # --- Grain ---
-    if grain > 0:
-        noise = np.random.normal(0, grain, image.shape).astype(np.int16)
-        image = np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
-
-    return image
+
+    grain_pool = []
+    grain_index = [0]
+
+    def add_grain(image):
+        if not grain_frames:
+            noise = np.random.normal(0, grain, image.shape).astype(np.int16)
+        else:
+            if not grain_pool or grain_pool[0].shape != image.shape:
+                grain_pool[:] = [
+                    np.random.normal(0, grain, image.shape).astype(np.int16)
+                    for _ in range(grain_frames)
+                ]
+            noise = grain_pool[grain_index[0] % grain_frames]
+            grain_index[0] += 1
+        return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+    def apply(image):
+        image = cv2.LUT(image, first_lut)
+
+        if saturation_lut is not None:
+            hsv = cv2.cvtColor(image, to_hsv)
+            hsv[:, :, 1] = cv2.LUT(hsv[:, :, 1], saturation_lut)
+            image = cv2.cvtColor(hsv, from_hsv)
+            if second_lut is not None:
+                image = cv2.LUT(image, second_lut)
+
+        if kernel is not None:
+            # Work with a float image for convolution, then clip and convert back
+            sharpened_float = cv2.filter2D(image.astype(np.float32), -1, kernel)
+            image = np.clip(sharpened_float, 0, 255).astype(np.uint8)
+
+        # --- Blur --
+        if blur > 0:
+            # The CSS blur() pixel value corresponds to sigma. We pass it directly.
+            # Setting kernel size to (0,0) makes OpenCV calculate it from sigma.
+            image = cv2.GaussianBlur(image, (0, 0), blur)
+
+        # --- Grain ---
+        if grain > 0:
+            image = add_grain(image)
+
+        return image
+
+    return apply
+
+
+def is_identity_filter(filters):
+    """Check whether a filter dict leaves images unchanged."""
+    if not filters:
+        return True
+    defaults = {'brightness': 100, 'contrast': 100, 'saturate': 100, 'warmth': 100,
+                'sharpness': 0, 'blur': 0, 'grain': 0}
+    return all(int(filters.get(key, value)) == value for key, value in defaults.items())
+
+
+def apply_filters(image, filters):
+    """Apply image filters to a photo.
+
+    Args:
+        image: Input image (BGR numpy array)
+        filters: Dictionary of filter values
+
+    Returns:
+        Filtered image (BGR numpy array)
+    """
+    return build_frame_filter(filters, channel_order='bgr')(image)
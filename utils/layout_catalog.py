@@ -0,0 +1,72 @@
+import json
+import uuid
+import hashlib
+import threading
+from utils.template_generation import generate_layout_thumbnail
+from utils.state_backend import MemoryStateBackend
+
+LAYOUT_THUMBNAIL_DIR = "static/layouts"
+# Where the catalog's version stamp lives in the state backend
+VERSION_NAMESPACE = "catalog"
+VERSION_KEY = "layouts"
+
+
+class LayoutCatalog:
+    """In-memory cache of the /layouts response.
+
+    The catalog is built from one joined query and the layout thumbnails,
+    then kept as encoded JSON with an ETag until a template change
+    invalidates it. Invalidating writes a new version stamp to the state
+    backend, so with several workers every one of them rebuilds, not only
+    the one that saved the template.
+    """
+    def __init__(self, thumbnail_dir=LAYOUT_THUMBNAIL_DIR, state_backend=None):
+        self.thumbnail_dir = thumbnail_dir
+        self.state_backend = state_backend or MemoryStateBackend()
+        self._body = None
+        self._etag = None
+        self._version = None  # stamp the cached body was built at
+        self._lock = threading.Lock()
+
+    def _build(self, db_manager):
+        layouts = []
+        for template in db_manager.get_layout_catalog():
+            layouts.append({
+                "aspect_ratio": template['aspect_ratio'],
+                "cell_layout": template['cell_layout'],
+                "thumbnail_path": generate_layout_thumbnail(
+                    template['aspect_ratio'], template['cell_layout'], self.thumbnail_dir
+                ),
+                "template_path": template['template_path'],
+                "holes": template['holes'],
+                "hole_count": template['hole_count'],
+                "transformations": template.get('transformations') or [],
+                "is_default": template.get('is_default', False),
+            })
+        return layouts
+
+    def get(self, db_manager):
+        """Return the catalog as (JSON body bytes, ETag), building it if needed."""
+        version = self.state_backend.get(VERSION_NAMESPACE, VERSION_KEY)
+        with self._lock:
+            if self._body is None or version != self._version:
+                layouts = self._build(db_manager)
+                self._body = json.dumps(layouts).encode('utf-8')
+                self._etag = f'"{hashlib.sha1(self._body).hexdigest()}"'
+                self._version = version
+            return self._body, self._etag
+
+    def cache_bytes(self):
+        """Size of the cached catalog body, 0 when nothing is cached."""
+        return len(self._body or b"")
+
+    def invalidate(self):
+        """Drop the cached catalog in every worker so the next request rebuilds it."""
+        self.state_backend.set(VERSION_NAMESPACE, VERSION_KEY, uuid.uuid4().hex)
+        with self._lock:
+            self._body = None
+            self._etag = None
+
+
+# Global instance
+layout_catalog = LayoutCatalog()
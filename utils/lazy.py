@@ -0,0 +1,80 @@
+import time
+import importlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# name -> LazyModule, so every facade for a module shares one import
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class LazyModule:
+    """Stand-in for a heavy module that imports it on first attribute access.
+
+    `rembg = lazy_import("rembg")` binds a cheap proxy at import time;
+    `rembg.remove(...)` triggers the real import the first time it runs.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    def load(self):
+        """Import the module if needed and return it."""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    self.load_seconds = time.perf_counter() - start
+                    self._module = module
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """Return the shared lazy facade for a module."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = LazyModule(name)
+        return _registry[name]
+
+
+def preload(names=None):
+    """Import registered lazy modules on a background thread.
+
+    Args:
+        names: Module names to load, defaults to every registered facade
+
+    Returns:
+        The started thread
+    """
+    with _registry_lock:
+        modules = [m for name, m in _registry.items() if names is None or name in names]
+
+    def load_all():
+        for module in modules:
+            if module.loaded:
+                continue
+            try:
+                module.load()
+                logger.info("Preloaded %s in %.2fs", module._name, module.load_seconds)
+            except Exception as e:
+                logger.error("Error preloading %s: %s", module._name, e)
+
+    thread = threading.Thread(target=load_all, name="preload", daemon=True)
+    thread.start()
+    return thread
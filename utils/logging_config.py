@@ -0,0 +1,137 @@
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+
+DEFAULT_LEVEL = "INFO"
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+# Progress is logged at most this often per session, plus at start and finish
+PROGRESS_LOG_INTERVAL_SECONDS = 5.0
+REQUEST_ID_HEADER = b"x-request-id"
+
+# Set per request by RequestContextMiddleware and by routes that know the
+# session; asyncio.to_thread copies them into render threads
+request_id_var = contextvars.ContextVar("request_id", default=None)
+session_id_var = contextvars.ContextVar("session_id", default=None)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps every record with the current request and session IDs."""
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.session_id = session_id_var.get()
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """The plain format, with the IDs appended when there are any."""
+    def format(self, record):
+        message = super().format(record)
+        ids = [f"{name}={value}" for name, value in
+               (("request", getattr(record, "request_id", None)), ("session", getattr(record, "session_id", None)))
+               if value]
+        return f"{message} [{' '.join(ids)}]" if ids else message
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for shipping to a log collector."""
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "session_id"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(config=None):
+    """Set up the root logger from the "logging" section of config.json.
+
+    Args:
+        config: Dictionary with optional keys "level" (e.g. "DEBUG"),
+            "format" ("text" or "json") and "levels", a mapping of logger
+            name to level such as {"utils.retention": "DEBUG"}
+    """
+    config = config or {}
+    handler = logging.StreamHandler()
+    handler.addFilter(ContextFilter())
+    if config.get("format") == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(str(config.get("level", DEFAULT_LEVEL)).upper())
+    for name, level in (config.get("levels") or {}).items():
+        logging.getLogger(name).setLevel(str(level).upper())
+
+
+class ProgressLogLimiter:
+    """Decides when a progress update is worth a log line.
+
+    MoviePy reports progress on every frame and the booth polls it every
+    second; logging each of those would put a write on the hot path. An
+    update is let through when it is the first or last for a key, or when
+    `interval` seconds have passed since the last one that was.
+    """
+    def __init__(self, interval=PROGRESS_LOG_INTERVAL_SECONDS):
+        self.interval = interval
+        self._last = {}  # key -> monotonic time of the last logged update
+        self._lock = threading.Lock()
+
+    def should_log(self, key, percentage):
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if percentage >= 100:
+                self._last.pop(key, None)
+                return True
+            if last is not None and now - last < self.interval:
+                return False
+            self._last[key] = now
+            return True
+
+
+class RequestContextMiddleware:
+    """Gives every HTTP request an ID for its log lines.
+
+    An incoming X-Request-ID header is reused, so IDs can be followed
+    across a proxy; otherwise one is generated. It is echoed back on the
+    response.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(REQUEST_ID_HEADER, b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        request_token = request_id_var.set(request_id)
+        session_token = session_id_var.set(None)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER, request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(request_token)
+            session_id_var.reset(session_token)
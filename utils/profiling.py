@@ -0,0 +1,255 @@
+import os
+import io
+import json
+import time
+import uuid
+import asyncio
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+import contextlib
+from utils.common import to_thread
+
+logger = logging.getLogger(__name__)
+
+DIAGNOSTICS_DIR = "diagnostics/profiles"
+# Send this header with any value but "0" to profile one request
+PROFILE_HEADER = b"x-profile"
+# Or set this to "true" to profile every request to the paths below
+PROFILE_SETTING = "profile_requests"
+PROFILED_PATHS = {"/compose_image", "/compose_video", "/remove_background", "/apply_filters_to_image"}
+# Frames kept per allocation traceback; more frames cost more memory while tracing
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 40
+# How often traced memory is polled for a new high; a snapshot is only taken
+# when it has grown by PEAK_SNAPSHOT_GROWTH over the last one
+PEAK_POLL_SECONDS = 0.01
+PEAK_SNAPSHOT_GROWTH = 1.1
+# Oldest captures are removed beyond this many
+MAX_CAPTURES = 50
+
+
+class _PeakSampler:
+    """Snapshots tracemalloc near the high-water mark of a capture.
+
+    tracemalloc reports the peak size but not what was allocated at that
+    moment, and by the end of a request its images have been freed. This
+    thread polls the traced size and snapshots whenever it reaches a new high.
+    """
+    def __init__(self):
+        self.snapshot = None
+        self.snapshot_size = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-peak", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(PEAK_POLL_SECONDS):
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self.snapshot_size * PEAK_SNAPSHOT_GROWTH:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_size = current
+
+
+class RequestProfiler:
+    """Captures cProfile and tracemalloc data for single requests.
+
+    Each capture writes three files to the diagnostics folder, sharing an ID:
+    <id>.pstats (open with pstats or snakeviz), <id>.txt (the slowest
+    functions and the largest allocations near peak memory) and <id>.json
+    (metadata used for listing).
+
+    cProfile only sees the thread it was enabled on, here the event loop
+    thread: it records the coroutines of every other request served during
+    the capture too, while work handed to asyncio.to_thread or the render
+    pool shows up as a wait. tracemalloc is process-wide, so its report
+    covers every thread. Each report says how many other requests overlapped
+    the capture. Only one capture runs at a time; requests that arrive
+    meanwhile are served without profiling. The report is written on a
+    worker thread, so the event loop is not held up by it.
+    """
+    def __init__(self, output_dir=DIAGNOSTICS_DIR, max_captures=MAX_CAPTURES):
+        self.output_dir = output_dir
+        self.max_captures = max_captures
+        self._lock = threading.Lock()
+
+    @contextlib.asynccontextmanager
+    async def capture(self, label):
+        """Profile the enclosed block.
+
+        Args:
+            label: Short description stored with the capture, e.g. "POST /compose_image"
+
+        Yields:
+            Capture metadata dict, or None if another capture is running. The
+            block may add keys (such as "status") before it exits.
+        """
+        if not self._lock.acquire(blocking=False):
+            yield None
+            return
+        try:
+            capture_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}"
+            info = {"id": capture_id, "label": label, "created_at": time.time()}
+
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            sampler = _PeakSampler()
+            sampler.start()
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                yield info
+            finally:
+                profile.disable()
+                info["wall_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                sampler.stop()
+                _, peak = tracemalloc.get_traced_memory()
+                if started_tracing:
+                    tracemalloc.stop()
+                info["peak_traced_mb"] = round(peak / (1024 * 1024), 2)
+                try:
+                    await to_thread(self._write, info, profile, before, sampler.snapshot)
+                except OSError as e:
+                    logger.error("Failed to write profile %s: %s", capture_id, e)
+        finally:
+            self._lock.release()
+
+    def _write(self, info, profile, before, at_peak):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, info["id"])
+        profile.dump_stats(f"{base}.pstats")
+
+        # Memory the request had allocated, by line, at the sampled high
+        growth = []
+        if at_peak is not None:
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            growth = at_peak.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+            growth = [stat for stat in growth if stat.size_diff > 0][:TOP_ALLOCATIONS]
+
+        report = io.StringIO()
+        report.write(f"{info['label']}  wall {info['wall_ms']} ms  peak traced memory {info['peak_traced_mb']} MB\n")
+        report.write("(timings include cProfile and tracemalloc overhead)\n")
+        report.write(f"{info.get('overlapping_requests', 0)} other requests overlapped this capture; "
+                     "cProfile covers the event loop thread, so their coroutines appear below too\n\n")
+        report.write(f"Top {len(growth)} allocation sites near peak memory\n")
+        for stat in growth:
+            frame = stat.traceback[0]
+            report.write(f"{stat.size_diff / 1024:10.1f} KiB {stat.count_diff:8d} blocks  {frame.filename}:{frame.lineno}\n")
+        report.write(f"\nTop {TOP_FUNCTIONS} functions by cumulative time\n")
+        pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+
+        info["files"] = [f"{info['id']}.pstats", f"{info['id']}.txt"]
+        with open(f"{base}.json", "w") as f:
+            json.dump(info, f)
+        self._prune()
+
+    def _prune(self):
+        captures = self.list_captures()
+        for stale in captures[self.max_captures:]:
+            for name in stale.get("files", []) + [f"{stale['id']}.json"]:
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(self.output_dir, name))
+
+    def list_captures(self):
+        """Metadata of every capture on disk, newest first."""
+        if not os.path.isdir(self.output_dir):
+            return []
+        captures = []
+        for filename in os.listdir(self.output_dir):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.output_dir, filename)) as f:
+                    captures.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        captures.sort(key=lambda info: info.get("created_at", 0), reverse=True)
+        return captures
+
+    def file_path(self, filename):
+        """Path of a capture file, or None if it doesn't exist or isn't one."""
+        if os.path.basename(filename) != filename or not filename.endswith((".pstats", ".txt")):
+            return None
+        path = os.path.join(self.output_dir, filename)
+        return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """Profiles requests to the compose endpoints when asked to.
+
+    A request is profiled when it carries the X-Profile header or the
+    'profile_requests' setting is "true". The response then carries an
+    X-Profile-Id header naming the capture.
+    """
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler or request_profiler
+        # Requests in flight, and started in total, to tell how much of a
+        # capture's event loop time belonged to other requests
+        self._in_flight = 0
+        self._started = 0
+
+    async def _requested(self, scope):
+        headers = dict(scope["headers"])
+        if PROFILE_HEADER in headers:
+            return headers[PROFILE_HEADER] != b"0"
+        db_manager = getattr(scope["app"].state, "db_manager", None)
+        if db_manager is None:
+            return False
+        setting = await db_manager.aio.get_setting(PROFILE_SETTING, "false")
+        return str(setting).lower() in ("1", "true", "yes")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self._in_flight += 1
+        self._started += 1
+        try:
+            await self._handle(scope, receive, send)
+        finally:
+            self._in_flight -= 1
+
+    async def _handle(self, scope, receive, send):
+        if scope["path"] not in PROFILED_PATHS or not await self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        async with self.profiler.capture(f"{scope['method']} {scope['path']}") as info:
+            if info is None:
+                await self.app(scope, receive, send)
+                return
+            already_running = self._in_flight - 1
+            started_before = self._started
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    info["status"] = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-id", info["id"].encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                info["overlapping_requests"] = already_running + self._started - started_before
+
+
+# Global instance
+request_profiler = RequestProfiler()
@@ -0,0 +1,426 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import contextlib
+import uuid
+from urllib.parse import unquote
+from utils.state_backend import MemoryStateBackend
+from utils.sticker_atlas import ATLAS_DIR, current_atlas_files
+
+logger = logging.getLogger(__name__)
+
+TEMP_DIR = "static/temp"
+SESSIONS_DIR = "static/results/sessions"
+BLOB_DIR = "static/uploads/blobs"
+
+DEFAULT_SWEEP_INTERVAL_MINUTES = 30
+# The first sweep waits until startup work (asset sync, templates) is done
+INITIAL_SWEEP_DELAY_SECONDS = 60
+# Nothing younger than this is removed, whatever the budget says: a result
+# is written a moment before the session that references it
+MIN_AGE_MINUTES = 10
+# Long enough for any sweep to finish; a crashed sweeper frees it after this
+SWEEP_LOCK_LEASE_SECONDS = 15 * 60
+
+# Directories under management. Every top-level entry of `path` (or every
+# file below it, when `recursive`) is one unit that expires after
+# `max_age_hours`; when the directory is over `max_bytes` the oldest units
+# go first. Units named in a session, or by a sticker row, are kept when
+# `keep_referenced` is set, and blobs are kept while their refcount is above
+# zero. None disables a limit.
+DEFAULT_RETENTION_POLICIES = {
+    "temp": {
+        "path": TEMP_DIR,
+        "max_age_hours": 6,
+        "max_bytes": None,
+        "keep_referenced": False,
+    },
+    "sessions": {
+        "path": SESSIONS_DIR,
+        "max_age_hours": 30 * 24,
+        "max_bytes": None,
+        "keep_referenced": False,
+    },
+    "results": {
+        "path": "static/results",
+        "max_age_hours": 30 * 24,
+        "max_bytes": 20 * 1024 ** 3,
+        "keep_referenced": True,
+    },
+    "videos": {
+        "path": "static/videos",
+        "max_age_hours": 7 * 24,
+        "max_bytes": 10 * 1024 ** 3,
+        "keep_referenced": True,
+    },
+    "uploads": {
+        "path": "static/uploads",
+        "max_age_hours": 7 * 24,
+        "max_bytes": None,
+        "keep_referenced": True,
+    },
+    "blobs": {
+        "path": BLOB_DIR,
+        "recursive": True,
+        "max_age_hours": 7 * 24,
+        "max_bytes": 5 * 1024 ** 3,
+        "keep_referenced": True,
+    },
+    "sticker_thumbnails": {
+        "path": "static/stickers/thumbnails",
+        "max_age_hours": 24,
+        "max_bytes": None,
+        "keep_referenced": True,
+    },
+    # Superseded sprite sheets, kept a while for kiosks holding the old map;
+    # the newest generation of each view counts as referenced
+    "sticker_atlases": {
+        "path": ATLAS_DIR,
+        "max_age_hours": 24,
+        "max_bytes": None,
+        "keep_referenced": True,
+    },
+}
+
+# Sessions go first so the results they held are released in the same sweep
+SWEEP_ORDER = ["temp", "sessions", "results", "videos", "uploads", "blobs", "sticker_thumbnails", "sticker_atlases"]
+
+
+def get_retention_policies(db_manager):
+    """Return the retention policies, merging any overrides stored in settings.
+
+    Args:
+        db_manager: DatabaseManager instance
+
+    Returns:
+        Dictionary of policy name -> policy
+    """
+    policies = {name: dict(values) for name, values in DEFAULT_RETENTION_POLICIES.items()}
+    stored = db_manager.get_setting('retention_policies')
+    if stored:
+        try:
+            for name, values in json.loads(stored).items():
+                if name in policies:
+                    # The directory layout is not configurable
+                    values.pop("path", None)
+                    values.pop("recursive", None)
+                    policies[name].update(values)
+        except (ValueError, AttributeError) as e:
+            logger.warning("Ignoring invalid retention_policies setting: %s", e)
+    return policies
+
+
+def _normalize(path):
+    """Turn a web path or filesystem path into a relative filesystem path."""
+    return os.path.normpath(unquote(path).lstrip("/"))
+
+
+def _iter_paths(value):
+    """Yield every static path mentioned anywhere in a session document, repeats included."""
+    if isinstance(value, str):
+        if value.startswith(("/static/", "static/")):
+            yield _normalize(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _iter_paths(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_paths(item)
+
+
+def _collect_paths(value, found):
+    """Add every static path mentioned anywhere in a session document."""
+    found.update(_iter_paths(value))
+
+
+def _entry_size(path):
+    if os.path.isdir(path):
+        total = 0
+        for root, dirs, files in os.walk(path):
+            for filename in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, filename))
+                except OSError:
+                    pass
+        return total
+    return os.path.getsize(path)
+
+
+def _entry_mtime(path):
+    mtime = os.path.getmtime(path)
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for filename in files:
+                try:
+                    mtime = max(mtime, os.path.getmtime(os.path.join(root, filename)))
+                except OSError:
+                    pass
+    return mtime
+
+
+class RetentionManager:
+    """Keeps generated and uploaded files within their age and size budgets.
+
+    A background thread sweeps every managed directory on an interval (the
+    'retention_sweep_interval_minutes' setting). Renders take a private
+    directory under static/temp from job_temp_dir(), which the sweeper
+    leaves alone until the job has removed it itself.
+    """
+    def __init__(self, temp_dir=TEMP_DIR, sessions_dir=SESSIONS_DIR, blob_dir=BLOB_DIR):
+        self.temp_dir = temp_dir
+        self.sessions_dir = sessions_dir
+        self.blob_dir = blob_dir
+        self.last_sweep = None
+        self._live_jobs = set()
+        self._jobs_lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        # Replaced at startup; with several workers only one sweeps at a time
+        self.state_backend = MemoryStateBackend()
+
+    @contextlib.contextmanager
+    def job_temp_dir(self, job_id=None):
+        """A temp directory owned by one job and removed when it finishes.
+
+        Args:
+            job_id: Prefix for the directory name, e.g. the session ID
+
+        Yields:
+            Path of the directory
+        """
+        name = f"{job_id}_{uuid.uuid4().hex[:8]}" if job_id else uuid.uuid4().hex
+        path = os.path.join(self.temp_dir, name)
+        os.makedirs(path, exist_ok=True)
+        with self._jobs_lock:
+            self._live_jobs.add(os.path.normpath(path))
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            with self._jobs_lock:
+                self._live_jobs.discard(os.path.normpath(path))
+
+    def start(self, db_manager):
+        """Sweep on a background thread until stop() is called."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(db_manager,), name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self, db_manager):
+        try:
+            self._stop.wait(INITIAL_SWEEP_DELAY_SECONDS)
+            while not self._stop.is_set():
+                try:
+                    with self.state_backend.try_lock("retention_sweep", lease=SWEEP_LOCK_LEASE_SECONDS) as acquired:
+                        if acquired:
+                            self.sweep(db_manager)
+                except Exception as e:
+                    logger.error("Retention sweep failed: %s", e)
+                try:
+                    interval = float(db_manager.get_setting(
+                        'retention_sweep_interval_minutes', DEFAULT_SWEEP_INTERVAL_MINUTES
+                    ))
+                except ValueError:
+                    interval = DEFAULT_SWEEP_INTERVAL_MINUTES
+                self._stop.wait(max(interval, 1) * 60)
+        finally:
+            db_manager.close_thread_connection()
+
+    def _units(self, policy, policies):
+        """List (path, size, mtime) for each removable unit of a policy."""
+        root = policy["path"]
+        if not os.path.isdir(root):
+            return []
+        # Directories that another policy manages are not units of this one
+        owned = {os.path.normpath(p["path"]) for p in policies.values() if p is not policy}
+        units = []
+        if policy.get("recursive"):
+            for dirpath, dirs, files in os.walk(root):
+                for filename in files:
+                    path = os.path.normpath(os.path.join(dirpath, filename))
+                    try:
+                        units.append((path, os.path.getsize(path), os.path.getmtime(path)))
+                    except OSError:
+                        pass
+            return units
+        for name in os.listdir(root):
+            path = os.path.normpath(os.path.join(root, name))
+            if path in owned:
+                continue
+            try:
+                units.append((path, _entry_size(path), _entry_mtime(path)))
+            except OSError:
+                pass
+        return units
+
+    def _references(self, db_manager):
+        """Every path named by a session or by a template, sticker or font row, and the current sticker atlases.
+
+        Saved custom templates live in static/uploads next to transient
+        uploads; only the templates table tells them apart.
+        """
+        referenced = set()
+        if os.path.isdir(self.sessions_dir):
+            for filename in os.listdir(self.sessions_dir):
+                if not filename.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.sessions_dir, filename), 'r') as f:
+                        _collect_paths(json.load(f), referenced)
+                except (OSError, ValueError):
+                    pass
+        for sticker in db_manager.get_all_stickers():
+            _collect_paths(sticker, referenced)
+        _collect_paths(db_manager.get_template_paths(), referenced)
+        for font in db_manager.get_all_fonts():
+            _collect_paths(font, referenced)
+        referenced.update(current_atlas_files())
+        return referenced
+
+    def _remove(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+    def _release_session(self, db_manager, path):
+        """Drop the blob references an expiring session holds."""
+        if not path.endswith(".json"):
+            return
+        # A photo used in two holes was stored, and counted, twice
+        try:
+            with open(path, 'r') as f:
+                paths = list(_iter_paths(json.load(f)))
+        except (OSError, ValueError):
+            return
+        blob_root = os.path.normpath(self.blob_dir) + os.sep
+        hashes = [os.path.splitext(os.path.basename(p))[0] for p in paths if p.startswith(blob_root)]
+        if hashes:
+            db_manager.release_blob_references(hashes)
+
+    def sweep(self, db_manager, dry_run=False):
+        """Apply every retention policy once.
+
+        Args:
+            db_manager: DatabaseManager instance
+            dry_run: Only report what would be removed
+
+        Returns:
+            Dictionary of policy name -> {"removed": count, "freed_bytes": bytes}
+        """
+        with self._sweep_lock:
+            policies = get_retention_policies(db_manager)
+            now = time.time()
+            min_age = MIN_AGE_MINUTES * 60
+            with self._jobs_lock:
+                live_jobs = set(self._live_jobs)
+            referenced = None
+            summary = {}
+
+            for name in SWEEP_ORDER:
+                policy = policies[name]
+                if policy.get("keep_referenced") and referenced is None:
+                    # Collected after the sessions policy has run
+                    referenced = self._references(db_manager)
+                if name == "blobs":
+                    # Read after the sessions policy released its references
+                    blob_usage = db_manager.get_blob_usage()
+
+                candidates = []
+                kept_bytes = 0
+                for path, size, mtime in self._units(policy, policies):
+                    refcount = 0
+                    if name == "blobs":
+                        # Reuse does not touch the file, only the table
+                        last_used, refcount = blob_usage.get(path.replace(os.sep, '/'), (0, 0))
+                        mtime = max(mtime, last_used)
+                    if (path in live_jobs or now - mtime < min_age or refcount > 0
+                            or (policy.get("keep_referenced") and path in referenced)):
+                        kept_bytes += size
+                    else:
+                        candidates.append((path, size, mtime))
+
+                # Expired first, then the oldest of the rest until within budget
+                max_age = policy.get("max_age_hours")
+                max_bytes = policy.get("max_bytes")
+                candidates.sort(key=lambda unit: unit[2])
+                total = kept_bytes + sum(unit[1] for unit in candidates)
+                removed = []
+                for path, size, mtime in candidates:
+                    expired = max_age is not None and now - mtime > max_age * 3600
+                    over_budget = max_bytes is not None and total > max_bytes
+                    if not (expired or over_budget):
+                        continue
+                    removed.append((path, size))
+                    total -= size
+
+                if not dry_run:
+                    for path, size in removed:
+                        try:
+                            if name == "sessions":
+                                self._release_session(db_manager, path)
+                            self._remove(path)
+                        except OSError as e:
+                            logger.warning("Failed to remove %s: %s", path, e)
+                    if name == "blobs" and removed:
+                        db_manager.delete_blobs([
+                            os.path.splitext(os.path.basename(path))[0] for path, _ in removed
+                        ])
+                    if name == "results" and removed:
+                        db_manager.delete_compose_results([
+                            "/" + path.replace(os.sep, '/') for path, _ in removed
+                        ])
+
+                summary[name] = {"removed": len(removed), "freed_bytes": sum(size for _, size in removed)}
+                if removed:
+                    verb = "Would remove" if dry_run else "Removed"
+                    logger.info("%s %d %s entries (%.1f MB)", verb, len(removed), name, summary[name]['freed_bytes'] / 1024 ** 2)
+
+            if not dry_run:
+                # Expired render progress and abandoned lock leases
+                self.state_backend.purge_expired()
+                self.last_sweep = now
+            return summary
+
+    def usage(self, db_manager):
+        """Report size and budget for each managed directory and the disk."""
+        policies = get_retention_policies(db_manager)
+        now = time.time()
+        directories = {}
+        for name in SWEEP_ORDER:
+            policy = policies[name]
+            units = self._units(policy, policies)
+            total = sum(unit[1] for unit in units)
+            max_bytes = policy.get("max_bytes")
+            directories[name] = {
+                "path": policy["path"],
+                "entries": len(units),
+                "bytes": total,
+                "max_bytes": max_bytes,
+                "max_age_hours": policy.get("max_age_hours"),
+                "over_budget": max_bytes is not None and total > max_bytes,
+                "oldest_age_hours": round((now - min(u[2] for u in units)) / 3600, 1) if units else None,
+            }
+        disk = shutil.disk_usage(".")
+        with self._jobs_lock:
+            live_jobs = len(self._live_jobs)
+        return {
+            "directories": directories,
+            "disk": {"total_bytes": disk.total, "used_bytes": disk.used, "free_bytes": disk.free},
+            "live_jobs": live_jobs,
+            "last_sweep": self.last_sweep,
+        }
+
+
+# Global instance
+retention_manager = RetentionManager()
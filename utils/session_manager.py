@@ -1,21 +1,34 @@
 import os
 import json
-import asyncio
+import uuid
+import contextlib
 import aiofiles
 from fastapi import HTTPException
+from utils.state_backend import MemoryStateBackend, LockTimeout
 
 SESSIONS_DIR = "static/results/sessions"
 
 class SessionManager:
-    def __init__(self, sessions_dir=SESSIONS_DIR):
+    def __init__(self, sessions_dir=SESSIONS_DIR, state_backend=None):
         self.sessions_dir = sessions_dir
-        # Simple in-memory lock dict to prevent race conditions on the same session ID
-        self._locks = {}
+        # Per-session locks prevent lost updates; with the SQLite backend
+        # they hold across worker processes too
+        self.state_backend = state_backend or MemoryStateBackend()
 
-    def _get_lock(self, session_id):
-        if session_id not in self._locks:
-            self._locks[session_id] = asyncio.Lock()
-        return self._locks[session_id]
+    @contextlib.asynccontextmanager
+    async def _lock(self, session_id):
+        try:
+            async with self.state_backend.lock(f"session:{session_id}"):
+                yield
+        except LockTimeout:
+            raise HTTPException(status_code=503, detail="Session is busy, try again")
+
+    async def _write(self, file_path, data):
+        # Write then rename, so readers in other workers never see half a file
+        tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp_path, 'w') as f:
+            await f.write(json.dumps(data, indent=4))
+        os.replace(tmp_path, file_path)
 
     def _get_file_path(self, session_id):
         return os.path.join(self.sessions_dir, f"{session_id}.json")
@@ -23,11 +36,9 @@ class SessionManager:
     async def save_session(self, session_id, data):
         """Creates or overwrites a session file."""
         file_path = self._get_file_path(session_id)
-        lock = self._get_lock(session_id)
-        
-        async with lock:
-            async with aiofiles.open(file_path, 'w') as f:
-                await f.write(json.dumps(data, indent=4))
+
+        async with self._lock(session_id):
+            await self._write(file_path, data)
 
     async def get_session(self, session_id):
         """Reads a session file."""
@@ -44,9 +55,8 @@ class SessionManager:
     async def update_session(self, session_id, updates):
         """Updates specific fields in a session file safely."""
         file_path = self._get_file_path(session_id)
-        lock = self._get_lock(session_id)
 
-        async with lock:
+        async with self._lock(session_id):
             if not os.path.exists(file_path):
                 raise HTTPException(status_code=404, detail="Session not found")
 
@@ -56,8 +66,7 @@ class SessionManager:
             # Apply updates
             data.update(updates)
             
-            async with aiofiles.open(file_path, 'w') as f:
-                await f.write(json.dumps(data, indent=4))
+            await self._write(file_path, data)
             
             return data
 
@@ -0,0 +1,108 @@
+import sys
+import time
+import threading
+import contextlib
+import logging
+import importlib.abc
+
+logger = logging.getLogger(__name__)
+
+
+class _TimingLoader(importlib.abc.Loader):
+    """Wraps a module's real loader to time its execution."""
+    def __init__(self, profiler, loader):
+        self._profiler = profiler
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        state = self._profiler._local
+        depth = getattr(state, "depth", 0)
+        state.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            state.depth = depth
+            self._profiler.imports.append((module.__name__, depth, time.perf_counter() - start))
+
+    def __getattr__(self, attr):
+        # Loaders carry extra API (get_resource_reader, is_package, ...)
+        return getattr(self._loader, attr)
+
+
+class StartupProfiler(importlib.abc.MetaPathFinder):
+    """Records how long each module import and lifespan phase takes.
+
+    Enabled with `python app.py --profile-startup`. When disabled, phase()
+    is a bare context manager and no import hook is installed.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.imports = []  # (module name, nesting depth, inclusive seconds)
+        self.phases = []  # (phase name, seconds)
+        self._local = threading.local()  # import nesting depth per thread
+        self._finding = set()
+
+    def install(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname in self._finding:
+            return None
+        self._finding.add(fullname)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimingLoader(self, spec.loader)
+                    return spec
+            return None
+        finally:
+            self._finding.discard(fullname)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a block of startup work."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self, top=15):
+        """Log the slowest top-level imports and every timed phase, then stop timing imports."""
+        if not self.enabled:
+            return
+        self.uninstall()
+        lines = ["--- Startup profile ---"]
+        # Depth 0 is what app.py itself imported; times include submodules
+        roots = sorted((i for i in self.imports if i[1] == 0), key=lambda i: i[2], reverse=True)
+        lines.append(f"Imports (inclusive, slowest {top}):")
+        for name, _, seconds in roots[:top]:
+            lines.append(f"  {seconds * 1000:9.1f} ms  {name}")
+        lines.append(f"  {sum(i[2] for i in roots) * 1000:9.1f} ms  total")
+        lines.append("Lifespan:")
+        for name, seconds in self.phases:
+            lines.append(f"  {seconds * 1000:9.1f} ms  {name}")
+        lines.append(f"  {sum(p[1] for p in self.phases) * 1000:9.1f} ms  total")
+        logger.info("\n".join(lines))
+
+
+# Global instance
+startup_profiler = StartupProfiler()
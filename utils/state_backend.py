@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+# A lock held longer than this is presumed abandoned by a crashed worker
+DEFAULT_LOCK_LEASE_SECONDS = 30
+DEFAULT_LOCK_TIMEOUT_SECONDS = 10
+# Polling interval bounds while waiting for a lock held by another process
+LOCK_POLL_MIN_SECONDS = 0.01
+LOCK_POLL_MAX_SECONDS = 0.25
+# Render progress outlives the render long enough for the last poll to see 100%
+PROGRESS_TTL_SECONDS = 6 * 60 * 60
+
+
+class LockTimeout(Exception):
+    """A named lock could not be taken in time."""
+
+
+class MemoryStateBackend:
+    """Shared state in this process only.
+
+    The default for a single worker. Values live in a dict and locks are
+    asyncio.Locks, so nothing touches the disk.
+    """
+    shared_across_processes = False
+
+    def __init__(self):
+        self._values = {}  # (namespace, key) -> (value, expires_at)
+        self._values_lock = threading.Lock()
+        self._locks = {}  # name -> asyncio.Lock
+        self._sync_locks = {}  # name -> threading.Lock
+
+    def get(self, namespace, key, default=None):
+        with self._values_lock:
+            entry = self._values.get((namespace, key))
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._values[(namespace, key)]
+                return default
+            return value
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._values_lock:
+            self._values[(namespace, key)] = (value, expires_at)
+
+    def delete(self, namespace, key):
+        with self._values_lock:
+            self._values.pop((namespace, key), None)
+
+    async def aget(self, namespace, key, default=None):
+        return self.get(namespace, key, default)
+
+    async def aset(self, namespace, key, value, ttl=None):
+        self.set(namespace, key, value, ttl)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._values_lock:
+            expired = [k for k, (_, expires_at) in self._values.items() if expires_at is not None and expires_at <= now]
+            for k in expired:
+                del self._values[k]
+        return len(expired)
+
+    @contextlib.asynccontextmanager
+    async def lock(self, name, timeout=DEFAULT_LOCK_TIMEOUT_SECONDS, lease=DEFAULT_LOCK_LEASE_SECONDS):
+        """Hold a named lock across requests.
+
+        Raises:
+            LockTimeout: If the lock is still held after `timeout` seconds
+        """
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        try:
+            await asyncio.wait_for(lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise LockTimeout(name)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    @contextlib.contextmanager
+    def try_lock(self, name, lease=DEFAULT_LOCK_LEASE_SECONDS):
+        """Take a named lock without waiting, from any thread.
+
+        Yields:
+            True if the lock was taken, False if someone else holds it
+        """
+        with self._values_lock:
+            lock = self._sync_locks.setdefault(name, threading.Lock())
+        acquired = lock.acquire(blocking=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                lock.release()
+
+
+class SQLiteStateBackend:
+    """Shared state in the app database, visible to every worker process.
+
+    Values are stored as JSON in the 'state' table. Locks are rows in the
+    'locks' table with a lease, so a worker that dies holding one only
+    blocks the others until the lease runs out. Waiters poll with
+    backoff; the locks guard short critical sections, so that is cheap.
+    """
+    shared_across_processes = True
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def get(self, namespace, key, default=None):
+        stored = self.db_manager.get_state(namespace, key, time.time())
+        return json.loads(stored) if stored is not None else default
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self.db_manager.set_state(namespace, key, json.dumps(value), expires_at)
+
+    def delete(self, namespace, key):
+        self.db_manager.delete_state(namespace, key)
+
+    async def aget(self, namespace, key, default=None):
+        stored = await self.db_manager.aio.get_state(namespace, key, time.time())
+        return json.loads(stored) if stored is not None else default
+
+    async def aset(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        await self.db_manager.aio.set_state(namespace, key, json.dumps(value), expires_at)
+
+    def purge_expired(self):
+        return self.db_manager.purge_expired_state(time.time())
+
+    @staticmethod
+    def _owner():
+        return f"{os.getpid()}-{uuid.uuid4().hex}"
+
+    @contextlib.asynccontextmanager
+    async def lock(self, name, timeout=DEFAULT_LOCK_TIMEOUT_SECONDS, lease=DEFAULT_LOCK_LEASE_SECONDS):
+        """Hold a named lock across requests and worker processes.
+
+        Raises:
+            LockTimeout: If the lock is still held after `timeout` seconds
+        """
+        owner = self._owner()
+        deadline = time.monotonic() + timeout
+        delay = LOCK_POLL_MIN_SECONDS
+        while True:
+            now = time.time()
+            if await self.db_manager.aio.try_acquire_lock(name, owner, now + lease, now):
+                break
+            if time.monotonic() >= deadline:
+                raise LockTimeout(name)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LOCK_POLL_MAX_SECONDS)
+        try:
+            yield
+        finally:
+            await self.db_manager.aio.release_lock(name, owner)
+
+    @contextlib.contextmanager
+    def try_lock(self, name, lease=DEFAULT_LOCK_LEASE_SECONDS):
+        """Take a named lock without waiting, from any thread.
+
+        Yields:
+            True if the lock was taken, False if another worker holds it
+        """
+        owner = self._owner()
+        now = time.time()
+        acquired = self.db_manager.try_acquire_lock(name, owner, now + lease, now)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.db_manager.release_lock(name, owner)
+
+
+class ProgressMap:
+    """Dict-like view of render progress, stored in a state backend.
+
+    Render threads assign to it on every MoviePy callback; only changes
+    are written, so a render costs at most one write per percent.
+    """
+    def __init__(self, backend, namespace="video_progress", ttl=PROGRESS_TTL_SECONDS):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self._written = {}  # key -> last value written by this process
+        self._lock = threading.Lock()
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            if self._written.get(key) == value:
+                return
+            if value >= 100:
+                self._written.pop(key, None)
+            else:
+                self._written[key] = value
+        self.backend.set(self.namespace, key, value, self.ttl)
+
+    def __getitem__(self, key):
+        value = self.backend.get(self.namespace, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        return self.backend.get(self.namespace, key, default)
+
+    async def aget(self, key, default=None):
+        return await self.backend.aget(self.namespace, key, default)
+
+
+def create_state_backend(kind, db_manager):
+    """Build the backend named in config.json.
+
+    Args:
+        kind: "memory" for a single worker, "sqlite" to share state between workers
+        db_manager: DatabaseManager instance, used by the SQLite backend
+
+    Returns:
+        A state backend
+    """
+    if kind == "sqlite":
+        return SQLiteStateBackend(db_manager)
+    if kind != "memory":
+        logger.warning("Unknown state backend '%s', using memory", kind)
+    return MemoryStateBackend()
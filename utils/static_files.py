@@ -0,0 +1,126 @@
+import os
+import gzip
+import shutil
+from mimetypes import guess_type
+from starlette.datastructures import Headers, QueryParams
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+# Paths under /static whose files are never rewritten once created: uuid or
+# content-hash names, or generated once per layout
+IMMUTABLE_PREFIXES = (
+    "results/",
+    "uploads/",
+    "generated_templates/",
+    "stickers/thumbnails/",
+    "sticker_atlases/",
+)
+# Files under those prefixes that are rewritten in place: the originals zip
+# of a session is rebuilt each time more photos are added to it
+MUTABLE_PREFIXES = (
+    "results/originals_",
+)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+PRECOMPRESS_EXTENSIONS = (".js", ".css", ".html", ".svg", ".json")
+PRECOMPRESS_DIRS = ("js", "css", "components", "icons")
+PRECOMPRESS_MIN_SIZE = 1024
+
+
+def precompress_static(directory="static", subdirs=PRECOMPRESS_DIRS, min_size=PRECOMPRESS_MIN_SIZE):
+    """Write a .gz next to each text asset that lacks an up-to-date one.
+
+    Args:
+        directory: Static root
+        subdirs: Folders under the root to scan
+        min_size: Files smaller than this are not worth compressing
+
+    Returns:
+        Number of files (re)compressed
+    """
+    written = 0
+    for subdir in subdirs:
+        for root, dirs, files in os.walk(os.path.join(directory, subdir)):
+            for filename in files:
+                if not filename.endswith(PRECOMPRESS_EXTENSIONS):
+                    continue
+                path = os.path.join(root, filename)
+                stat = os.stat(path)
+                if stat.st_size < min_size:
+                    continue
+                gz_path = path + ".gz"
+                if os.path.exists(gz_path) and os.stat(gz_path).st_mtime >= stat.st_mtime:
+                    continue
+                tmp_path = gz_path + ".tmp"
+                # mtime=0 keeps the output identical for identical input
+                with open(path, 'rb') as src, gzip.GzipFile(tmp_path, 'wb', compresslevel=9, mtime=0) as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(tmp_path, gz_path)
+                written += 1
+    return written
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with cache headers and precompressed variants.
+
+    Files under IMMUTABLE_PREFIXES, and any request carrying a ?v= version
+    query, are cached for a year without revalidation. Everything else
+    must revalidate, which the ETag from FileResponse makes a cheap 304.
+    When the client accepts gzip and an up-to-date .gz sibling exists, that
+    is sent instead with Content-Encoding set.
+    """
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        relative_path = self.get_path(scope).replace(os.sep, "/")
+
+        if "v" in QueryParams(scope.get("query_string", b"")) or (
+            relative_path.startswith(IMMUTABLE_PREFIXES)
+            and not relative_path.startswith(MUTABLE_PREFIXES)
+            and not relative_path.endswith(".json")
+        ):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = REVALIDATE_CACHE_CONTROL
+
+        response = None
+        if "gzip" in request_headers.get("accept-encoding", "") and str(full_path).endswith(PRECOMPRESS_EXTENSIONS):
+            gz_path = f"{full_path}.gz"
+            try:
+                gz_stat = os.stat(gz_path)
+            except OSError:
+                gz_stat = None
+            if gz_stat is not None and gz_stat.st_mtime >= stat_result.st_mtime:
+                # Keep the original's type rather than application/gzip
+                media_type = guess_type(str(full_path))[0] or "text/plain"
+                response = FileResponse(gz_path, status_code=status_code, stat_result=gz_stat, media_type=media_type)
+                response.headers["content-encoding"] = "gzip"
+
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        response.headers["cache-control"] = cache_control
+        if str(full_path).endswith(PRECOMPRESS_EXTENSIONS):
+            response.headers["vary"] = "Accept-Encoding"
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class ApiGZipMiddleware:
+    """GZip for API responses only.
+
+    Static files are left alone: text assets already have precompressed
+    variants and the rest are images and video.
+    """
+    def __init__(self, app, minimum_size=1024, compresslevel=6, static_prefix="/static/"):
+        self.app = app
+        self.static_prefix = static_prefix
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.static_prefix):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,160 @@
+import os
+import json
+import math
+import glob
+import hashlib
+import logging
+import threading
+import contextlib
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ATLAS_DIR = "static/sticker_atlases"
+CELL_SIZE = 100  # Matches the default size of generate_thumbnail
+MAX_COLUMNS = 20
+ATLAS_FORMAT_VERSION = 1
+
+
+def _generations(atlas_dir, prefix=None):
+    """Group atlas files by view prefix and generation.
+
+    Returns:
+        Dict of prefix -> {generation base path: newest mtime of its files}
+    """
+    found = {}
+    for path in glob.glob(os.path.join(atlas_dir, f"{prefix}_*" if prefix else "*")):
+        base, _ = os.path.splitext(path)
+        view = os.path.basename(base).rsplit("_", 1)[0]
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        generations = found.setdefault(view, {})
+        generations[base] = max(generations.get(base, 0), mtime)
+    return found
+
+
+def current_atlas_files(atlas_dir=ATLAS_DIR):
+    """Paths of the newest sheet and map of every view, which the sweeper keeps."""
+    paths = set()
+    for generations in _generations(atlas_dir).values():
+        newest = max(generations, key=generations.get)
+        paths.update(os.path.normpath(newest + ext) for ext in (".json", ".webp"))
+    return paths
+
+
+class StickerAtlas:
+    """Per-view sprite sheets of sticker thumbnails.
+
+    Each sticker drawer view (the top level with uncategorized stickers and
+    one cover per category, or a single category) gets one WebP sheet and a
+    JSON map of sprite coordinates. Both are named after a signature of the
+    rows they contain, so they are only rebuilt when that view changes and
+    survive restarts on disk.
+    """
+    def __init__(self, atlas_dir=ATLAS_DIR, cell_size=CELL_SIZE):
+        self.atlas_dir = atlas_dir
+        self.cell_size = cell_size
+        self._cache = {}  # category -> (signature, body, etag)
+        self._lock = threading.Lock()
+
+    def get(self, db_manager, category=""):
+        """Return the atlas map for a drawer view as (JSON body bytes, ETag).
+
+        Args:
+            db_manager: Database manager
+            category: Category name, or "" for the top-level view
+        """
+        stickers = db_manager.get_stickers(category=category)
+        covers = db_manager.get_sticker_category_covers() if category == "" else []
+        signature = self._signature(category, stickers, covers)
+
+        with self._lock:
+            cached = self._cache.get(category)
+            if cached is None or cached[0] != signature:
+                body = self._load_or_build(category, stickers, covers, signature)
+                cached = (signature, body, f'"{signature}"')
+                self._cache[category] = cached
+            return cached[1], cached[2]
+
+    def cache_size(self):
+        """Number of drawer views held in memory."""
+        return len(self._cache)
+
+    def _signature(self, category, stickers, covers):
+        rows = [(s['id'], s['sticker_path'], s.get('thumbnail_path')) for s in stickers + covers]
+        payload = json.dumps([ATLAS_FORMAT_VERSION, self.cell_size, category, rows])
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _prefix(self, category):
+        if category == "":
+            return "root"
+        return f"category_{hashlib.sha1(category.encode('utf-8')).hexdigest()[:10]}"
+
+    def _load_or_build(self, category, stickers, covers, signature):
+        prefix = self._prefix(category)
+        base = os.path.join(self.atlas_dir, f"{prefix}_{signature[:16]}")
+        if os.path.exists(base + ".json") and os.path.exists(base + ".webp"):
+            # Mark it as the view's current generation again
+            self._touch(base)
+            with open(base + ".json", 'rb') as f:
+                return f.read()
+
+        os.makedirs(self.atlas_dir, exist_ok=True)
+        # Kiosks may still hold the map this view had before it changed, so
+        # its sheet stays until the retention sweeper ages it out; touching
+        # it starts that clock now rather than when it was built
+        generations = _generations(self.atlas_dir, prefix).get(prefix)
+        if generations:
+            self._touch(max(generations, key=generations.get))
+
+        tiles = [("category", c) for c in covers] + [("sticker", s) for s in stickers]
+        atlas = {"sheet": None, "width": 0, "height": 0, "categories": [], "stickers": []}
+        if tiles:
+            columns = min(len(tiles), MAX_COLUMNS)
+            rows = math.ceil(len(tiles) / columns)
+            sheet = Image.new('RGBA', (columns * self.cell_size, rows * self.cell_size), (0, 0, 0, 0))
+            for index, (kind, sticker) in enumerate(tiles):
+                x = (index % columns) * self.cell_size
+                y = (index // columns) * self.cell_size
+                sprite = self._paste_tile(sheet, sticker, x, y)
+                if kind == "category":
+                    atlas["categories"].append({"name": sticker['category'], "sprite": sprite})
+                else:
+                    atlas["stickers"].append({**sticker, "sprite": sprite})
+            sheet.save(base + ".webp", 'WEBP', quality=90, method=4)
+            atlas.update({
+                "sheet": "/" + (base + ".webp").replace('\\', '/'),
+                "width": sheet.width,
+                "height": sheet.height,
+            })
+
+        body = json.dumps(atlas).encode('utf-8')
+        with open(base + ".json", 'wb') as f:
+            f.write(body)
+        return body
+
+    def _touch(self, base):
+        for ext in (".json", ".webp"):
+            with contextlib.suppress(OSError):
+                os.utime(base + ext)
+
+    def _paste_tile(self, sheet, sticker, x, y):
+        """Draw one sticker into its cell and return its sprite rectangle."""
+        thumbnail = sticker.get('thumbnail_path')
+        # Fall back to the original while the asset sync is still catching up
+        source = thumbnail if thumbnail and os.path.exists(thumbnail[1:]) else sticker['sticker_path']
+        try:
+            with Image.open(source[1:]) as img:
+                img = img.convert('RGBA')
+                img.thumbnail((self.cell_size, self.cell_size), Image.Resampling.LANCZOS)
+                sheet.paste(img, (x, y))
+                return {"x": x, "y": y, "w": img.width, "h": img.height}
+        except Exception as e:
+            logger.warning("Error adding %s to sticker atlas: %s", source, e)
+            return None
+
+
+# Global instance
+sticker_atlas = StickerAtlas()
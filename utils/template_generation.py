@@ -1,9 +1,12 @@
 import os
+import logging
 import cv2
 import numpy as np
 import random
 import re
 
+logger = logging.getLogger(__name__)
+
 
 # --- Configuration ---
 TEMPLATE_CONFIGS = {
@@ -59,10 +62,10 @@ def generate_template_if_not_exists(db_manager, ar_str, layout_str, type_name, g
     template_path_for_db = template_path_for_db.replace("\\", "/") # Ensure forward slashes for DB
 
     if os.path.exists(file_path): 
-        print(f"Template file {filename} already exists. Skipping generation.")
+        logger.debug("Template file %s already exists. Skipping generation.", filename)
         return
 
-    print(f"Generating {type_name} template for {ar_str} {layout_str}...")
+    logger.info("Generating %s template for %s %s...", type_name, ar_str, layout_str)
 
     try:
         ar_w, ar_h = map(int, ar_str.split(':'))
@@ -70,7 +73,7 @@ def generate_template_if_not_exists(db_manager, ar_str, layout_str, type_name, g
         
         config = TEMPLATE_CONFIGS.get(type_name)
         if not config:
-            print(f"Unknown template type: {type_name}")
+            logger.warning("Unknown template type: %s", type_name)
             return
 
         template, holes = create_template_image(ar_w, ar_h, cols, rows, config)
@@ -88,12 +91,10 @@ def generate_template_if_not_exists(db_manager, ar_str, layout_str, type_name, g
         # Generate the layout thumbnail (only needs to be done once per layout, but harmless to repeat)
         generate_layout_thumbnail(ar_str, layout_str, "static/layouts")
 
-        print(f"Successfully generated and saved {type_name} template for {ar_str} {layout_str}.")
+        logger.info("Successfully generated and saved %s template for %s %s.", type_name, ar_str, layout_str)
 
     except Exception as e:
-        print(f"Error generating template for {ar_str} {layout_str}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error generating template for %s %s: %s", ar_str, layout_str, e)
 
 
 def create_template_image(ar_w, ar_h, cols, rows, config):
@@ -175,7 +176,7 @@ def generate_layout_thumbnail(aspect_ratio, cell_layout, output_dir):
     placeholder_dir = "static/placeholder"
     
     if not os.path.exists(placeholder_dir):
-        print(f"Warning: Placeholder directory '{placeholder_dir}' not found. Using solid colors only.")
+        logger.warning("Placeholder directory '%s' not found. Using solid colors only.", placeholder_dir)
         return _render_solid_color_thumbnail(canvas, rows, cols, cell_w, cell_h, gap, pastel_colors, thumbnail_path)
     
     files = [f for f in os.listdir(placeholder_dir) if f.endswith('.png')]
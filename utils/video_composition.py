@@ -0,0 +1,619 @@
+import os
+import math
+import uuid
+import logging
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+from PIL import Image
+from utils.image_processing import load_image_with_premultiplied_alpha
+from utils.drawing import draw_texts_on_pil
+from utils.filters import build_frame_filter, is_identity_filter
+from utils.video_processing import prepare_clip_for_profile, get_profile_ffmpeg_params, write_clip_with_profile
+from utils.lazy import lazy_import
+from utils.workers import cpu_share
+
+logger = logging.getLogger(__name__)
+
+# MoviePy pulls in imageio and its ffmpeg plugin on import; load it on first render
+mpe = lazy_import("moviepy.editor")
+moviepy_config = lazy_import("moviepy.config")
+ffmpeg_reader = lazy_import("moviepy.video.io.ffmpeg_reader")
+ffmpeg_writer = lazy_import("moviepy.video.io.ffmpeg_writer")
+
+TEMP_DIR = "static/temp"
+
+# Segments shorter than this aren't worth a worker process: each worker has
+# to decode its own copy of the sources and start its own encoder.
+MIN_SEGMENT_SECONDS = 2.0
+
+# Film grain on video cycles through this many noise fields, which keeps
+# the per-frame cost of the grain filter bounded
+VIDEO_GRAIN_FRAMES = 12
+
+_render_pool = None
+# Segments submitted to the pool that have not finished, for the queue-depth gauge
+_pending_segments = 0
+_pending_segments_lock = threading.Lock()
+
+
+def is_animated_webp(path):
+    """Check if a WebP file contains animation frames."""
+    try:
+        with Image.open(path) as img:
+            return getattr(img, 'is_animated', False)
+    except Exception as e:
+        logger.warning("Error checking if WebP is animated: %s", e)
+        return False
+
+
+def load_animated_webp(path, resize_to=None, rotate_deg=0, target_duration=None, temp_dir=TEMP_DIR):
+    """
+    Load an animated WebP file as a MoviePy VideoClip with alpha channel.
+
+    Args:
+        path: Path to the WebP file
+        resize_to: Tuple (width, height) for resizing
+        rotate_deg: Rotation in degrees
+        target_duration: Target duration in seconds (for looping)
+        temp_dir: Directory for the extracted frame PNGs
+
+    Returns:
+        MoviePy VideoClip with transparency
+    """
+    try:
+        frame_paths = []
+
+        # Open WebP and extract frames
+        with Image.open(path) as img:
+            # Get frame duration (in milliseconds)
+            # Some WebP files don't have duration in info, try to get from first frame
+            duration_ms = img.info.get('duration', None)
+
+            if duration_ms and duration_ms > 0:
+                fps = 1000 / duration_ms
+            else:
+                # Default to 10 FPS for WebP without duration metadata
+                fps = 10
+                logger.debug("WebP has no duration metadata, using default %d FPS", fps)
+
+            # Calculate how many times to repeat frames to cover target duration
+            single_loop_duration = img.n_frames / fps
+            if target_duration:
+                num_loops = int(np.ceil(target_duration / single_loop_duration))
+            else:
+                num_loops = 1
+
+            # Extract frames and duplicate them for looping
+            for loop_num in range(num_loops):
+                for frame_num in range(img.n_frames):
+                    img.seek(frame_num)
+                    frame = img.convert('RGBA')
+
+                    # Apply resize if needed
+                    if resize_to:
+                        frame = frame.resize(resize_to, Image.Resampling.LANCZOS)
+
+                    # Apply rotation if needed (do this per-frame to allow defringing after)
+                    if rotate_deg != 0:
+                        frame = frame.rotate(rotate_deg, resample=Image.Resampling.BICUBIC, expand=True)
+
+                    # Remove white edges (defringing) - AFTER rotation
+                    # This fixes white halos introduced by rotation interpolation
+                    np_frame = np.array(frame).astype(float)
+                    alpha = np_frame[..., 3:4] / 255.0
+
+                    # For semi-transparent pixels, remove white matting
+                    # Rotation with interpolation creates semi-transparent edge pixels with white
+                    semi_transparent = (alpha > 0) & (alpha < 1)
+                    if np.any(semi_transparent):
+                        # Unmultiply white: new_color = (color - white * (1 - alpha)) / alpha
+                        rgb = np_frame[..., :3]
+                        white_contribution = 255 * (1 - alpha)
+
+                        # Only apply to semi-transparent pixels
+                        mask = semi_transparent.squeeze()
+                        rgb[mask] = np.clip((rgb[mask] - white_contribution[mask]) / alpha[mask], 0, 255)
+
+                        np_frame[..., :3] = rgb
+
+                    # Convert back to uint8 and PIL
+                    np_frame = np_frame.astype(np.uint8)
+                    frame_defringed = Image.fromarray(np_frame, mode='RGBA')
+
+                    # Save frame as temporary PNG
+                    frame_path = os.path.join(temp_dir, f"{uuid.uuid4()}_l{loop_num}_f{frame_num}.png")
+                    frame_defringed.save(frame_path)
+                    frame_paths.append(frame_path)
+
+        # Create video clip from image sequence with transparency
+        # ismask=False ensures this is treated as a regular RGBA clip, not a mask
+        clip = mpe.ImageSequenceClip(frame_paths, fps=fps, ismask=False)
+
+        # Rotation already applied to individual frames, so skip clip rotation
+
+        # Set exact duration to avoid extending beyond target
+        if target_duration:
+            clip = clip.set_duration(target_duration)
+
+        return clip
+
+    except Exception as e:
+        logger.exception("Error loading animated WebP: %s", e)
+        return None
+
+
+def compile_hole_warp(video_w, video_h, new_w, new_h, rotation, mirror=False):
+    """Compile a hole's center crop, resize, rotation and mirroring into one warp.
+
+    The geometry is the same for every frame of a clip, so it is folded into a
+    single affine matrix up front and each frame costs one cv2.warpAffine call
+    into a reused buffer, instead of a chain of per-frame MoviePy transforms.
+
+    Args:
+        video_w, video_h: Source frame size
+        new_w, new_h: Size the cropped region is scaled to
+        rotation: Rotation in degrees, counterclockwise (canvas expands to fit)
+        mirror: Flip the result horizontally
+
+    Returns:
+        Tuple of (frame function, (out_w, out_h))
+    """
+    # Center Crop Logic to prevent stretching
+    target_aspect_ratio = new_w / new_h
+    video_aspect_ratio = video_w / video_h
+
+    if video_aspect_ratio > target_aspect_ratio:
+        # Video is wider than target: Crop width
+        crop_h = video_h
+        crop_w = crop_h * target_aspect_ratio
+        x1 = (video_w - crop_w) / 2
+        y1 = 0
+    else:
+        # Video is taller than target: Crop height
+        crop_w = video_w
+        crop_h = crop_w / target_aspect_ratio
+        x1 = 0
+        y1 = (video_h - crop_h) / 2
+
+    # Rotated canvas grows to the bounding box, sized the way PIL's
+    # rotate(expand=True) does it so placement matches the photo path
+    theta = math.radians(rotation)
+    cos, sin = math.cos(theta), math.sin(theta)
+    half_w = round((new_w * abs(cos) + new_h * abs(sin)) / 2, 9)
+    half_h = round((new_w * abs(sin) + new_h * abs(cos)) / 2, 9)
+    out_w = max(1, math.ceil(new_w / 2 + half_w) - math.floor(new_w / 2 - half_w))
+    out_h = max(1, math.ceil(new_h / 2 + half_h) - math.floor(new_h / 2 - half_h))
+
+    def translate(tx, ty):
+        return np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], dtype=np.float64)
+
+    crop = translate(-x1, -y1)
+    scale = np.diag([new_w / crop_w, new_h / crop_h, 1.0])
+    rotate = np.array([[cos, sin, 0], [-sin, cos, 0], [0, 0, 1]], dtype=np.float64)
+    recenter = translate(out_w / 2, out_h / 2) @ rotate @ translate(-new_w / 2, -new_h / 2)
+    flip = np.array([[-1, 0, out_w], [0, 1, 0], [0, 0, 1]], dtype=np.float64) if mirror else np.eye(3)
+
+    # Work on pixel centers so scaling doesn't shift the image by half a pixel
+    forward = translate(-0.5, -0.5) @ flip @ recenter @ scale @ crop @ translate(0.5, 0.5)
+    matrix = forward[:2]
+
+    buffer = None
+
+    def warp(frame):
+        nonlocal buffer
+        buffer = cv2.warpAffine(
+            frame, matrix, (out_w, out_h), dst=buffer,
+            flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT
+        )
+        return buffer
+
+    return warp, (out_w, out_h)
+
+
+def probe_video(path):
+    """Read a video's duration and frame size from its metadata without decoding."""
+    infos = ffmpeg_reader.ffmpeg_parse_infos(path)
+    return infos['duration'], tuple(infos['video_size'])
+
+
+def get_decode_resolution(video_size, new_w, new_h):
+    """Pick the size ffmpeg should scale a source clip to while decoding.
+
+    The hole only needs the center crop at (new_w, new_h), so the whole
+    frame is scaled by the same factor that crop would be. Clips that would
+    be upscaled are decoded at their native size.
+
+    Returns:
+        (height, width) for VideoFileClip's target_resolution, or None
+    """
+    video_w, video_h = video_size
+    # Cover scale: the crop keeps the target aspect, so one side fits exactly
+    factor = max(new_w / video_w, new_h / video_h)
+    if factor >= 1:
+        return None
+    return max(1, int(math.ceil(video_h * factor))), max(1, int(math.ceil(video_w * factor)))
+
+
+def build_composition_spec(template_path, video_paths, holes, transformations, decorations,
+                           is_inverted, db_path, filters=None):
+    """Describe a video composite as plain data.
+
+    The spec holds everything needed to rebuild the composite clip, so it
+    can be sent to worker processes that each render part of the timeline.
+
+    Args:
+        template_path: Absolute path of the template PNG
+        video_paths: Absolute paths of the validated source clips, one per hole
+        holes: List of hole dictionaries (x, y, w, h)
+        transformations: List of per-hole transforms (scale, rotation)
+        decorations: Stickers and texts, already tagged with 'type' and sorted
+        is_inverted: Whether the camera stream was mirrored
+        db_path: SQLite database path, used to resolve fonts for text layers
+        filters: Filter dictionary applied to every hole, as for photos
+
+    Returns:
+        Composition spec dictionary
+    """
+    probes = [probe_video(path) for path in video_paths]
+    min_duration = min(duration for duration, _ in probes)
+    return {
+        "template_path": template_path,
+        # Align all clips to their ends, as the recordings stop together
+        "clips": [
+            {"path": path, "start": duration - min_duration, "size": size}
+            for path, (duration, size) in zip(video_paths, probes)
+        ],
+        "holes": holes,
+        "transformations": transformations,
+        "decorations": decorations,
+        "is_inverted": is_inverted,
+        "duration": min_duration,
+        "db_path": db_path,
+        "filters": filters if not is_identity_filter(filters) else None,
+    }
+
+
+def build_composite_clip(spec, db_manager, temp_dir=TEMP_DIR):
+    """Build the MoviePy composite described by a composition spec.
+
+    Returns:
+        Tuple of (composite clip, list of source clips to close when done)
+    """
+    min_duration = spec["duration"]
+    hole_data = spec["holes"]
+    transform_data = spec["transformations"]
+
+    # Let ffmpeg scale each source down to what its hole needs, so fewer
+    # bytes are piped per frame and the warp below works near 1:1
+    clips = []
+    for src, hole, transform in zip(spec["clips"], hole_data, transform_data):
+        scale = transform.get("scale", 1)
+        target_resolution = get_decode_resolution(
+            src["size"], int(hole["w"] * scale), int(hole["h"] * scale)
+        )
+        clips.append(mpe.VideoFileClip(
+            src["path"], target_resolution=target_resolution, resize_algorithm="area"
+        ))
+    sources = list(clips)
+    clips = [clip.subclip(src["start"]) for clip, src in zip(clips, spec["clips"])]
+
+    # --- Template prep ---
+    template_np = load_image_with_premultiplied_alpha(spec["template_path"])
+    height, width, _ = template_np.shape
+    background_clip = mpe.ColorClip(size=(width, height), color=(0, 0, 0), duration=min_duration)
+    template_clip = mpe.ImageClip(template_np, transparent=True).set_duration(min_duration)
+
+    # --- Place videos ---
+    video_clips = []
+    for i, clip in enumerate(clips):
+        hole = hole_data[i]
+        transform = transform_data[i]
+        scale = transform.get("scale", 1)
+        rotation = -transform.get("rotation", 0)
+        new_w = int(hole["w"] * scale)
+        new_h = int(hole["h"] * scale)
+
+        # Crop, resize, rotate and mirror in a single per-frame warp.
+        # Compositing copies each frame, so the warp can reuse its buffer.
+        warp, (out_w, out_h) = compile_hole_warp(
+            clip.w, clip.h, new_w, new_h, rotation, mirror=spec["is_inverted"]
+        )
+        if spec.get("filters"):
+            # Filter before the warp, in the same order as the photo pipeline
+            frame_filter = build_frame_filter(
+                spec["filters"], channel_order='rgb', grain_frames=VIDEO_GRAIN_FRAMES
+            )
+            placed_clip = clip.fl_image(lambda frame, f=frame_filter, w=warp: w(f(frame)))
+        else:
+            placed_clip = clip.fl_image(warp)
+
+        pos_x = hole["x"] + (hole["w"] - out_w) // 2
+        pos_y = hole["y"] + (hole["h"] - out_h) // 2
+        video_clips.append(placed_clip.set_position((pos_x, pos_y)).set_duration(min_duration))
+
+    # --- Decorations (Stickers & Text unified) ---
+    deco_clips = []
+    for deco in spec["decorations"]:
+        if deco['type'] == 'sticker':
+            sticker = deco
+            sticker_path = sticker["full_path"]
+            resize_size = (sticker["width"], sticker["height"])
+            rotation = -float(sticker.get("rotation", 0))
+
+            # Check if the sticker is an animated WebP
+            if sticker_path.lower().endswith('.webp') and is_animated_webp(sticker_path):
+                # Load as animated video clip with looping built-in
+                sticker_clip = load_animated_webp(
+                    sticker_path,
+                    resize_to=resize_size,
+                    rotate_deg=rotation,
+                    target_duration=min_duration,
+                    temp_dir=temp_dir
+                )
+
+                if sticker_clip:
+                    # Get actual dimensions after rotation
+                    clip_w, clip_h = sticker_clip.size
+
+                    # Calculate centered position to account for rotation expansion
+                    pos_x = int(sticker["x"]) - (clip_w - int(sticker["width"])) // 2
+                    pos_y = int(sticker["y"]) - (clip_h - int(sticker["height"])) // 2
+
+                    # Set position
+                    sticker_clip = sticker_clip.set_position((pos_x, pos_y))
+
+                    deco_clips.append(sticker_clip)
+                    continue
+
+                # Fallback to static image if animated loading fails
+                logger.warning("Failed to load animated WebP, falling back to static: %s", sticker_path)
+
+            # Static image (original behavior)
+            sticker_np = load_image_with_premultiplied_alpha(
+                sticker_path,
+                resize_to=resize_size,
+                rotate_deg=rotation
+            )
+
+            # Calculate centered position to account for rotation expansion
+            s_h, s_w, _ = sticker_np.shape
+            pos_x = int(sticker["x"]) - (s_w - int(sticker["width"])) // 2
+            pos_y = int(sticker["y"]) - (s_h - int(sticker["height"])) // 2
+
+            sticker_clip = (
+                mpe.ImageClip(sticker_np, transparent=True)
+                .set_duration(min_duration)
+                .set_position((pos_x, pos_y))
+            )
+            deco_clips.append(sticker_clip)
+
+        elif deco['type'] == 'text':
+            # Create a full-size transparent image for this text layer
+            layer_pil = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+
+            # Pass list containing just this text
+            layer_pil = draw_texts_on_pil(layer_pil, [deco], db_manager)
+            layer_np = np.array(layer_pil)
+
+            text_clip = (
+                mpe.ImageClip(layer_np, transparent=True)
+                .set_duration(min_duration)
+                .set_position((0, 0)) # Position is embedded in the full-frame layer
+            )
+            deco_clips.append(text_clip)
+
+    # --- Combine all layers ---
+    final_clip = mpe.CompositeVideoClip(
+        [background_clip] + video_clips + [template_clip] + deco_clips,
+        size=(width, height),
+    )
+    return final_clip, sources
+
+
+def close_clips(clips):
+    """Close source clips, releasing their ffmpeg reader processes."""
+    for clip in clips:
+        try:
+            clip.close()
+        except Exception as e:
+            logger.warning("Failed to close clip: %s", e)
+
+
+def count_frames(duration, fps):
+    """Number of frames MoviePy writes for a clip of this duration."""
+    return len(np.arange(0, duration, 1.0 / fps))
+
+
+def choose_segment_count(duration, cpu_count=None, min_segment_seconds=MIN_SEGMENT_SECONDS):
+    """Pick how many time segments to render in parallel.
+
+    One core is left for the server itself, and short clips stay serial.
+    With several workers each one only counts its share of the cores.
+    """
+    cpu_count = cpu_count or cpu_share()
+    by_length = int(duration // min_segment_seconds)
+    return max(1, min(cpu_count - 1, by_length))
+
+
+def split_frames(total_frames, segments):
+    """Split [0, total_frames) into contiguous (start, end) frame ranges."""
+    bounds = np.linspace(0, total_frames, segments + 1).round().astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def get_render_pool():
+    """Return the shared worker pool for segment rendering."""
+    global _render_pool
+    if _render_pool is None:
+        # Spawn rather than fork: the server process runs threads and an
+        # event loop that must not be duplicated into the workers.
+        # Sized to this worker's share of the cores, as every worker has its own pool
+        context = multiprocessing.get_context("spawn")
+        _render_pool = ProcessPoolExecutor(max_workers=max(1, cpu_share() - 1), mp_context=context)
+    return _render_pool
+
+
+def shutdown_render_pool():
+    """Stop the segment workers, if any were started."""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=True, cancel_futures=True)
+        _render_pool = None
+
+
+def render_pool_queue_depth():
+    """Segments submitted to the worker pool that have not finished yet."""
+    return _pending_segments
+
+
+def _segment_finished(future):
+    global _pending_segments
+    with _pending_segments_lock:
+        _pending_segments -= 1
+
+
+def _submit_segment(pool, *args):
+    """Submit a render_segment call, counting it until it finishes."""
+    global _pending_segments
+    with _pending_segments_lock:
+        _pending_segments += 1
+    try:
+        future = pool.submit(render_segment, *args)
+    except BaseException:
+        _segment_finished(None)
+        raise
+    future.add_done_callback(_segment_finished)
+    return future
+
+
+def render_segment(spec, profile, start_frame, end_frame, output_path, temp_dir=TEMP_DIR):
+    """Render frames [start_frame, end_frame) of a composition to its own file.
+
+    Frames are taken at the same timestamps a single-pass render would use,
+    so consecutive segments join without dropped or repeated frames.
+    """
+    from db_manager import DatabaseManager
+
+    db_manager = DatabaseManager(spec["db_path"])
+    final_clip, sources = build_composite_clip(spec, db_manager, temp_dir=temp_dir)
+    try:
+        clip = prepare_clip_for_profile(final_clip, profile)
+        fps = profile.get("fps", 24)
+        ffmpeg_params = get_profile_ffmpeg_params(profile, faststart=False)
+        with ffmpeg_writer.FFMPEG_VideoWriter(
+            output_path, clip.size, fps,
+            codec="libx264",
+            preset=profile.get("preset", "medium"),
+            threads=profile.get("threads"),
+            ffmpeg_params=ffmpeg_params,
+        ) as writer:
+            for index in range(start_frame, end_frame):
+                frame = clip.get_frame(index * (1.0 / fps))
+                writer.write_frame(frame.astype("uint8"))
+    finally:
+        close_clips(sources)
+    return output_path
+
+
+def concat_segments(segment_paths, output_path, audio_path=None, faststart=True, temp_dir=TEMP_DIR):
+    """Join encoded segments with ffmpeg's concat demuxer, without re-encoding."""
+    list_path = os.path.join(temp_dir, f"{uuid.uuid4()}_segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [moviepy_config.get_setting("FFMPEG_BINARY"), "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a", "-shortest"]
+    cmd += ["-c", "copy"]
+    if faststart:
+        cmd += ["-movflags", "+faststart"]
+    cmd.append(output_path)
+
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg concat failed: {result.stderr.decode(errors='replace')}")
+    finally:
+        os.remove(list_path)
+
+
+def render_composite_audio(spec, output_path):
+    """Mix the source clips' audio tracks for the composite, if they have any.
+
+    Returns:
+        Path to the encoded audio file, or None when no source has audio
+    """
+    audio_clips = []
+    for src in spec["clips"]:
+        if ffmpeg_reader.ffmpeg_parse_infos(src["path"]).get("audio_found"):
+            audio_clips.append(mpe.AudioFileClip(src["path"]).subclip(src["start"]))
+    if not audio_clips:
+        return None
+    try:
+        audio = mpe.CompositeAudioClip(audio_clips).set_duration(spec["duration"])
+        audio.write_audiofile(output_path, codec="aac", logger=None)
+    finally:
+        close_clips(audio_clips)
+    return output_path
+
+
+def render_composition(spec, profile, output_path, db_manager, segments=1, logger=None,
+                       on_progress=None, temp_dir=TEMP_DIR):
+    """Render a composition spec to an MP4 file.
+
+    With segments > 1 the timeline is split into that many frame ranges,
+    each rendered in a worker process, then joined without re-encoding.
+
+    Args:
+        spec: Composition spec from build_composition_spec
+        profile: Encode profile dictionary
+        output_path: Destination MP4 path
+        db_manager: DatabaseManager instance for the in-process render
+        segments: Number of time segments to render in parallel
+        logger: proglog logger for the single-pass render
+        on_progress: Callback taking a 0-100 percentage, for segmented renders
+        temp_dir: Directory for intermediate files
+    """
+    fps = profile.get("fps", 24)
+    total_frames = count_frames(spec["duration"], fps)
+    ranges = split_frames(total_frames, segments) if segments > 1 else []
+
+    if len(ranges) <= 1:
+        final_clip, sources = build_composite_clip(spec, db_manager, temp_dir=temp_dir)
+        try:
+            write_clip_with_profile(final_clip, output_path, profile, logger=logger)
+        finally:
+            close_clips(sources)
+        return
+
+    job_id = uuid.uuid4()
+    segment_paths = [os.path.join(temp_dir, f"{job_id}_seg{k}.mp4") for k in range(len(ranges))]
+    audio_path = os.path.join(temp_dir, f"{job_id}_audio.m4a")
+    pool = get_render_pool()
+    try:
+        futures = [
+            _submit_segment(pool, spec, profile, start, end, path, temp_dir)
+            for (start, end), path in zip(ranges, segment_paths)
+        ]
+        audio_path = render_composite_audio(spec, audio_path)
+
+        done = 0
+        for future in as_completed(futures):
+            future.result()
+            done += 1
+            if on_progress:
+                # Keep the last step for the concat
+                on_progress(int(done / len(futures) * 99))
+
+        concat_segments(segment_paths, output_path, audio_path=audio_path,
+                        faststart=profile.get("faststart", False), temp_dir=temp_dir)
+    finally:
+        for path in segment_paths + [audio_path]:
+            if path and os.path.exists(path):
+                os.remove(path)
@@ -1,4 +1,136 @@
+import json
+import logging
 from proglog import ProgressBarLogger
+from utils.logging_config import ProgressLogLimiter
+
+logger = logging.getLogger(__name__)
+# Shared by every render, keyed by session
+_progress_limiter = ProgressLogLimiter()
+
+
+# --- Encode Profiles ---
+# Named encoder settings for the final composite. "share" is the quick,
+# phone-friendly rendition served behind the QR code; "archive" keeps the
+# full template resolution at a slower, higher quality preset.
+# Profiles can be overridden through the 'video_encode_profiles' setting.
+DEFAULT_ENCODE_PROFILES = {
+    "share": {
+        "max_pixels": 1280 * 720,
+        "preset": "veryfast",
+        "crf": 28,
+        "fps": 24,
+        "threads": None,
+        "pix_fmt": "yuv420p",
+        "faststart": True,
+    },
+    "archive": {
+        "max_pixels": None,
+        "preset": "slow",
+        "crf": 18,
+        "fps": 24,
+        "threads": None,
+        "pix_fmt": "yuv420p",
+        "faststart": True,
+    },
+}
+DEFAULT_ENCODE_PROFILE = "share"
+
+
+def parse_encode_profiles(stored):
+    """Merge a stored 'video_encode_profiles' value over the defaults.
+
+    Args:
+        stored: JSON string from the setting, or None
+
+    Returns:
+        Dictionary of profile name -> encoder settings
+    """
+    profiles = {name: dict(values) for name, values in DEFAULT_ENCODE_PROFILES.items()}
+    if stored:
+        try:
+            for name, values in json.loads(stored).items():
+                profiles.setdefault(name, {}).update(values)
+        except (ValueError, AttributeError) as e:
+            logger.warning("Ignoring invalid video_encode_profiles setting: %s", e)
+    return profiles
+
+
+def get_encode_profiles(db_manager):
+    """Return the encode profiles, merging any overrides stored in settings.
+
+    Reads the database synchronously; request handlers read the setting
+    through db_manager.aio and call parse_encode_profiles instead.
+
+    Args:
+        db_manager: DatabaseManager instance
+
+    Returns:
+        Dictionary of profile name -> encoder settings
+    """
+    return parse_encode_profiles(db_manager.get_setting('video_encode_profiles'))
+
+
+def select_encode_profile(profiles, name=None):
+    """Pick a profile by name, falling back to the default one."""
+    return profiles.get(name or DEFAULT_ENCODE_PROFILE, profiles[DEFAULT_ENCODE_PROFILE])
+
+
+def get_encode_profile(db_manager, name=None):
+    """Look up a single encode profile, falling back to the default one."""
+    return select_encode_profile(get_encode_profiles(db_manager), name)
+
+
+def get_output_size(width, height, profile):
+    """Calculate the output frame size for a profile.
+
+    The frame is scaled down to fit within the profile's pixel budget and
+    rounded to even dimensions, which yuv420p requires.
+    """
+    max_pixels = profile.get("max_pixels")
+    scale = 1.0
+    if max_pixels and width * height > max_pixels:
+        scale = (max_pixels / float(width * height)) ** 0.5
+    out_w = max(2, int(width * scale) // 2 * 2)
+    out_h = max(2, int(height * scale) // 2 * 2)
+    return out_w, out_h
+
+
+def prepare_clip_for_profile(clip, profile):
+    """Scale or trim a clip to the frame size the profile encodes at."""
+    out_w, out_h = get_output_size(clip.w, clip.h, profile)
+    if (out_w, out_h) != (clip.w, clip.h):
+        if out_w < clip.w - 1 or out_h < clip.h - 1:
+            clip = clip.resize(newsize=(out_w, out_h))
+        else:
+            # Only rounding to even dimensions, trim instead of resampling
+            clip = clip.crop(x1=0, y1=0, width=out_w, height=out_h)
+    return clip
+
+
+def get_profile_ffmpeg_params(profile, faststart=True):
+    """Build the extra ffmpeg output arguments for a profile."""
+    ffmpeg_params = []
+    if profile.get("crf") is not None:
+        ffmpeg_params += ["-crf", str(profile["crf"])]
+    if profile.get("pix_fmt"):
+        ffmpeg_params += ["-pix_fmt", profile["pix_fmt"]]
+    if faststart and profile.get("faststart"):
+        ffmpeg_params += ["-movflags", "+faststart"]
+    return ffmpeg_params
+
+
+def write_clip_with_profile(clip, output_path, profile, logger=None):
+    """Encode a MoviePy clip to H.264 using the given encode profile."""
+    clip = prepare_clip_for_profile(clip, profile)
+    clip.write_videofile(
+        output_path,
+        codec="libx264",
+        fps=profile.get("fps", 24),
+        preset=profile.get("preset", "medium"),
+        threads=profile.get("threads"),
+        ffmpeg_params=get_profile_ffmpeg_params(profile),
+        logger=logger,
+    )
 
 
 class CustomProgressLogger(ProgressBarLogger):
@@ -8,8 +140,15 @@ class CustomProgressLogger(ProgressBarLogger):
         self.session_id = session_id
         self.video_progress = video_progress_dict
         self.video_progress[session_id] = 0
-        print(f"[ProgressLogger] Initialized for session {session_id}")
+        logger.debug("Progress logger initialized for session %s", session_id)
         
+    def _update(self, percentage):
+        percentage = min(percentage, 100)
+        self.video_progress[self.session_id] = percentage
+        # Called for every frame; only a few of these are logged
+        if _progress_limiter.should_log(self.session_id, percentage):
+            logger.info("Render progress for session %s: %d%%", self.session_id, percentage)
+
     def callback(self, **changes):
         """Called by proglog when any progress is made"""
         # Update progress in the global dict
@@ -21,8 +160,7 @@ class CustomProgressLogger(ProgressBarLogger):
                     bar = self.bars[name]
                     if 'total' in bar and bar['total'] > 0:
                         percentage = int((new_value / bar['total']) * 100)
-                        self.video_progress[self.session_id] = min(percentage, 100)
-                        print(f"[ProgressLogger] Progress: {percentage}%")
+                        self._update(percentage)
         
         # Call parent to maintain normal progress bar functionality
         super().callback(**changes)
@@ -33,5 +171,4 @@ class CustomProgressLogger(ProgressBarLogger):
             total = self.bars[bar].get('total', 0)
             if total > 0:
                 percentage = int((value / total) * 100)
-                self.video_progress[self.session_id] = min(percentage, 100)
-                print(f"[ProgressLogger] bars_callback - Progress: {percentage}%")
+                self._update(percentage)
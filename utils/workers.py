@@ -0,0 +1,25 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Uvicorn worker processes serving the app on this machine. Set from the
+# config at import time in every worker, so each one sizes its process
+# pools to its own share of the cores rather than to all of them.
+_worker_count = 1
+
+
+def set_worker_count(count):
+    """Record how many worker processes share this machine's cores."""
+    global _worker_count
+    _worker_count = max(1, int(count))
+
+
+def worker_count():
+    """Worker processes sharing this machine's cores."""
+    return _worker_count
+
+
+def cpu_share():
+    """Cores available to this worker process, at least one."""
+    return max(1, (os.cpu_count() or 1) // _worker_count)